@@ -0,0 +1,119 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Precomputed attack tables, built once when the module is imported. For every square index (see bitboard.py) these
+give the squares a Knight, King or pawn on that square attacks, and the squares along each of the 8 ray directions
+in order moving away from the square. Move generation and check detection look squares up in these tables instead of
+applying offsets and checking the result is on the board every time.
+"""
+from util import is_valid_square
+
+# Direction of each ray as (row change, col change). The first 4 are straight and the last 4 are diagonal
+DIRECTIONS = [(-1, 0),  # up
+              (1, 0),  # down
+              (0, -1),  # left
+              (0, 1),  # right
+              (-1, -1),  # up-left
+              (-1, 1),  # up-right
+              (1, -1),  # down-left
+              (1, 1)]  # down-right
+STRAIGHT = range(0, 4)
+DIAGONAL = range(4, 8)
+
+# Directions where the square index increases when moving along the ray, the nearest piece on these rays is the lowest
+# set bit rather than the highest
+INCREASING = [row_change * 8 + col_change > 0 for row_change, col_change in DIRECTIONS]
+
+KNIGHT_TRANSFORMS = [(1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)]
+KING_TRANSFORMS = [(i, j) for i in range(-1, 2) for j in range(-1, 2) if i or j]
+PAWN_TRANSFORMS = {"W": [(-1, -1), (-1, 1)],  # White pawns attack up the board
+                   "B": [(1, -1), (1, 1)]}  # Black pawns attack down the board
+
+
+def build_jump_table(transforms: list):
+    """
+    Build the table for a piece that jumps straight to its target squares (Knight, King, pawn captures)
+    :param transforms: (row change, col change) to each target square
+    :return: List of 64 bitboards, the squares attacked from each square index
+    """
+    table = []
+    for index in range(64):
+        row, col = divmod(index, 8)
+        attacks = 0
+        for row_change, col_change in transforms:
+            target = (row + row_change, col + col_change)
+            if is_valid_square(target):
+                attacks |= 1 << (target[0] * 8 + target[1])
+        table.append(attacks)
+    return table
+
+
+def build_ray_table(row_change: int, col_change: int):
+    """
+    Build the table of squares along a ray, from the square next to the start until the edge of the board
+    :param row_change: Row change of one step along the ray
+    :param col_change: Col change of one step along the ray
+    :return: List of 64 tuples, the square indexes along the ray from each square index in order
+    """
+    table = []
+    for index in range(64):
+        row, col = divmod(index, 8)
+        ray = []
+        square = (row + row_change, col + col_change)
+        while is_valid_square(square):
+            ray.append(square[0] * 8 + square[1])
+            square = (square[0] + row_change, square[1] + col_change)
+        table.append(tuple(ray))
+    return table
+
+
+KNIGHT_ATTACKS = build_jump_table(KNIGHT_TRANSFORMS)
+KING_ATTACKS = build_jump_table(KING_TRANSFORMS)
+PAWN_ATTACKS = {player: build_jump_table(transforms) for player, transforms in PAWN_TRANSFORMS.items()}
+
+# RAYS[direction][index] is the ordered squares along the ray, RAY_MASKS[direction][index] is the same as a bitboard
+RAYS = [build_ray_table(row_change, col_change) for row_change, col_change in DIRECTIONS]
+RAY_MASKS = [[sum(1 << square for square in ray) for ray in table] for table in RAYS]
+
+
+def ray_attacks(index: int, occupied: int, directions: range):
+    """
+    Attacks of a sliding piece along the given ray directions. Each ray runs until it hits the first piece in the way,
+    which is included as it can be captured (or is defended)
+    :param index: Square index of the sliding piece
+    :param occupied: Bitboard of every square with a piece on it
+    :param directions: STRAIGHT and/or DIAGONAL
+    :return: Bitboard of every square attacked
+    """
+    attacks = 0
+    for direction in directions:
+        ray = RAY_MASKS[direction][index]
+        blockers = ray & occupied
+        if blockers:
+            # Cut the ray off after the nearest blocker by removing the ray that continues on from it
+            if INCREASING[direction]:
+                nearest = (blockers & -blockers).bit_length() - 1
+            else:
+                nearest = blockers.bit_length() - 1
+            ray ^= RAY_MASKS[direction][nearest]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(index: int, occupied: int):
+    """
+    :param index: Square index of the Rook
+    :param occupied: Bitboard of every square with a piece on it
+    :return: Bitboard of every square a Rook on the square attacks
+    """
+    return ray_attacks(index, occupied, STRAIGHT)
+
+
+def bishop_attacks(index: int, occupied: int):
+    """
+    :param index: Square index of the Bishop
+    :param occupied: Bitboard of every square with a piece on it
+    :return: Bitboard of every square a Bishop on the square attacks
+    """
+    return ray_attacks(index, occupied, DIAGONAL)
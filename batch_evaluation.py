@@ -0,0 +1,232 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Scores many positions at once with NumPy, for analysis jobs where looping over board states one at a time in Python
+is too slow. Positions (board state dicts, Positions or FEN strings) are turned into a stack of piece planes, an array
+of shape (positions, 12, 64) holding a 1 wherever a piece is, with one plane per piece in the order of PIECES (see
+bitboard.py). Everything after that is done for the whole batch with array operations:
+- Material and piece-square scores, blended between middlegame and endgame the same as evaluation.py
+- Mobility, the number of squares each knight, bishop, rook and queen can move to (ignoring pins and checks), weighted
+  by MOBILITY_WEIGHTS. Sliding pieces are followed along each ray until the first piece in the way, using the piece
+  planes packed into 64-bit bitboards so a whole batch is shifted at once.
+Scores are from white's point of view (positive is good for white) as a board state dict doesn't say whose turn it is.
+
+Requires NumPy (pip install numpy), which the rest of the program does not need.
+
+Usage:
+    python batch_evaluation.py positions.txt      Score a file with one FEN per line
+"""
+import argparse
+import time
+
+import numpy as np
+
+from attack_tables import KNIGHT_ATTACKS, DIRECTIONS, STRAIGHT, DIAGONAL
+from bitboard import PIECES, FULL_BOARD, Position
+from evaluation import MIDDLEGAME_SCORES, ENDGAME_SCORES, MIDDLEGAME_VALUES, ENDGAME_VALUES, PHASE_WEIGHTS, MAX_PHASE
+from fen import position_from_fen
+
+PLANES = {piece: plane for plane, piece in enumerate(PIECES)}
+MOBILITY_WEIGHTS = {"N": 4, "B": 5, "R": 2, "Q": 1}
+DEFAULT_CHUNK_SIZE = 4096
+
+# Score of every piece on every square, as a (12, 64) array in plane order
+MIDDLEGAME_MATRIX = np.array([MIDDLEGAME_SCORES[piece] for piece in PIECES], dtype=np.int32)
+ENDGAME_MATRIX = np.array([ENDGAME_SCORES[piece] for piece in PIECES], dtype=np.int32)
+
+# Value of each piece alone, negative for black, and its weight towards the phase of the game
+SIGNS = np.array([1 if piece[0] == "W" else -1 for piece in PIECES], dtype=np.int32)
+MIDDLEGAME_MATERIAL = SIGNS * np.array([MIDDLEGAME_VALUES[piece[1]] for piece in PIECES], dtype=np.int32)
+ENDGAME_MATERIAL = SIGNS * np.array([ENDGAME_VALUES[piece[1]] for piece in PIECES], dtype=np.int32)
+PHASE_VECTOR = np.array([PHASE_WEIGHTS[piece[1]] for piece in PIECES], dtype=np.int32)
+
+# KNIGHT_MATRIX[from index, to index] is 1 if a knight can jump between the squares
+KNIGHT_MATRIX = np.array([[KNIGHT_ATTACKS[index] >> target & 1 for target in range(64)] for index in range(64)],
+                         dtype=np.int32)
+
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+
+# (shift, mask of squares the shifted bits may land on) for each direction in attack_tables.DIRECTIONS. Moving a column
+# across mustn't wrap round onto the other side of the board.
+DIRECTION_SHIFTS = [(row_change * 8 + col_change,
+                     np.uint64(FULL_BOARD ^ (FILE_A if col_change == 1 else FILE_H if col_change == -1 else 0)))
+                    for row_change, col_change in DIRECTIONS]
+
+
+def board_planes(boards: list):
+    """
+    Stack positions into piece planes
+    :param boards: List of board state dicts, Positions or FEN strings (they can be mixed)
+    :return: int8 array of shape (len(boards), 12, 64), planes[i, plane, index] is 1 if the piece for that plane (see
+    PLANES) is on that square index in boards[i]
+    :raises ValueError: If a FEN string is not valid
+    """
+    batch_indexes = []
+    plane_indexes = []
+    square_indexes = []
+    for batch_index, board in enumerate(boards):
+        if isinstance(board, str):
+            board = position_from_fen(board)
+
+        if isinstance(board, Position):
+            pieces = [(index, piece) for index, piece in enumerate(board.mailbox) if piece is not None]
+        else:
+            pieces = [(row * 8 + col, piece) for (row, col), piece in board.items()]
+
+        for index, piece in pieces:
+            batch_indexes.append(batch_index)
+            plane_indexes.append(PLANES[piece])
+            square_indexes.append(index)
+
+    planes = np.zeros((len(boards), len(PIECES), 64), dtype=np.int8)
+    planes[batch_indexes, plane_indexes, square_indexes] = 1
+    return planes
+
+
+def blend(middlegame: np.ndarray, endgame: np.ndarray, phase: np.ndarray):
+    """
+    Blend middlegame and endgame scores by the phase of the game, as evaluation.blend does for one position
+    :param middlegame: Middlegame scores
+    :param endgame: Endgame scores
+    :param phase: Sum of PHASE_WEIGHTS of the pieces on each board
+    :return: Blended scores
+    """
+    phase = np.minimum(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def to_bitboards(planes: np.ndarray):
+    """
+    :param planes: (positions, ..., 64) array of 0s and 1s
+    :return: (positions, ...) uint64 array with bit i set where the plane has a 1 at square index i
+    """
+    packed = np.packbits(planes.astype(np.uint8), axis=-1, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u8")[..., 0]
+
+
+def shift(bitboards: np.ndarray, amount: int):
+    """
+    :param bitboards: uint64 array
+    :param amount: Number of squares to move every bit by, negative moves up the board
+    :return: The shifted bitboards, bits shifted off the board are dropped
+    """
+    if amount > 0:
+        return np.left_shift(bitboards, np.uint64(amount))
+    return np.right_shift(bitboards, np.uint64(-amount))
+
+
+def slide(pieces: np.ndarray, empty: np.ndarray, amount: int, mask: np.uint64):
+    """
+    Squares attacked by sliding pieces in one direction, for every position at once. The pieces are spread across the
+    empty squares in 3 doubling steps (1, 2 then 4 squares) rather than one square at a time.
+    :param pieces: uint64 bitboards of the sliding pieces
+    :param empty: uint64 bitboards of the empty squares
+    :param amount: Shift for one step in the direction
+    :param mask: Squares a step in the direction can land on
+    :return: uint64 bitboards of the squares attacked, up to and including the first piece in the way
+    """
+    empty = empty & mask
+    for step in (amount, amount * 2, amount * 4):
+        pieces = pieces | (empty & shift(pieces, step))
+        empty = empty & shift(empty, step)
+    return shift(pieces, amount) & mask
+
+
+def popcount(bitboards: np.ndarray):
+    """
+    :param bitboards: uint64 array
+    :return: int32 array of the number of set bits in each bitboard
+    """
+    return np.unpackbits(bitboards[..., np.newaxis].view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int32)
+
+
+def mobility(planes: np.ndarray):
+    """
+    A sliding piece's squares in one direction stop at the first piece in the way, so the squares of two pieces of
+    the same type never overlap in a direction (the nearer piece would block the other) and the squares for all of a
+    type can be worked out together and counted. Knights can share squares so are counted per square.
+    :param planes: Piece planes from board_planes
+    :return: Weighted mobility of white less that of black for each position
+    """
+    colour_planes = {"W": planes[:, :6].sum(axis=1, dtype=np.int32), "B": planes[:, 6:].sum(axis=1, dtype=np.int32)}
+    bitboards = to_bitboards(planes)
+    occupancy = {player: to_bitboards(colour_planes[player]) for player in colour_planes}
+    empty = ~(occupancy["W"] | occupancy["B"])
+
+    score = np.zeros(len(planes), dtype=np.int32)
+    for player, sign in (("W", 1), ("B", -1)):
+        not_own = ~occupancy[player]
+        knights = planes[:, PLANES[player + "N"]].astype(np.int32) @ KNIGHT_MATRIX
+        moves = {"N": (knights * (1 - colour_planes[player])).sum(axis=1)}
+
+        for piece_type, directions in (("B", DIAGONAL), ("R", STRAIGHT), ("Q", range(8))):
+            pieces = bitboards[:, PLANES[player + piece_type]]
+            moves[piece_type] = sum(popcount(slide(pieces, empty, *DIRECTION_SHIFTS[direction]) & not_own)
+                                    for direction in directions)
+
+        for piece_type, weight in MOBILITY_WEIGHTS.items():
+            score += sign * weight * moves[piece_type]
+
+    return score
+
+
+def score_components(planes: np.ndarray):
+    """
+    Score a batch of positions, split into the parts of the score
+    :param planes: Piece planes from board_planes
+    :return: Dict of "material", "piece_square", "mobility" and "score" -> int32 array with a value for each
+    position, from white's point of view. score is the sum of the other three.
+    """
+    flat = planes.reshape(len(planes), -1).astype(np.int32)
+    counts = planes.sum(axis=2, dtype=np.int32)
+    phase = counts @ PHASE_VECTOR
+
+    material = blend(counts @ MIDDLEGAME_MATERIAL, counts @ ENDGAME_MATERIAL, phase)
+    # Blending the totals keeps the score the same as evaluation.evaluate_board before mobility is added
+    total = blend(flat @ MIDDLEGAME_MATRIX.reshape(-1), flat @ ENDGAME_MATRIX.reshape(-1), phase)
+    mobility_scores = mobility(planes)
+
+    return {"material": material,
+            "piece_square": total - material,
+            "mobility": mobility_scores,
+            "score": total + mobility_scores}
+
+
+def evaluate_batch(boards: list, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Score a list of positions
+    :param boards: List of board state dicts, Positions or FEN strings (they can be mixed)
+    :param chunk_size: Number of positions to work on at once, to bound the memory used
+    :return: int32 array of scores from white's point of view, in the same order as boards
+    :raises ValueError: If a FEN string is not valid
+    """
+    scores = np.empty(len(boards), dtype=np.int32)
+    for start in range(0, len(boards), chunk_size):
+        chunk = boards[start:start + chunk_size]
+        scores[start:start + len(chunk)] = score_components(board_planes(chunk))["score"]
+    return scores
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Score a file of positions in FEN, one per line")
+    parser.add_argument("path", help="File of FEN strings")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of positions to score at once")
+    arguments = parser.parse_args(arguments)
+
+    with open(arguments.path) as file:
+        fens = [line.strip() for line in file if line.strip()]
+
+    start = time.perf_counter()
+    scores = evaluate_batch(fens, arguments.chunk_size)
+    seconds = time.perf_counter() - start
+
+    for fen, score in zip(fens, scores):
+        print(f"{score}\t{fen}")
+    print(f"Scored {len(fens)} positions in {seconds:.3f}s ({len(fens) / max(seconds, 1e-9):,.0f} positions/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Bitboard representation of a board state. Where a board state is a dict of squares to pieces, a Position stores a
+64-bit int for every piece (e.g. "WP", "BQ") where each set bit marks a square holding that piece, along with the
+occupancy of each colour. This lets move generation and check detection work on whole sets of squares at once using
+masks (see attack_tables.py) instead of looking up squares one at a time.
+
+Squares are indexed 0-63 going left to right then downwards, so the origin A8 (0, 0) is index 0 and H1 (7, 7) is
+index 63, i.e. index = row * 8 + col. Moving 'up' the board (towards row 0) is a shift right, moving 'down' the board
+is a shift left.
+
+Board state dicts remain the public format, use position_from_board and board_from_position to convert between them.
+"""
+from attack_tables import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks
+from evaluation import MIDDLEGAME_SCORES, ENDGAME_SCORES, PHASE_WEIGHTS
+from zobrist import PIECE_KEYS, SIDE_KEY
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+ROW_2 = 0xFF << 16  # Row black pawns land on after moving one square from their starting row
+ROW_5 = 0xFF << 40  # Row white pawns land on after moving one square from their starting row
+
+PIECES = ("WP", "WN", "WB", "WR", "WQ", "WK", "BP", "BN", "BB", "BR", "BQ", "BK")
+OPPONENT = {"W": "B", "B": "W"}
+
+
+class InvalidPositionError(ValueError):
+    """
+    Raised when a board state breaks a rule the rest of the program relies on always being true, such as each player
+    having a King. Tools working through many positions can catch this to skip or report a corrupted position.
+    """
+
+
+class Position:
+    """
+    A board state stored as bitboards. Each piece has a bitboard of the squares it is on, each colour has a bitboard of
+    every square it occupies and the mailbox is a 64 long list giving the piece on each square index (or None) so
+    a single square can still be looked up directly. kings holds the square index of each player's King (or None if
+    they have no King) and is kept up to date as pieces are added and removed so it never has to be searched for.
+    zobrist is the position's Zobrist hash (see zobrist.py), also kept up to date as pieces are added and removed and as
+    the turn passes between players. middlegame, endgame and phase are the running totals used to score the position
+    (see evaluation.py), kept up to date in the same way.
+
+    Moves are played in place with make_move and taken back with unmake_move. Each move pushes an undo record onto
+    history holding (from_index, to_index, piece moved, piece captured) so it can be reversed without copying the board.
+    """
+    __slots__ = ("bitboards", "occupancy", "mailbox", "player", "history", "kings", "zobrist", "middlegame", "endgame",
+                 "phase")
+
+    def __init__(self, player: str = "W"):
+        """
+        Creates an empty position
+        :param player: The player whose turn it is ("W" or "B")
+        """
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {"W": 0, "B": 0}
+        self.mailbox = [None] * 64
+        self.player = player
+        self.history = []
+        self.kings = {"W": None, "B": None}
+        self.zobrist = SIDE_KEY if player == "B" else 0
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+
+    def add_piece(self, index: int, piece: str):
+        """
+        Place a piece on an empty square
+        :param index: Square index to place the piece on
+        :param piece: The piece in board_state form (e.g. "BR")
+        """
+        bit = 1 << index
+        self.bitboards[piece] |= bit
+        self.occupancy[piece[0]] |= bit
+        self.mailbox[index] = piece
+        self.zobrist ^= PIECE_KEYS[piece][index]
+        self.middlegame += MIDDLEGAME_SCORES[piece][index]
+        self.endgame += ENDGAME_SCORES[piece][index]
+        self.phase += PHASE_WEIGHTS[piece[1]]
+        if piece[1] == "K":
+            self.kings[piece[0]] = index
+
+    def remove_piece(self, index: int):
+        """
+        Remove the piece on a square
+        :param index: Square index with a piece on it
+        :return: The piece that was removed
+        """
+        piece = self.mailbox[index]
+        bit = 1 << index
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+        self.mailbox[index] = None
+        self.zobrist ^= PIECE_KEYS[piece][index]
+        self.middlegame -= MIDDLEGAME_SCORES[piece][index]
+        self.endgame -= ENDGAME_SCORES[piece][index]
+        self.phase -= PHASE_WEIGHTS[piece[1]]
+        if piece[1] == "K":
+            self.kings[piece[0]] = None
+        return piece
+
+    def move_piece(self, from_index: int, to_index: int):
+        """
+        Move the piece on one square to another, capturing anything on the destination square. No special moves are
+        processed.
+        :param from_index: Square index of the piece to move
+        :param to_index: Square index to move the piece to
+        :return: The piece captured, or None if the destination was empty
+        """
+        captured = self.mailbox[to_index]
+        if captured is not None:
+            self.remove_piece(to_index)
+        self.add_piece(to_index, self.remove_piece(from_index))
+        return captured
+
+    def make_move(self, from_index: int, to_index: int, promotion: str = None):
+        """
+        Perform a move in place and pass the turn to the other player. The move is recorded on history so it can be
+        taken back with unmake_move.
+        :param from_index: Square index of the piece to move
+        :param to_index: Square index to move the piece to
+        :param promotion: Piece type a pawn is promoted to (e.g. "Q"), None if the move is not a promotion
+        """
+        captured = self.mailbox[to_index]
+        if captured is not None:
+            self.remove_piece(to_index)
+        piece = self.remove_piece(from_index)
+        self.add_piece(to_index, piece if promotion is None else piece[0] + promotion)
+
+        self.history.append((from_index, to_index, piece, captured))
+        self.player = OPPONENT[self.player]
+        self.zobrist ^= SIDE_KEY
+
+    def unmake_move(self):
+        """
+        Take back the last move performed with make_move, restoring any captured piece and undoing any promotion
+        """
+        from_index, to_index, piece, captured = self.history.pop()
+        self.remove_piece(to_index)
+        self.add_piece(from_index, piece)
+        if captured is not None:
+            self.add_piece(to_index, captured)
+
+        self.player = OPPONENT[self.player]
+        self.zobrist ^= SIDE_KEY
+
+    def pass_turn(self):
+        """
+        Make it the other player's turn without making a move, e.g. after a move made with move_piece
+        """
+        self.player = OPPONENT[self.player]
+        self.zobrist ^= SIDE_KEY
+
+    def occupied(self):
+        """
+        :return: Bitboard of every square with a piece on it
+        """
+        return self.occupancy["W"] | self.occupancy["B"]
+
+    def copy(self):
+        """
+        :return: An independent copy of the position
+        """
+        position = Position(self.player)
+        position.bitboards = self.bitboards.copy()
+        position.occupancy = self.occupancy.copy()
+        position.mailbox = self.mailbox.copy()
+        position.history = self.history.copy()
+        position.kings = self.kings.copy()
+        position.zobrist = self.zobrist
+        position.middlegame = self.middlegame
+        position.endgame = self.endgame
+        position.phase = self.phase
+        return position
+
+
+def square_to_index(square: (int, int)):
+    """
+    :param square: Board_state coordinates (e.g. (0, 1))
+    :return: The square index used by bitboards
+    """
+    return square[0] * 8 + square[1]
+
+
+def index_to_square(index: int):
+    """
+    :param index: Square index used by bitboards
+    :return: Board_state coordinates as a 2-int tuple
+    """
+    return divmod(index, 8)
+
+
+def iterate_indexes(bitboard: int):
+    """
+    Generator giving the square index of every set bit in a bitboard, lowest index first
+    :param bitboard: The bitboard to read
+    """
+    while bitboard:
+        lowest_bit = bitboard & -bitboard
+        yield lowest_bit.bit_length() - 1
+        bitboard ^= lowest_bit
+
+
+def squares_from_bitboard(bitboard: int):
+    """
+    :param bitboard: The bitboard to read
+    :return: List of board_state coordinates for every set bit in the bitboard
+    """
+    return [divmod(index, 8) for index in iterate_indexes(bitboard)]
+
+
+def position_from_board(board_state: dict, player: str = "W"):
+    """
+    Build a Position from a board state dict
+    :param board_state: The state of the board
+    :param player: The player whose turn it is ("W" or "B")
+    :return: A Position holding the same pieces as the board state
+    """
+    position = Position(player)
+    for square, piece in board_state.items():
+        position.add_piece(square[0] * 8 + square[1], piece)
+    return position
+
+
+def board_from_position(position: Position):
+    """
+    Convert a Position back into a board state dict
+    :param position: The position to convert
+    :return: Board state with the same pieces as the position
+    """
+    board_state = {}
+    for index, piece in enumerate(position.mailbox):
+        if piece is not None:
+            board_state[divmod(index, 8)] = piece
+    return board_state
+
+
+def to_position(board_state, player: str = "W"):
+    """
+    Helper function so functions can be given either a board state dict or a Position. Positions are returned as they
+    are, board state dicts are converted.
+    :param board_state: The state of the board as a dict or Position
+    :param player: The player whose turn it is, only used when converting a dict
+    :return: A Position for the board state
+    """
+    if isinstance(board_state, Position):
+        return board_state
+    return position_from_board(board_state, player)
+
+
+def attackers_to(position: Position, index: int, player: str, occupied: int = None):
+    """
+    Find every piece of a player which attacks a square
+    :param position: The position to check
+    :param index: The square index being attacked
+    :param player: The player whose pieces are attacking
+    :param occupied: Bitboard of squares which block sliding pieces, defaults to every square with a piece on it
+    :return: Bitboard of the player's pieces attacking the square
+    """
+    bitboards = position.bitboards
+    if occupied is None:
+        occupied = position.occupancy["W"] | position.occupancy["B"]
+    queens = bitboards[player + "Q"]
+
+    # A piece attacks the square if the same type of piece on the square would attack it back (pawns being the
+    # exception as they attack in opposite directions for each colour)
+    return ((KNIGHT_ATTACKS[index] & bitboards[player + "N"]) |
+            (KING_ATTACKS[index] & bitboards[player + "K"]) |
+            (PAWN_ATTACKS[OPPONENT[player]][index] & bitboards[player + "P"]) |
+            (rook_attacks(index, occupied) & (bitboards[player + "R"] | queens)) |
+            (bishop_attacks(index, occupied) & (bitboards[player + "B"] | queens)))
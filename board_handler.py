@@ -11,7 +11,10 @@ e.g. (0, 1): "BR" --> Black Rook at B8
 The square A8 is the origin (0, 0)
 
 Board states contain all pieces which are 'alive' from both white and black
+
+The move functions here also accept a bitboard Position (see bitboard.py) in place of a board state dict
 """
+from bitboard import Position, square_to_index, position_from_board
 from input_processor import get_piece_for_promotion
 
 
@@ -41,7 +44,16 @@ def initialise_board():
     return board_state
 
 
-def perform_move(board_state: dict, from_move: (int, int), to_move: (int, int), simulated=False):
+def initialise_position():
+    """
+    Creates the starting board as a bitboard Position (see bitboard.py) with white to move. The Position carries the
+    Zobrist hash of the starting board, which is then kept up to date by every move made on it.
+    :return: Position with starting piece positions
+    """
+    return position_from_board(initialise_board(), "W")
+
+
+def perform_move(board_state, from_move: (int, int), to_move: (int, int), simulated=False, promotion=None):
     """
     Given a board state, this will move whatever piece is on the square 'from_move' to the square 'to_move'.
     If there is an existing piece on the square 'to_move', the piece is 'captured'. It is assumed both squares are
@@ -50,19 +62,56 @@ def perform_move(board_state: dict, from_move: (int, int), to_move: (int, int),
     :param from_move: The square where the selected piece is originally located
     :param to_move: The square where the selected piece is moved to
     :param simulated: Do not bother processing special movies (castling, promotion, enpasse) when simulating
+    :param promotion: Piece type to promote a pawn to (e.g. "Q"), the player is asked if it is needed and not given
     :return: New board_state with the move performed
     """
-    piece = board_state[from_move]
-    board_state.pop(from_move)
-    board_state[to_move] = piece
+    if isinstance(board_state, Position):
+        board_state.move_piece(square_to_index(from_move), square_to_index(to_move))
+    else:
+        piece = board_state[from_move]
+        board_state.pop(from_move)
+        board_state[to_move] = piece
 
     if not simulated:
-        perform_special_moves(board_state, to_move)
+        perform_special_moves(board_state, to_move, promotion)
+
+    return board_state
+
+
+def make_move(board_state: dict, from_move: (int, int), to_move: (int, int), undo_stack: list, promotion=None):
+    """
+    Perform a move in place on a board state and push what is needed to take it back onto an undo stack.
+    If the move is a promotion and no promotion piece is given, the player is asked for one.
+    :param board_state: The state of the board
+    :param from_move: The square where the selected piece is originally located
+    :param to_move: The square where the selected piece is moved to
+    :param undo_stack: List of undo records for moves made on this board state, newest last
+    :param promotion: Piece type to promote a pawn to (e.g. "Q")
+    :return: The board_state with the move performed
+    """
+    undo_stack.append((from_move, to_move, board_state[from_move], board_state.get(to_move)))
+
+    return perform_move(board_state, from_move, to_move, promotion=promotion)
+
+
+def unmake_move(board_state: dict, undo_stack: list):
+    """
+    Take back the most recent move on the undo stack, restoring any captured piece and undoing any promotion
+    :param board_state: The state of the board
+    :param undo_stack: List of undo records for moves made on this board state, newest last
+    :return: The board_state with the move taken back
+    """
+    from_move, to_move, piece, captured = undo_stack.pop()
+    board_state[from_move] = piece
+    if captured is None:
+        board_state.pop(to_move)
+    else:
+        board_state[to_move] = captured
 
     return board_state
 
 
-def simulate_move(board_state: dict, square: (int, int), move: (int,int)):
+def simulate_move(board_state, square: (int, int), move: (int,int)):
     """
     Create a copy of board state and perform a move on it
     :param board_state: The state of the board
@@ -76,23 +125,33 @@ def simulate_move(board_state: dict, square: (int, int), move: (int,int)):
     return simulated_board_state
 
 
-def perform_promotion(board_state: dict, pawn_square: (int, int)):
+def perform_promotion(board_state, pawn_square: (int, int), promotion=None):
     """
     Perform a promotion on a pawn to a piece of the player's choosing
     :param board_state: The state of the board
     :param pawn_square: The square where the pawn to be promoted is
+    :param promotion: Piece type to promote to (e.g. "Q"), if not given the player is asked
     """
-    player = board_state[pawn_square][0]
-    promotion = get_piece_for_promotion(player)
-    board_state[pawn_square] = player + promotion
+    if isinstance(board_state, Position):
+        index = square_to_index(pawn_square)
+        player = board_state.remove_piece(index)[0]
+        board_state.add_piece(index, player + (promotion or get_piece_for_promotion(player)))
+    else:
+        player = board_state[pawn_square][0]
+        if promotion is None:
+            promotion = get_piece_for_promotion(player)
+        board_state[pawn_square] = player + promotion
 
     return board_state
 
-def perform_special_moves(board_state: dict, to_square: (int, int)):
-    piece = board_state[to_square][1]
+def perform_special_moves(board_state, to_square: (int, int), promotion=None):
+    if isinstance(board_state, Position):
+        piece = board_state.mailbox[square_to_index(to_square)][1]
+    else:
+        piece = board_state[to_square][1]
     row = to_square[0]
     if piece == "P" and (row == 0 or row == 7):
-        perform_promotion(board_state, to_square)
+        perform_promotion(board_state, to_square, promotion)
 
     return board_state
 
@@ -4,12 +4,20 @@ Created: 09/06/24
 
 Handles the checking of the King to determine if they are in check
 """
-from board_handler import simulate_move
-from piece_moves import generate_rook_moves, generate_bishop_moves, generate_knight_moves, determine_valid_moves
-from util import get_distance, is_opponent_piece, has_piece, player_from_square
+from attack_tables import STRAIGHT, DIAGONAL, RAYS, KNIGHT_ATTACKS, PAWN_ATTACKS
+from bitboard import (Position, InvalidPositionError, FULL_BOARD, OPPONENT, to_position, square_to_index,
+                      index_to_square, iterate_indexes, attackers_to)
+from move_cache import MOVE_CACHE
+from piece_moves import move_targets, legal_targets
+from zobrist import SIDE_KEY
 
+# Statuses of a player's position given by cached_legal_moves
+CHECK = "Check"
+CHECKMATE = "Checkmate"
+STALEMATE = "Stalemate"
 
-def is_check(player: str, board_state: dict):
+
+def is_check(player: str, board_state):
     """
     Determine whether the current player is in check (i.e. The current player's King is in danger of being captured)
     This will be accomplished by determining the square where the King is, and then generating different types of
@@ -31,30 +39,38 @@ def is_check(player: str, board_state: dict):
     :return:
     """
 
-    king_square = find_king(player, board_state)
+    position = to_position(board_state)
+    king_square = find_king(player, position)
 
-    return check_via_straight(king_square, board_state) or check_via_diagonal(king_square, board_state) or check_via_knight(king_square, board_state)
+    return check_via_straight(king_square, position) or check_via_diagonal(king_square, position) or \
+        check_via_knight(king_square, position)
 
 
-def find_king(player: str, board_state: dict):
+def find_king(player: str, board_state):
     """
-    Find the square where the player's king is
+    Find the square where the player's king is. Positions keep track of their King squares so this is a lookup, board
+    state dicts have to be searched.
     :param player: Player for whom to find the King for (e.g 'W')
     :param board_state: The state of the board
     :return: The square where the player's King is
+    :raises InvalidPositionError: If the player has no King
     """
 
-    # King piece to look for
-    king = player[0] + "K"
-
-    for square in board_state.keys():
-        if board_state[square] == king:
-            return square
+    if isinstance(board_state, Position):
+        king_index = board_state.kings[player[0]]
+        if king_index is not None:
+            return index_to_square(king_index)
+    else:
+        # King piece to look for
+        king = player[0] + "K"
+        for square in board_state.keys():
+            if board_state[square] == king:
+                return square
 
-    print("UH You have no King")
+    raise InvalidPositionError(f"{player} has no King")
 
 
-def check_via_straight(king_square: (int, int), board_state: dict):
+def check_via_straight(king_square: (int, int), board_state):
     """
     Determine whether the King at the given square is in check via a straight direction (up, down, left, right)
     :param king_square: The square where the King is on
@@ -62,25 +78,13 @@ def check_via_straight(king_square: (int, int), board_state: dict):
     :return: return True if King is in check via a straight direction, otherwise return False
     """
 
-    potential_checks = generate_rook_moves(king_square, board_state)
-    player = player_from_square(king_square, board_state)
+    position = to_position(board_state)
+    king_index = square_to_index(king_square)
 
-    for check_square in potential_checks:
-        pieces_that_can_check = ["R", "Q"] # Rook & Queen can check on straight direction, also King if distance is 1
-        if get_distance(king_square, check_square, "S") == 1:
-            pieces_that_can_check.append("K")
+    return check_via_rays(king_index, position, STRAIGHT, "RQ")
 
-        if has_piece(check_square, board_state):
-            piece = board_state[check_square]
-            piece_type = piece[1]
 
-            # Piece is a Rook or Queen (or King if distance is 1)
-            if is_opponent_piece(player, piece) and piece_type in pieces_that_can_check:
-                return True
-    return False
-
-
-def check_via_diagonal(king_square: (int, int), board_state: dict):
+def check_via_diagonal(king_square: (int, int), board_state):
     """
     Determine whether the King at the given square is in check via a diagonal direction (up-left, up-right,
     down-left, down-right)
@@ -89,33 +93,45 @@ def check_via_diagonal(king_square: (int, int), board_state: dict):
     :return: return True if King is in check via a straight direction, otherwise return False
     """
 
-    potential_checks = generate_bishop_moves(king_square, board_state)
-    player = player_from_square(king_square, board_state)
+    position = to_position(board_state)
+    king_index = square_to_index(king_square)
+    player = position.mailbox[king_index][0]
 
-    for check_square in potential_checks:
-        pieces_that_can_check = ["B", "Q"] # Bishop & Queen can check on straight direction, also King if distance is 1
-        if get_distance(king_square, check_square, "D") == 1:
-            pieces_that_can_check.append("K")
+    # See if pawn can check, opponent pawns can only check from the squares a pawn of the player's colour on the King's
+    # square would attack (i.e. in front of the King)
+    if PAWN_ATTACKS[player][king_index] & position.bitboards[OPPONENT[player] + "P"]:
+        return True
 
-            # See if pawn can check from this square
-            # if white, see if check square has row +1 of the king square
-            # if black see if check square has row -1 of the king square
-            if (player == "W" and king_square[0] > check_square[0]) or \
-               (player == "B" and king_square[0] < check_square[0]):
-                pieces_that_can_check.append("P")
+    return check_via_rays(king_index, position, DIAGONAL, "BQ")
 
-        if has_piece(check_square, board_state):
-            piece = board_state[check_square]
-            piece_type = piece[1]
 
-            # Piece is a Bishop or Queen (or King if distance is 1 or Pawn if correct direction)
-            if is_opponent_piece(player, piece) and piece_type in pieces_that_can_check:
-                return True
+def check_via_rays(king_index: int, position, directions: range, pieces_that_can_check: str):
+    """
+    Walk along the precomputed rays from the King's square and see if the first piece met on any of them is an
+    opponent piece that can capture the King along that ray (or an opponent King one square away)
+    :param king_index: Square index of the King
+    :param position: The position to check
+    :param directions: attack_tables.STRAIGHT or attack_tables.DIAGONAL
+    :param pieces_that_can_check: Piece types that can check along these rays, e.g. "RQ"
+    :return: True if the King is in check along one of the rays
+    """
+    mailbox = position.mailbox
+    player = mailbox[king_index][0]
+
+    for direction in directions:
+        distance = 1
+        for check_index in RAYS[direction][king_index]:
+            piece = mailbox[check_index]
+            if piece is not None:
+                if piece[0] != player and (piece[1] in pieces_that_can_check or (piece[1] == "K" and distance == 1)):
+                    return True
+                break  # Any other piece blocks the rest of the ray
+            distance += 1
 
     return False
 
 
-def check_via_knight(king_square: (int, int), board_state: dict):
+def check_via_knight(king_square: (int, int), board_state):
     """
     Determine whether King is in check via a Knight
     :param king_square: The square where the King is on
@@ -123,46 +139,212 @@ def check_via_knight(king_square: (int, int), board_state: dict):
     :return: return True if King is in check via a knight, otherwise return False
     """
 
-    potential_checks = generate_knight_moves(king_square, board_state)
-    player = player_from_square(king_square, board_state)
+    position = to_position(board_state)
+    king_index = square_to_index(king_square)
+    opponent = OPPONENT[position.mailbox[king_index][0]]
 
-    for check_square in potential_checks:
+    return bool(KNIGHT_ATTACKS[king_index] & position.bitboards[opponent + "N"])
 
-        if has_piece(check_square, board_state):
-            piece = board_state[check_square]
-            piece_type = piece[1]
 
-            if is_opponent_piece(player, piece) and piece_type == "N":
-                return True
+def square_attacked_by(square: (int, int), colour: str, board_state):
+    """
+    Determine whether any piece of a colour attacks a square, whether or not the square has a piece on it. Useful for
+    any King safety question, e.g. which squares a King could pass through when castling
+    :param square: The square to check
+    :param colour: The colour of the attacking pieces ("W" / "White")
+    :param board_state: The state of the board
+    :return: True if the square is attacked by at least one of the colour's pieces
+    """
 
-    return False
+    position = to_position(board_state)
+    return bool(attackers_to(position, square_to_index(square), colour[0]))
 
 
-def player_has_no_moves(king_square: (int, int), board_state: dict):
+def legality_masks(player: str, board_state):
+    """
+    Work out, once for a position, what restricts the player's moves from being legal:
+    1. Check mask - the squares a piece other than the King must move to in order to deal with check. With no check
+    this is every square, with one checker it is capturing the checker or blocking between it and the King, and
+    with two checkers it is empty as only the King can move.
+    2. Pins - pieces which are the only thing between the King and an opponent Rook, Bishop or Queen lined up on it
+    (absolutely pinned). A pinned piece can only move along the line between the King and the pinning piece,
+    including capturing it.
+
+    Pins and sliding checks are found by walking out from the King along all 8 rays, just like is_check looks for
+    checks by treating the King as a Rook and Bishop.
+
+    :param player: Player whose moves are being restricted
+    :param board_state: The state of the board
+    :return: (King square index, check mask bitboard, dict of pinned piece square index -> bitboard of squares along
+    its pin)
     """
-    Determine whether the player has any possible, non-checking, valid moves by simulating every single possible move
-    they can make. Used to determine if player is checkmate (if this returns False and player is currently check)
-    or if stalemate has occurred (if this returns False and player IS NOT in check).
+    position = to_position(board_state)
+    player = player[0]
+    opponent = OPPONENT[player]
+    bitboards = position.bitboards
+    mailbox = position.mailbox
+    king_index = square_to_index(find_king(player, position))
+
+    pins = {}
+    sliding_check_rays = 0
+    for directions, sliders in ((STRAIGHT, "RQ"), (DIAGONAL, "BQ")):
+        if not (bitboards[opponent + sliders[0]] | bitboards[opponent + "Q"]):
+            continue
+        for direction in directions:
+            ray = 0
+            own_blocker = None
+            for index in RAYS[direction][king_index]:
+                ray |= 1 << index
+                piece = mailbox[index]
+                if piece is None:
+                    continue
+                if piece[0] == player:
+                    if own_blocker is not None:
+                        break  # Two of the player's pieces in the way, nothing is pinned
+                    own_blocker = index
+                    continue
+                if piece[1] in sliders:
+                    if own_blocker is None:
+                        sliding_check_rays |= ray
+                    else:
+                        pins[own_blocker] = ray
+                break  # Stop at the first opponent piece
+
+    checkers = attackers_to(position, king_index, opponent)
+    if not checkers:
+        check_mask = FULL_BOARD
+    elif checkers & (checkers - 1):
+        check_mask = 0  # Double check
+    else:
+        # Single check, a sliding checker can be captured or blocked, anything else can only be captured
+        check_mask = sliding_check_rays or checkers
+
+    return king_index, check_mask, pins
+
+
+def player_has_no_moves(king_square: (int, int), board_state):
+    """
+    Determine whether the player has any possible, non-checking, valid moves. Used to determine if player is checkmate
+    (if this returns True and player is currently check) or if stalemate has occurred (if this returns True and player
+    IS NOT in check).
 
     :param king_square: square where the King is on
     :param board_state: The state of the board
     :return: Returns False if there is at least one move the player can make that will remove check
     """
 
-    player = player_from_square(king_square, board_state)
-    for square in board_state.keys():
-        # scan board and get all pieces which belong to player
-        if player_from_square(square, board_state) == player:
-            possible_moves = determine_valid_moves(square, board_state)
-            for move in possible_moves:
-                # want to perform each move and see if we are still in check
-                if not move_causes_check(player, board_state, square, move):
-                    return False
+    position = to_position(board_state)
+    player = position.mailbox[square_to_index(king_square)][0]
+
+    # Reuse the full move list if it has already been worked out, otherwise only look as far as the first move
+    cached = MOVE_CACHE.get(cache_key(player, position))
+    if cached is not None:
+        return not cached[0]
+
+    return not player_has_any_move(player, position)
 
-    return True
 
+def player_has_any_move(player: str, board_state):
+    """
+    Determine whether the player has at least one legal move, stopping as soon as one is found rather than generating
+    every move. Pieces are tried cheapest and most likely to be able to move first: the King (the only piece that can
+    move in double check), then pawns and knights, then the sliding pieces.
 
-def move_causes_check(player: str, board_state: dict, from_square: (int, int), to_square: (int,int)):
+    :param player: Player to look for a move for
+    :param board_state: The state of the board
+    :return: True if the player has a legal move
+    """
+
+    position = to_position(board_state)
+    player = player[0]
+    masks = legality_masks(player, position)
+    king_index, check_mask, pins = masks
+    opponent = OPPONENT[player]
+    bitboards = position.bitboards
+
+    # King moves, stop at the first destination that is not attacked
+    occupied = (position.occupancy["W"] | position.occupancy["B"]) ^ (1 << king_index)
+    for move in iterate_indexes(move_targets(position, king_index)):
+        if not attackers_to(position, move, opponent, occupied):
+            return True
+
+    # In double check nothing else can move
+    if not check_mask:
+        return False
+
+    for piece_type in "PNBRQ":
+        for index in iterate_indexes(bitboards[player + piece_type]):
+            if legal_targets(position, index, masks):
+                return True
+
+    return False
+
+
+def cached_legal_moves(player: str, board_state):
+    """
+    Every legal move the player can make, along with whether they are in check, checkmate or stalemate. Results are
+    kept in the shared move cache (see move_cache.py) so asking about the same position again is only a lookup.
+
+    :param player: Player to generate moves for
+    :param board_state: The state of the board
+    :return: (dict of piece square index -> bitboard of squares it can legally move to, status) where status is CHECK,
+    CHECKMATE, STALEMATE or None. Pieces with no legal moves are left out. The dict is shared so must not be modified
+    """
+
+    player = player[0]
+    position = to_position(board_state, player)
+    key = cache_key(player, position)
+
+    entry = MOVE_CACHE.get(key)
+    if entry is None:
+        masks = legality_masks(player, position)
+        legal_moves = {}
+        for index in iterate_indexes(position.occupancy[player]):
+            targets = legal_targets(position, index, masks)
+            if targets:
+                legal_moves[index] = targets
+
+        in_check = masks[1] != FULL_BOARD  # Check mask only covers the whole board when there is no check
+        if legal_moves:
+            status = CHECK if in_check else None
+        else:
+            status = CHECKMATE if in_check else STALEMATE
+
+        entry = (legal_moves, status)
+        MOVE_CACHE.put(key, entry)
+
+    return entry
+
+
+def game_status(player: str, board_state, legal_moves: dict):
+    """
+    Decide the state of the game for the player to move from the moves they have
+    NO MOVE -> Check -> Checkmate
+    No Move -> not check -> stalemate
+    can move -> check -> have to play move that removes check
+    :param player: The player to move
+    :param board_state: The state of the board
+    :param legal_moves: The player's moves from piece_moves.generate_all_legal_moves
+    :return: CHECK, CHECKMATE, STALEMATE or None if the game carries on as normal
+    """
+    in_check = is_check(player, board_state)
+    if not legal_moves:
+        return CHECKMATE if in_check else STALEMATE
+    return CHECK if in_check else None
+
+
+def cache_key(player: str, position):
+    """
+    :param player: Player whose moves are being looked up
+    :param position: The position the moves are for
+    :return: The position's Zobrist hash as if it were the player's turn
+    """
+    if position.player != player:
+        return position.zobrist ^ SIDE_KEY
+    return position.zobrist
+
+
+def move_causes_check(player: str, board_state, from_square: (int, int), to_square: (int,int)):
     """
     Given a particular move, determine whether performing it will result in the player's own king being put into check
     :param player: Player who performed move
@@ -172,6 +354,11 @@ def move_causes_check(player: str, board_state: dict, from_square: (int, int), t
     :return: True if performing the move results in the player's king being placed in check
     """
 
-    simulated_board_state = simulate_move(board_state, from_square, to_square)
-    return is_check(player, simulated_board_state)
+    # Play the move in place and take it back afterwards rather than copying the board
+    position = to_position(board_state)
+    position.make_move(square_to_index(from_square), square_to_index(to_square))
+    in_check = is_check(player, position)
+    position.unmake_move()
+
+    return in_check
 
@@ -0,0 +1,228 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Reads and writes positions in Forsyth-Edwards Notation (FEN), e.g. the starting position is
+    rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1
+The first field lists the pieces one row at a time from row 0 (rank 8) to row 7 (rank 1), with uppercase letters for
+white pieces, lowercase for black and digits for runs of empty squares. The other fields are the player to move,
+castling rights, en passant square, the number of moves since the last capture or pawn move (halfmove clock) and the
+move number. Castling and en passant are not part of the rules yet, so those fields are checked and returned by
+parse_fen but don't affect the position, and are written as "-" unless given.
+
+Running this file validates a file of FEN strings (one per line) as a stream, so it can work through millions of lines
+without reading the whole file in:
+    python fen.py positions.fen --output results.txt
+    cat positions.fen | python fen.py - --invalid-only
+Each line of output is the line number, OK or the reason the position is invalid, and the FEN.
+"""
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+from bitboard import Position, InvalidPositionError, OPPONENT, position_from_board, board_from_position
+from checkmate import is_check
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Rows 0 and 7, where a pawn can never be
+BACK_ROWS = 0xFF | (0xFF << 56)
+
+# Every field of a FEN string, with the pieces and player to move as a Position
+FenRecord = namedtuple("FenRecord", ["position", "castling", "en_passant", "halfmove_clock", "fullmove_number"])
+
+
+def parse_fen(fen: str):
+    """
+    Read every field of a FEN string. Only the pieces and player to move are required, the other fields default to
+    "-", "-", 0 and 1 when left out.
+    :param fen: The position in FEN
+    :return: FenRecord of the position and the other fields
+    :raises ValueError: If any field is not valid FEN
+    """
+    fields = fen.split()
+    if len(fields) < 2 or fields[1] not in ("w", "b"):
+        raise ValueError(f"FEN must give the pieces followed by 'w' or 'b': {fen}")
+    if len(fields) > 6:
+        raise ValueError(f"FEN has more than 6 fields: {fen}")
+
+    rows = fields[0].split("/")
+    if len(rows) != 8:
+        raise ValueError(f"FEN piece placement must have 8 rows: {fen}")
+
+    position = Position(fields[1].upper())
+    for row, row_text in enumerate(rows):
+        col = 0
+        for char in row_text:
+            if char.isdigit():
+                col += int(char)
+            elif char.upper() in "PNBRQK" and col < 8:
+                position.add_piece(row * 8 + col, ("W" if char.isupper() else "B") + char.upper())
+                col += 1
+            else:
+                raise ValueError(f"FEN row {row_text} is not valid: {fen}")
+        if col != 8:
+            raise ValueError(f"FEN row {row_text} does not cover 8 squares: {fen}")
+
+    castling, en_passant, halfmove_clock, fullmove_number = (fields[2:] + ["-", "-", "0", "1"][len(fields) - 2:])
+    if castling != "-" and (not castling or any(char not in "KQkq" for char in castling)
+                            or len(set(castling)) != len(castling)):
+        raise ValueError(f"FEN castling rights {castling} are not valid: {fen}")
+    if en_passant != "-" and (len(en_passant) != 2 or en_passant[0] not in "abcdefgh" or en_passant[1] not in "36"):
+        raise ValueError(f"FEN en passant square {en_passant} is not valid: {fen}")
+    if not halfmove_clock.isdigit() or not fullmove_number.isdigit() or int(fullmove_number) < 1:
+        raise ValueError(f"FEN move counters {halfmove_clock} {fullmove_number} are not valid: {fen}")
+
+    return FenRecord(position, castling, en_passant, int(halfmove_clock), int(fullmove_number))
+
+
+def position_from_fen(fen: str):
+    """
+    Build a Position from a FEN string
+    :param fen: The position in FEN
+    :return: Position with the pieces and player to move given by the FEN
+    :raises ValueError: If the FEN is not valid
+    """
+    return parse_fen(fen).position
+
+
+def board_from_fen(fen: str):
+    """
+    Build a board state from a FEN string
+    :param fen: The position in FEN
+    :return: (board_state, player to move)
+    :raises ValueError: If the FEN is not valid
+    """
+    position = position_from_fen(fen)
+    return board_from_position(position), position.player
+
+
+def position_to_fen(position: Position, castling: str = "-", en_passant: str = "-", halfmove_clock: int = 0,
+                    fullmove_number: int = 1):
+    """
+    Write a Position as a FEN string
+    :param position: The position to write
+    :param castling: Castling rights, e.g. "KQkq", or "-" for none
+    :param en_passant: En passant square, e.g. "e3", or "-" for none
+    :param halfmove_clock: Number of moves since the last capture or pawn move
+    :param fullmove_number: Move number, starting at 1 and going up after each of black's moves
+    :return: The position in FEN
+    """
+    rows = []
+    for row in range(8):
+        row_text = ""
+        empty = 0
+        for piece in position.mailbox[row * 8:row * 8 + 8]:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                row_text += str(empty)
+                empty = 0
+            row_text += piece[1] if piece[0] == "W" else piece[1].lower()
+        rows.append(row_text + (str(empty) if empty else ""))
+
+    return f"{'/'.join(rows)} {position.player.lower()} {castling} {en_passant} {halfmove_clock} {fullmove_number}"
+
+
+def board_to_fen(board_state: dict, player: str = "W", castling: str = "-", en_passant: str = "-",
+                 halfmove_clock: int = 0, fullmove_number: int = 1):
+    """
+    Write a board state as a FEN string
+    :param board_state: The state of the board
+    :param player: The player whose turn it is
+    :param castling: Castling rights, e.g. "KQkq", or "-" for none
+    :param en_passant: En passant square, e.g. "e3", or "-" for none
+    :param halfmove_clock: Number of moves since the last capture or pawn move
+    :param fullmove_number: Move number, starting at 1 and going up after each of black's moves
+    :return: The position in FEN
+    """
+    return position_to_fen(position_from_board(board_state, player[0]), castling, en_passant, halfmove_clock,
+                           fullmove_number)
+
+
+def validate_position(position: Position):
+    """
+    Check a position could come up in a game: each player has exactly one King, no pawns are on the first or last
+    row and the player who has just moved has not left their King in check
+    :param position: The position to check
+    :raises InvalidPositionError: Describing the first problem found
+    """
+    for player in ("W", "B"):
+        kings = bin(position.bitboards[player + "K"]).count("1")
+        if kings != 1:
+            raise InvalidPositionError(f"{player} has {kings} Kings")
+
+    if (position.bitboards["WP"] | position.bitboards["BP"]) & BACK_ROWS:
+        raise InvalidPositionError("Pawn on the first or last row")
+
+    if is_check(OPPONENT[position.player], position):
+        raise InvalidPositionError(f"{OPPONENT[position.player]} is in check but it is not their turn")
+
+
+def validate_fen(fen: str):
+    """
+    :param fen: The position in FEN
+    :return: None if the FEN is valid and the position could come up in a game, otherwise the reason it is not
+    """
+    try:
+        validate_position(position_from_fen(fen))
+    except ValueError as error:  # Includes InvalidPositionError
+        return str(error)
+    return None
+
+
+def validate_stream(lines, output, invalid_only=False):
+    """
+    Validate FEN strings one line at a time, writing the result of each as it goes
+    :param lines: Iterable of lines of FEN, e.g. an open file. Blank lines are skipped
+    :param output: File to write results to
+    :param invalid_only: Only write the lines which are not valid
+    :return: (number of FEN strings checked, number which are not valid)
+    """
+    checked = 0
+    invalid = 0
+    for line_number, line in enumerate(lines, 1):
+        fen = line.strip()
+        if not fen:
+            continue
+
+        checked += 1
+        reason = validate_fen(fen)
+        if reason is not None:
+            invalid += 1
+            output.write(f"{line_number}\t{reason}\t{fen}\n")
+        elif not invalid_only:
+            output.write(f"{line_number}\tOK\t{fen}\n")
+
+    return checked, invalid
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Validate a file of FEN strings, one per line")
+    parser.add_argument("path", help="File of FEN strings, or - to read from stdin")
+    parser.add_argument("--output", help="File to write results to (default is stdout)")
+    parser.add_argument("--invalid-only", action="store_true", help="Only write the lines which are not valid")
+    arguments = parser.parse_args(arguments)
+
+    lines = sys.stdin if arguments.path == "-" else open(arguments.path)
+    output = sys.stdout if arguments.output is None else open(arguments.output, "w")
+    start = time.perf_counter()
+    try:
+        checked, invalid = validate_stream(lines, output, arguments.invalid_only)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+    seconds = time.perf_counter() - start
+
+    print(f"Checked {checked} positions in {seconds:.3f}s ({checked / max(seconds, 1e-9):,.0f} positions/s), "
+          f"{invalid} not valid", file=sys.stderr)
+
+    return 0 if invalid == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
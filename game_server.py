@@ -0,0 +1,366 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Server which hosts many games at once, each a GameSession (see game_session.py) kept in memory and played over TCP.
+Clients send one command per line and get one line back, starting "OK" or "ERROR" followed by the reason:
+    NEW [fen]               Start a game, from the FEN if given         -> OK <game id>
+    MOVE <game> <move>      Play a move in coordinate form, e.g. e2e4   -> OK <status>
+    UNDO <game>             Take back the last move                     -> OK <status>
+    LEGAL <game> [square]   Legal moves, of the piece on the square     -> OK e2e3 e2e4 ...
+    BOARD <game>            The position                                -> OK <fen>
+    STATUS <game>           Whose turn it is and how the game stands    -> OK <status>
+    CLOSE <game>            Forget a game                               -> OK
+    STATS                   Games, connections and request latencies    -> OK games=... p50_ms=... ...
+    QUIT                    Close the connection                        -> OK
+where <status> is turn=<player> status=<Check, Checkmate, Stalemate or -> result=<White, Black, Draw or ->.
+Castling and en passant are not part of the rules yet, so NEW answers ERROR for a FEN which gives castling rights
+or an en passant square rather than play a different game from the one asked for. There is no 50 move rule either, so
+the halfmove clock isn't kept and BOARD always gives it as 0.
+Games are not tied to a connection, any client with a game's id can play it.
+
+The server runs on asyncio so thousands of idle connections cost nothing. Working out a player's legal moves and
+whether they are checkmated or stalemated (GameSession.update_status) can be slow, so moves, take backs and new games
+are run in a thread pool and the event loop carries on serving other connections meanwhile. Each game has a lock so
+two commands for the same game are never worked on at the same time.
+
+The time taken to answer each request is recorded, the latest few thousand of each command are kept, and the 50th,
+90th and 99th percentiles are given by STATS and printed every --report-interval seconds along with the number of
+games and connections.
+
+Usage:
+    python game_server.py --host 127.0.0.1 --port 8765 --workers 4
+and then e.g. with netcat
+    printf 'NEW\\nMOVE 1 e2e4\\nBOARD 1\\n' | nc 127.0.0.1 8765
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bitboard import square_to_index, index_to_square, board_from_position
+from fen import board_to_fen, parse_fen, validate_fen
+from game_session import GameSession, IllegalMoveError
+from notation import move_name, parse_move_name, parse_square_name
+from piece_moves import PROMOTION_PIECES
+
+DEFAULT_PORT = 8765
+DEFAULT_REPORT_INTERVAL = 60
+LATENCY_SAMPLES = 10000  # Latest request times kept for each command
+MAX_LINE_LENGTH = 1024
+
+
+class ProtocolError(ValueError):
+    """
+    Raised when a command can't be carried out, its message is sent back to the client
+    """
+
+
+def percentile(samples: list, fraction: float):
+    """
+    :param samples: Sorted list of numbers
+    :param fraction: Between 0 and 1, e.g. 0.9 for the 90th percentile
+    :return: The nearest rank percentile of the samples, 0 if there are none
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))]
+
+
+class LatencyRecorder:
+    """
+    Keeps the latest request times of each command
+    """
+
+    def __init__(self, size: int = LATENCY_SAMPLES):
+        """
+        :param size: Number of the latest times to keep for each command
+        """
+        self.size = size
+        self.samples = {}
+        self.requests = 0
+
+    def record(self, command: str, seconds: float):
+        """
+        :param command: Name of the command, e.g. "MOVE"
+        :param seconds: Time taken to answer it
+        """
+        if command not in self.samples:
+            self.samples[command] = deque(maxlen=self.size)
+        self.samples[command].append(seconds)
+        self.requests += 1
+
+    def summary(self, command: str = None):
+        """
+        :param command: Command to summarise, every command together if None
+        :return: Dict of count, p50_ms, p90_ms, p99_ms and max_ms over the kept times
+        """
+        if command is None:
+            samples = sorted(itertools.chain.from_iterable(self.samples.values()))
+        else:
+            samples = sorted(self.samples.get(command, ()))
+        return {"count": len(samples),
+                "p50_ms": percentile(samples, 0.5) * 1000,
+                "p90_ms": percentile(samples, 0.9) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+                "max_ms": (samples[-1] if samples else 0.0) * 1000}
+
+
+def format_status(session: GameSession):
+    """
+    :return: The turn, status and result of a game as key=value pairs
+    """
+    return f"turn={session.player} status={session.status or '-'} result={session.result or '-'}"
+
+
+def legal_move_names(session: GameSession, square: (int, int) = None):
+    """
+    :param session: The game
+    :param square: Only give the moves of the piece on this square if given
+    :return: List of the legal moves in coordinate form, with a move for each promotion piece when a pawn promotes
+    """
+    names = []
+    for from_square, to_squares in sorted(session.legal_moves.items()):
+        if square is not None and from_square != square:
+            continue
+        for to_square in to_squares:
+            promotions = PROMOTION_PIECES if session.needs_promotion(from_square, to_square) else (None,)
+            for promotion in promotions:
+                names.append(move_name((square_to_index(from_square), square_to_index(to_square), promotion)))
+    return names
+
+
+class GameServer:
+    """
+    The games being played and the connections to the server
+    """
+
+    def __init__(self, workers: int = None):
+        """
+        :param workers: Number of threads to work out legal moves with, Python's default if None
+        """
+        self.games = {}  # game id -> GameSession
+        self.locks = {}  # game id -> asyncio.Lock
+        self.game_ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(workers)
+        self.latency = LatencyRecorder()
+        self.connections = 0
+        self.commands = {"NEW": self.new_game,
+                         "MOVE": self.move,
+                         "UNDO": self.undo,
+                         "LEGAL": self.legal,
+                         "BOARD": self.board,
+                         "STATUS": self.status,
+                         "CLOSE": self.close_game,
+                         "STATS": self.stats}
+
+    async def run_in_executor(self, function, *arguments):
+        """
+        Run a slow function in the thread pool so the event loop can carry on
+        :return: What the function returns
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *arguments)
+
+    def game(self, arguments: list):
+        """
+        :param arguments: Arguments of a command, the first being a game id
+        :return: (game id, GameSession)
+        :raises ProtocolError: If there is no game id or no game with the id
+        """
+        if not arguments:
+            raise ProtocolError("A game id is needed")
+        try:
+            game_id = int(arguments[0])
+        except ValueError:
+            raise ProtocolError(f"{arguments[0]} is not a game id")
+        if game_id not in self.games:
+            raise ProtocolError(f"There is no game {game_id}")
+        return game_id, self.games[game_id]
+
+    async def new_game(self, arguments: list):
+        if arguments:
+            fen = " ".join(arguments)
+            problem = validate_fen(fen)
+            if problem is not None:
+                raise ProtocolError(f"Invalid FEN: {problem}")
+            record = parse_fen(fen)
+            if record.castling != "-" or record.en_passant != "-":
+                raise ProtocolError("Castling and en passant are not supported, give - for both in the FEN")
+            player = "White" if record.position.player == "W" else "Black"
+            session = await self.run_in_executor(GameSession, board_from_position(record.position), player,
+                                                 record.fullmove_number)
+        else:
+            session = await self.run_in_executor(GameSession)
+
+        game_id = next(self.game_ids)
+        self.games[game_id] = session
+        self.locks[game_id] = asyncio.Lock()
+        return str(game_id)
+
+    async def move(self, arguments: list):
+        game_id, session = self.game(arguments)
+        move = parse_move_name(arguments[1]) if len(arguments) > 1 else None
+        if move is None:
+            raise ProtocolError("A move in coordinate form is needed, e.g. e2e4 or e7e8q")
+
+        from_index, to_index, promotion = move
+        async with self.locks[game_id]:
+            try:
+                await self.run_in_executor(session.move, index_to_square(from_index), index_to_square(to_index),
+                                           promotion)
+            except IllegalMoveError as error:
+                raise ProtocolError(str(error))
+            return format_status(session)
+
+    async def undo(self, arguments: list):
+        game_id, session = self.game(arguments)
+        async with self.locks[game_id]:
+            try:
+                await self.run_in_executor(session.undo)
+            except IllegalMoveError as error:
+                raise ProtocolError(str(error))
+            return format_status(session)
+
+    async def legal(self, arguments: list):
+        game_id, session = self.game(arguments)
+        square = None
+        if len(arguments) > 1:
+            index = parse_square_name(arguments[1])
+            if index is None:
+                raise ProtocolError(f"{arguments[1]} is not a square")
+            square = index_to_square(index)
+
+        async with self.locks[game_id]:
+            return " ".join(legal_move_names(session, square))
+
+    async def board(self, arguments: list):
+        game_id, session = self.game(arguments)
+        async with self.locks[game_id]:
+            return board_to_fen(session.board_state, session.player, fullmove_number=session.fullmove_number())
+
+    async def status(self, arguments: list):
+        game_id, session = self.game(arguments)
+        async with self.locks[game_id]:
+            return format_status(session)
+
+    async def close_game(self, arguments: list):
+        game_id, _ = self.game(arguments)
+        async with self.locks[game_id]:
+            if self.games.pop(game_id, None) is None:
+                raise ProtocolError(f"There is no game {game_id}")  # Closed while waiting for the lock
+        self.locks.pop(game_id, None)
+        return ""
+
+    async def stats(self, arguments: list):
+        if arguments:
+            summary = self.latency.summary(arguments[0].upper())
+        else:
+            summary = self.latency.summary()
+        latencies = " ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                             for key, value in summary.items())
+        return f"games={len(self.games)} connections={self.connections} {latencies}"
+
+    async def answer(self, line: str):
+        """
+        Carry out one command
+        :param line: The command as sent by the client
+        :return: (command name, response line without the newline)
+        """
+        words = line.split()
+        if not words:
+            return None, "ERROR Empty command"
+
+        command = words[0].upper()
+        if command not in self.commands:
+            return None, f"ERROR Unknown command {words[0]}, use {', '.join(self.commands)} or QUIT"
+        try:
+            response = await self.commands[command](words[1:])
+        except ValueError as error:  # Includes ProtocolError and InvalidPositionError
+            return command, f"ERROR {error}"
+        return command, f"OK {response}".rstrip()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer a client's commands until they QUIT or disconnect
+        """
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b"ERROR Line too long\n")
+                    break
+                if not line:
+                    break
+
+                start = time.perf_counter()
+                line = line.decode(errors="replace").strip()
+                if line.upper() == "QUIT":
+                    writer.write(b"OK\n")
+                    break
+
+                command, response = await self.answer(line)
+                writer.write(response.encode() + b"\n")
+                await writer.drain()
+                if command is not None:
+                    self.latency.record(command, time.perf_counter() - start)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def report(self, interval: float):
+        """
+        Print the number of games and connections and the request latencies every interval seconds
+        """
+        while True:
+            await asyncio.sleep(interval)
+            print(f"{time.strftime('%H:%M:%S')} {await self.stats([])}", flush=True)
+
+    async def serve(self, host: str, port: int, report_interval: float = DEFAULT_REPORT_INTERVAL):
+        """
+        Accept connections until cancelled
+        :param host: Address to listen on
+        :param port: Port to listen on
+        :param report_interval: Seconds between printed reports, 0 for none
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_LENGTH)
+        reporter = asyncio.create_task(self.report(report_interval)) if report_interval > 0 else None
+        print(f"Serving games on {', '.join(str(socket.getsockname()) for socket in server.sockets)}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Host many games of chess over TCP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, help="Threads to work out legal moves with")
+    parser.add_argument("--report-interval", type=float, default=DEFAULT_REPORT_INTERVAL,
+                        help=f"Seconds between printed reports, 0 for none (default {DEFAULT_REPORT_INTERVAL})")
+    arguments = parser.parse_args(arguments)
+
+    server = GameServer(arguments.workers)
+    try:
+        asyncio.run(server.serve(arguments.host, arguments.port, arguments.report_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Stopped. {server.latency.requests} requests, {len(server.games)} games in memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+A game of chess without any input() or print(), so games can be played by other programs as well as in the terminal
+(see main.py). A GameSession holds the board state, the player whose turn it is, the moves played and the result, and
+takes moves as squares with an explicit promotion piece so nothing ever waits for a person to type.
+
+Anything that wants to know what happens in the game (e.g. to draw the board) registers a listener with add_listener,
+which is called with a GameEvent whenever a move is made or taken back and when a player is put in check, checkmated
+or stalemated.
+"""
+from collections import namedtuple
+
+from bitboard import position_from_board, index_to_square, square_to_index
+from board_handler import initialise_board, make_move, unmake_move
+from checkmate import game_status, CHECKMATE, STALEMATE
+from notation import square_name
+from piece_moves import generate_all_legal_moves, PROMOTION_PIECES
+from search import search, MAX_DEPTH
+from util import next_player_turn
+
+# Kinds of GameEvent
+MOVE_MADE = "Move made"
+MOVE_UNDONE = "Move undone"
+
+DRAW = "Draw"
+
+# kind is MOVE_MADE, MOVE_UNDONE, CHECK, CHECKMATE or STALEMATE, player is the player who moved (or whose move was
+# taken back) or who is in check / checkmate / stalemate. The squares, piece and promotion are None for statuses.
+GameEvent = namedtuple("GameEvent", ["kind", "player", "from_square", "to_square", "piece", "promotion"])
+
+
+class IllegalMoveError(ValueError):
+    """
+    Raised when a move given to a GameSession can't be played
+    """
+
+
+class GameSession:
+    """
+    One game of chess. board_state is the board (see board_handler.py) and player is "White" or "Black". legal_moves
+    holds the moves of the player whose turn it is, worked out once per turn, as from square -> list of to squares.
+    status is CHECK, CHECKMATE, STALEMATE or None, and result is the winning player or DRAW once the game is over.
+    moves is every move played as (from square, to square, promotion piece type or None). start_player and
+    start_fullmove are the player to move and fullmove number of the starting board, e.g. from a FEN.
+    """
+
+    def __init__(self, board_state: dict = None, player: str = "White", fullmove_number: int = 1):
+        """
+        :param board_state: Board to start from, the starting board if not given. It is copied, not changed
+        :param player: The player whose turn it is
+        :param fullmove_number: Number of the move being played on the starting board, as in FEN
+        """
+        self.board_state = initialise_board() if board_state is None else board_state.copy()
+        self.player = player
+        self.start_player = player
+        self.start_fullmove = fullmove_number
+        self.moves = []
+        self.undo_stack = []
+        self.listeners = []
+        self.legal_moves = {}
+        self.status = None
+        self.result = None
+        self.update_status()
+
+    def add_listener(self, listener):
+        """
+        :param listener: Function to call with a GameEvent whenever something happens in the game
+        """
+        self.listeners.append(listener)
+
+    def emit(self, kind: str, player: str, from_square=None, to_square=None, piece=None, promotion=None):
+        """
+        Tell every listener about an event
+        """
+        event = GameEvent(kind, player, from_square, to_square, piece, promotion)
+        for listener in self.listeners:
+            listener(event)
+
+    def update_status(self):
+        """
+        Work out the legal moves and status for the player whose turn it is, ending the game on checkmate or stalemate
+        """
+        self.legal_moves = generate_all_legal_moves(self.player, self.board_state)
+        self.status = game_status(self.player, self.board_state, self.legal_moves)
+        if self.status == CHECKMATE:
+            self.result = next_player_turn(self.player)
+        elif self.status == STALEMATE:
+            self.result = DRAW
+        else:
+            self.result = None
+
+        if self.status is not None:
+            self.emit(self.status, self.player)
+
+    def fullmove_number(self):
+        """
+        :return: Number of the move being played now, as in FEN. It goes up after each move by Black
+        """
+        black_moves = (len(self.moves) + (self.start_player == "Black")) // 2
+        return self.start_fullmove + black_moves
+
+    def can_undo(self):
+        """
+        :return: True if there is a move to take back
+        """
+        return len(self.undo_stack) > 0
+
+    def needs_promotion(self, from_square: (int, int), to_square: (int, int)):
+        """
+        :param from_square: Square the piece moves from
+        :param to_square: Square the piece moves to
+        :return: True if the move is a pawn reaching the last row, so needs a promotion piece
+        """
+        return self.board_state.get(from_square, "  ")[1] == "P" and to_square[0] in (0, 7)
+
+    def move(self, from_square: (int, int), to_square: (int, int), promotion: str = None):
+        """
+        Play a move for the player whose turn it is
+        :param from_square: Square of the piece to move
+        :param to_square: Square to move the piece to
+        :param promotion: Piece type to promote to (e.g. "Q"), must be given if and only if a pawn reaches the last row
+        :raises IllegalMoveError: If the game is over, the move is not legal or the promotion piece is wrong
+        """
+        if self.result is not None:
+            raise IllegalMoveError("The game is over")
+        if to_square not in self.legal_moves.get(from_square, []):
+            raise IllegalMoveError(f"{self.player} cannot move from {square_name(square_to_index(from_square))} to "
+                                   f"{square_name(square_to_index(to_square))}")
+        if self.needs_promotion(from_square, to_square):
+            if promotion not in PROMOTION_PIECES:
+                raise IllegalMoveError(f"A promotion piece ({', '.join(PROMOTION_PIECES)}) is needed")
+        elif promotion is not None:
+            raise IllegalMoveError("Only a pawn reaching the last row can promote")
+
+        piece = self.board_state[from_square]
+        make_move(self.board_state, from_square, to_square, self.undo_stack, promotion)
+        self.moves.append((from_square, to_square, promotion))
+
+        self.emit(MOVE_MADE, self.player, from_square, to_square, piece, promotion)
+        self.player = next_player_turn(self.player)
+        self.update_status()
+
+    def undo(self):
+        """
+        Take back the last move, giving the turn back to the player who made it
+        :raises IllegalMoveError: If no moves have been played
+        """
+        if not self.can_undo():
+            raise IllegalMoveError("There is no move to take back")
+
+        from_square, to_square, promotion = self.moves.pop()
+        unmake_move(self.board_state, self.undo_stack)
+        self.player = next_player_turn(self.player)
+
+        self.emit(MOVE_UNDONE, self.player, from_square, to_square, self.board_state[from_square], promotion)
+        self.update_status()
+
+    def find_move(self, time_limit: float = None, max_depth: int = None):
+        """
+        Search for the best move for the player whose turn it is, without playing it
+        :param time_limit: Seconds the search may take
+        :param max_depth: Deepest depth to search to, None for no limit
+        :return: (from square, to square, promotion, SearchResult), the squares are None if there are no moves
+        """
+        position = position_from_board(self.board_state, self.player[0])
+        result = search(position, time_limit, max_depth or MAX_DEPTH)
+        if result.move is None:
+            return None, None, None, result
+
+        from_index, to_index, promotion = result.move
+        return index_to_square(from_index), index_to_square(to_index), promotion, result
+
+    def play_computer_move(self, time_limit: float = None, max_depth: int = None):
+        """
+        Search for the best move for the player whose turn it is and play it
+        :param time_limit: Seconds the search may take
+        :param max_depth: Deepest depth to search to, None for no limit
+        :return: SearchResult of the search
+        :raises IllegalMoveError: If the game is over
+        """
+        if self.result is not None:
+            raise IllegalMoveError("The game is over")
+
+        from_square, to_square, promotion, result = self.find_move(time_limit, max_depth)
+        self.move(from_square, to_square, promotion)
+        return result
@@ -5,18 +5,20 @@ Created: 24/05/24
 Handles and verifies input from the player, this includes the square with the piece the player selects, and the move
 that they make
 """
-from piece_moves import determine_valid_moves
 from visuals_and_txt import message_piece_selection, message_piece_move_to
 
 
-def input_select_piece(player: str, board_state: dict, in_check):
+def input_select_piece(player: str, board_state: dict, legal_moves: dict, in_check, can_undo=False):
     """
     Takes user input to determine the piece and square that they want to move. This piece returned is a valid square
     that has a piece belonging to the player
     :param in_check:
     :param player: The player's turn
     :param board_state:  The state of the board
-    :return: The square as it is in board_state and a list of the pieces valid moves
+    :param legal_moves: The player's moves for this turn from piece_moves.generate_all_legal_moves
+    :param can_undo: Whether the player may enter "Undo" to take back the last move
+    :return: The square as it is in board_state and a list of the pieces valid moves. Returns (None, None, None) if the
+    player asked to take back the last move
     """
 
     piece = None
@@ -24,7 +26,9 @@ def input_select_piece(player: str, board_state: dict, in_check):
     # Keep asking for input until valid square is received
     while piece is None:
 
-        raw_square = get_piece_selection_input(player)
+        raw_square = get_piece_selection_input(player, can_undo)
+        if can_undo and raw_square == "Undo":
+            return None, None, None
         square = validate_input_square(raw_square)
 
         if square:
@@ -40,8 +44,8 @@ def input_select_piece(player: str, board_state: dict, in_check):
                     print("Invalid Piece: That Piece belongs to the other Player\n")
                     piece = None
                 else:
-                    # Now determine the moves the piece can make, reject input if piece has no valid moves
-                    valid_moves = determine_valid_moves(square, board_state)
+                    # Now look up the moves the piece can make, reject input if piece has no valid moves
+                    valid_moves = legal_moves.get(square, [])
                     if not valid_moves:
                         if in_check:
                             print("Invalid Piece: That Piece has no moves that can remove check\n")
@@ -115,13 +119,16 @@ def validate_input_square(square: str):
     return number, letter
 
 
-def get_piece_selection_input(player):
+def get_piece_selection_input(player, can_undo=False):
     """
     Get the input for the square where the piece they select is on
     :param player: player who's turn it is to select a piece
+    :param can_undo: Whether to tell the player they can take back the last move
     :return: raw input from player
     """
-    raw_square = input(player + ": Choose a piece to move (Enter the square coordinates e.g. G7)\n").capitalize()
+    undo_prompt = " or 'Undo' to take back the last move" if can_undo else ""
+    raw_square = input(player + ": Choose a piece to move (Enter the square coordinates e.g. G7" + undo_prompt + ")\n"
+                       ).capitalize()
     return raw_square
 
 def get_piece_for_promotion(player):
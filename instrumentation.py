@@ -0,0 +1,408 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Opt-in instrumentation to find out where the time goes in a game: move generation, checking for check, copying the
+board or drawing it. When enabled the functions listed in INSTRUMENTED are swapped, in every module that has them, for
+wrappers which count their calls and time them. When not enabled nothing is swapped, so the normal functions run with
+no extra cost at all.
+
+Times are kept per turn (end_turn marks the end of each) and added up for the whole session. Each function gets its
+total time, which includes any instrumented functions it calls, and its self time, which doesn't, so the self times add
+up to the time spent in instrumented code. Reports are text or JSON. The counters are not thread safe, so this is for
+single threaded programs such as main.py.
+
+Enable it for main.py with the environment variable or the command line flag
+    CHESS_INSTRUMENT=text python main.py            (or json, and CHESS_INSTRUMENT_OUTPUT=<file> to write to a file)
+    python main.py --instrument json --instrument-output report.json
+and the report is written when the game ends.
+
+For a closer look, a scripted game (moves given in coordinate form and/or from a PGN game, then continued by a move
+chooser from tournament.py) can be played under cProfile, writing a pstats file (for snakeviz, gprof2dot, flameprof,
+...) and, by sampling the call stack every millisecond, a folded stacks file for flamegraph.pl or speedscope:
+    python instrumentation.py --moves "e2e4 e7e5 g1f3" --chooser greedy --plies 60 --profile game.prof \\
+        --folded game.folded --report text
+"""
+import argparse
+import contextlib
+import cProfile
+import functools
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+ENVIRONMENT_VARIABLE = "CHESS_INSTRUMENT"
+OUTPUT_ENVIRONMENT_VARIABLE = "CHESS_INSTRUMENT_OUTPUT"
+FORMATS = ("text", "json")
+SAMPLE_INTERVAL = 0.001
+TURN_REPORT_FUNCTIONS = 5  # Busiest functions shown for each turn in text reports
+SCRIPTED_GAME_MODULES = ("visuals_and_txt", "bitboard", "game_session", "notation", "pgn", "tournament")
+
+# Module -> names of its functions to instrument
+INSTRUMENTED = {
+    "piece_moves": ["determine_valid_moves", "generate_all_legal_moves", "generate_legal_moves",
+                    "generate_packed_moves", "legal_targets", "generate_pawn_moves", "generate_king_moves",
+                    "generate_bishop_moves", "generate_rook_moves", "generate_queen_moves", "generate_knight_moves"],
+    "checkmate": ["is_check", "move_causes_check", "player_has_no_moves", "player_has_any_move",
+                  "cached_legal_moves", "legality_masks", "game_status"],
+    "board_handler": ["simulate_move", "perform_move", "make_move", "unmake_move"],
+    "bitboard": ["to_position", "position_from_board"],
+    "visuals_and_txt": ["display_board"],
+    "search": ["search"],
+}
+
+
+class Instrumentation:
+    """
+    Call counts and times of the instrumented functions, for the current turn and every turn so far
+    """
+
+    def __init__(self):
+        self.originals = {}  # wrapper -> original function, for disable
+        self.stack = []  # Time spent in instrumented functions called by each function being timed
+        self.turn = {}  # function name -> [calls, total seconds, self seconds] for the current turn
+        self.session = {}
+        self.turns = []
+        self.turn_start = time.perf_counter()
+        self.session_start = self.turn_start
+
+    def wrap(self, name: str, function):
+        """
+        :param name: Name to report the function under, e.g. "checkmate.is_check"
+        :param function: The function to time
+        :return: Wrapper which counts and times every call to the function
+        """
+        stack = self.stack
+
+        @functools.wraps(function)
+        def wrapper(*arguments, **keyword_arguments):
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*arguments, **keyword_arguments)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                record = self.turn.get(name)
+                if record is None:
+                    record = self.turn[name] = [0, 0.0, 0.0]
+                record[0] += 1
+                record[1] += elapsed
+                record[2] += elapsed - children
+
+        self.originals[wrapper] = function
+        return wrapper
+
+    def enable(self):
+        """
+        Swap the instrumented functions for timed wrappers, in their own modules and in every module which has
+        imported them by name
+        """
+        wrappers = {}
+        for module_name, function_names in INSTRUMENTED.items():
+            module = importlib.import_module(module_name)
+            for function_name in function_names:
+                function = getattr(module, function_name)
+                if function not in self.originals:
+                    wrappers[function] = self.wrap(f"{module_name}.{function_name}", function)
+        self.swap(wrappers)
+        self.reset()
+
+    def disable(self):
+        """
+        Put the original functions back
+        """
+        self.swap(self.originals)
+        self.originals = {}
+
+    def swap(self, replacements: dict):
+        """
+        :param replacements: Dict of function -> function to replace it with, in every loaded module
+        """
+        for module in list(sys.modules.values()):
+            namespace = getattr(module, "__dict__", None)
+            if namespace is None:
+                continue
+            for attribute, value in list(namespace.items()):
+                try:
+                    if value in replacements:
+                        namespace[attribute] = replacements[value]
+                except TypeError:
+                    pass  # Unhashable value, can't be a function
+
+    def reset(self):
+        """
+        Forget all counts and start a new session
+        """
+        self.turn = {}
+        self.session = {}
+        self.turns = []
+        self.turn_start = self.session_start = time.perf_counter()
+
+    def end_turn(self, label: str = ""):
+        """
+        Finish the current turn, adding its counts to the session
+        :param label: Description of the turn, e.g. the move played
+        """
+        now = time.perf_counter()
+        self.turns.append({"turn": len(self.turns) + 1,
+                           "label": label,
+                           "seconds": now - self.turn_start,
+                           "functions": function_stats(self.turn)})
+        for name, (calls, total, self_time) in self.turn.items():
+            record = self.session.setdefault(name, [0, 0.0, 0.0])
+            record[0] += calls
+            record[1] += total
+            record[2] += self_time
+        self.turn = {}
+        self.turn_start = now
+
+    def report(self):
+        """
+        :return: Dict of the session totals and every finished turn, ready to be written as JSON. Counts from an
+        unfinished turn are included in the session totals
+        """
+        totals = {name: list(record) for name, record in self.session.items()}
+        for name, (calls, total, self_time) in self.turn.items():
+            record = totals.setdefault(name, [0, 0.0, 0.0])
+            record[0] += calls
+            record[1] += total
+            record[2] += self_time
+        return {"session": {"seconds": time.perf_counter() - self.session_start,
+                            "turns": len(self.turns),
+                            "functions": function_stats(totals)},
+                "turns": self.turns}
+
+
+# The instrumentation shared by main.py and the scripted game
+INSTRUMENTATION = Instrumentation()
+
+
+def function_stats(records: dict):
+    """
+    :param records: Dict of function name -> [calls, total seconds, self seconds]
+    :return: Dict of function name -> dict of the same, busiest (most self time) first
+    """
+    ordered = sorted(records.items(), key=lambda item: -item[1][2])
+    return {name: {"calls": calls, "total_seconds": round(total, 6), "self_seconds": round(self_time, 6)}
+            for name, (calls, total, self_time) in ordered}
+
+
+def format_text(report: dict):
+    """
+    :param report: Report from Instrumentation.report
+    :return: The report as a table of the session totals followed by one line per turn
+    """
+    session = report["session"]
+    lines = [f"Session: {session['turns']} turns in {session['seconds']:.3f}s",
+             f"{'Function':<40} {'Calls':>9} {'Total ms':>10} {'Self ms':>10} {'Per call us':>12} {'Self %':>7}"]
+    for name, stats in session["functions"].items():
+        per_call = stats["total_seconds"] / stats["calls"] * 1e6 if stats["calls"] else 0.0
+        share = stats["self_seconds"] / session["seconds"] * 100 if session["seconds"] else 0.0
+        lines.append(f"{name:<40} {stats['calls']:>9} {stats['total_seconds'] * 1000:>10.2f} "
+                     f"{stats['self_seconds'] * 1000:>10.2f} {per_call:>12.1f} {share:>6.1f}%")
+
+    lines.append("")
+    lines.append("Turns (busiest functions by self time):")
+    for turn in report["turns"]:
+        busiest = ", ".join(f"{name} {stats['calls']}x {stats['self_seconds'] * 1000:.2f}ms"
+                            for name, stats in list(turn["functions"].items())[:TURN_REPORT_FUNCTIONS])
+        lines.append(f"{turn['turn']:>4} {turn['label']:<24} {turn['seconds'] * 1000:>9.2f}ms  {busiest}")
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report: dict, report_format: str = "text", path: str = None):
+    """
+    :param report: Report from Instrumentation.report
+    :param report_format: "text" or "json"
+    :param path: File to write to, stderr if None
+    """
+    text = format_text(report) if report_format == "text" else json.dumps(report, indent=2) + "\n"
+    if path is None:
+        sys.stderr.write(text)
+    else:
+        with open(path, "w") as file:
+            file.write(text)
+
+
+def from_environment():
+    """
+    :return: (format, output path or None) from the CHESS_INSTRUMENT and CHESS_INSTRUMENT_OUTPUT environment variables,
+    format is None if instrumentation is not asked for. Any value other than json means text
+    """
+    value = os.environ.get(ENVIRONMENT_VARIABLE, "").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return None, None
+    return ("json" if value == "json" else "text"), os.environ.get(OUTPUT_ENVIRONMENT_VARIABLE)
+
+
+class StackSampler(threading.Thread):
+    """
+    Background thread which records the call stack of another thread every interval, for flame graphs
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        """
+        :param thread_id: threading.get_ident() of the thread to sample
+        :param interval: Seconds between samples
+        """
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                # Leave out this module's own frames (the wrappers, end_turn, reporting) so stacks only show the game
+                if frame.f_code.co_filename != __file__:
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write_folded(self, path: str):
+        """
+        Write the samples as folded stacks, one "outer;...;inner count" line per distinct stack
+        :param path: File to write
+        """
+        with open(path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def play_scripted_game(moves: list, pgn_path: str, chooser_name: str, plies: int, seed: int, instrumentation=None):
+    """
+    Play a game with no input: the given moves, then the first game of the PGN file, then moves from the chooser until
+    plies moves have been played or the game ends. The board is drawn after every move as main.py does, into a buffer
+    rather than the terminal.
+    :param moves: Moves in coordinate form, e.g. ["e2e4", "e7e5"]
+    :param pgn_path: PGN file whose first game's moves to play, None for none
+    :param chooser_name: Move chooser from tournament.py (e.g. "random", "greedy", "search") to carry on with
+    :param plies: Most moves to play in total
+    :param seed: Seed for the chooser's random choices
+    :param instrumentation: Instrumentation to end a turn on after every move, None if not instrumenting
+    :return: The finished GameSession
+    :raises ValueError: If a given move can't be played
+    """
+    # Imported here so main.py importing this module for every game doesn't load the PGN and tournament code
+    import visuals_and_txt
+    from bitboard import square_to_index, index_to_square, position_from_board
+    from game_session import GameSession, MOVE_MADE
+    from notation import parse_move_name, move_name
+    from pgn import read_games, resolve_san
+    from tournament import load_chooser
+
+    session = GameSession()
+    screen = io.StringIO()
+
+    def on_event(event):
+        if event.kind == MOVE_MADE:
+            with contextlib.redirect_stdout(screen):
+                visuals_and_txt.display_board(session.board_state)
+            screen.seek(0)
+            screen.truncate()
+            if instrumentation is not None:
+                move = (square_to_index(event.from_square), square_to_index(event.to_square), event.promotion)
+                instrumentation.end_turn(f"{event.player} {move_name(move)}")
+
+    session.add_listener(on_event)
+
+    scripted = []
+    for name in moves:
+        move = parse_move_name(name)
+        if move is None:
+            raise ValueError(f"{name} is not a move in coordinate form")
+        scripted.append((index_to_square(move[0]), index_to_square(move[1]), move[2]))
+    for move in scripted:
+        session.move(*move)
+
+    if pgn_path is not None:
+        with open(pgn_path, encoding="utf-8", errors="replace") as file:
+            game = next(read_games(file), None)
+        for san in (game.moves if game is not None else []):
+            if session.result is not None or len(session.moves) >= plies:
+                break
+            session.move(*resolve_san(san, position_from_board(session.board_state, session.player[0])))
+
+    chooser = load_chooser(chooser_name)
+    rng = random.Random(seed)
+    while session.result is None and len(session.moves) < plies:
+        session.move(*chooser(session, rng))
+    return session
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Profile a scripted game")
+    parser.add_argument("--moves", default="", help="Moves to play first in coordinate form, e.g. \"e2e4 e7e5\"")
+    parser.add_argument("--pgn", help="PGN file whose first game's moves to play next")
+    parser.add_argument("--chooser", default="random",
+                        help="Move chooser to finish the game with (random, greedy, search or module:function)")
+    parser.add_argument("--plies", type=int, default=80, help="Most moves to play (default 80)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the chooser's random choices")
+    parser.add_argument("--profile", help="Write a cProfile (pstats) file of the game here")
+    parser.add_argument("--folded", help="Write sampled folded stacks (for flame graphs) here")
+    parser.add_argument("--report", choices=FORMATS, help="Also instrument the game and write this report")
+    parser.add_argument("--report-output", help="File to write the report to (default stderr)")
+    arguments = parser.parse_args(arguments)
+
+    # Load the modules play_scripted_game imports before profiling starts, so importing them isn't part of the profile
+    for module_name in SCRIPTED_GAME_MODULES:
+        importlib.import_module(module_name)
+
+    instrumentation = None
+    if arguments.report:
+        instrumentation = INSTRUMENTATION
+        instrumentation.enable()
+
+    profiler = cProfile.Profile() if arguments.profile else None
+    sampler = StackSampler(threading.get_ident()) if arguments.folded else None
+    if sampler is not None:
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SAMPLE_INTERVAL / 2)  # So the sampler gets to run as often as it asks to
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        session = play_scripted_game(arguments.moves.split(), arguments.pgn, arguments.chooser, arguments.plies,
+                                     arguments.seed, instrumentation)
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+            sys.setswitchinterval(switch_interval)
+        if instrumentation is not None:
+            instrumentation.disable()
+
+    print(f"Played {len(session.moves)} moves in {seconds:.2f}s, result: {session.result or 'unfinished'}")
+    if profiler is not None:
+        profiler.dump_stats(arguments.profile)
+        print(f"Wrote cProfile stats to {arguments.profile}")
+    if sampler is not None:
+        sampler.write_folded(arguments.folded)
+        print(f"Wrote {sum(sampler.samples.values())} stack samples to {arguments.folded}")
+    if instrumentation is not None:
+        write_report(instrumentation.report(), arguments.report, arguments.report_output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,12 @@
 Author: William Chio
 Created: 22/05/24
 
-Intent of this program is for a working 2 player chess game.
+Intent of this program is for a working 2 player chess game. Either player can be played by the computer instead, e.g.
+    python main.py --black computer --movetime 5
+With an opening book (see opening_book.py) the book moves are shown to human players, and can be played automatically
+for either player while the game is still in the book, e.g.
+    python main.py --black computer --book book.bin --book-play black
+To find out where the time goes, add --instrument text (see instrumentation.py).
     8 |BR|BN|BB|BK|BQ|BB|BN|BR|
     7 |BP|BP|BP|BP|BP|BP|BP|BP|
     6 |  |  |  |  |  |  |  |  |
@@ -14,59 +19,180 @@ Intent of this program is for a working 2 player chess game.
     1 |WR|WN|WB|WK|WQ|WB|WN|WR|
        A  B  C  D  E  F  G  H
 """
-import util
-from board_handler import initialise_board, perform_move
-from input_processor import input_select_piece, input_move_to
-from visuals_and_txt import clear_screen, display_board
-from util import next_player_turn
-from checkmate import find_king, is_check, player_has_no_moves, move_causes_check
+import argparse
+
+from game_session import GameSession, MOVE_MADE, MOVE_UNDONE, DRAW
+from input_processor import input_select_piece, input_move_to, get_piece_for_promotion
+from notation import square_name
+from bitboard import square_to_index, index_to_square, position_from_board
+from opening_book import OpeningBook
+from visuals_and_txt import (clear_screen, display_board, message_computer_move, message_book_move,
+                             message_book_moves)
+from checkmate import CHECK
+from instrumentation import INSTRUMENTATION, ENVIRONMENT_VARIABLE, FORMATS, from_environment, write_report
+
+
+def parse_arguments():
+    """
+    :return: Command line options choosing who plays each colour and how long the computer thinks for
+    """
+    parser = argparse.ArgumentParser(description="Chess in the terminal")
+    parser.add_argument("--white", choices=["human", "computer"], default="human", help="Who plays White")
+    parser.add_argument("--black", choices=["human", "computer"], default="human", help="Who plays Black")
+    parser.add_argument("--movetime", type=float, default=5.0,
+                        help="Seconds the computer may think for each move (default 5)")
+    parser.add_argument("--book", help="Opening book file, its moves are shown to human players")
+    parser.add_argument("--book-play", choices=["white", "black", "both"],
+                        help="Play book moves automatically for this player while there are any")
+    parser.add_argument("--instrument", choices=FORMATS,
+                        help="Time move generation, check detection and drawing, and write a report in this format "
+                             f"when the game ends (also enabled by the {ENVIRONMENT_VARIABLE} environment variable)")
+    parser.add_argument("--instrument-output", help="File to write the instrumentation report to (default stderr)")
+    arguments = parser.parse_args()
+    if arguments.book_play and not arguments.book:
+        parser.error("--book-play needs --book")
+    return arguments
+
+
+def show_event(session: GameSession, event):
+    """
+    GameSession listener that draws the board after every move and takes back
+    :param session: The game being played
+    :param event: GameEvent from the session
+    """
+    if event.kind in (MOVE_MADE, MOVE_UNDONE):
+        display_board(session.board_state)
+
+
+def end_instrumented_turn(event):
+    """
+    GameSession listener that ends the instrumentation's turn after every move and take back, once the board is drawn
+    :param event: GameEvent from the session
+    """
+    if event.kind in (MOVE_MADE, MOVE_UNDONE):
+        move = square_name(square_to_index(event.from_square)) + square_name(square_to_index(event.to_square))
+        INSTRUMENTATION.end_turn(f"{event.player} {move}" + (" undone" if event.kind == MOVE_UNDONE else ""))
+
+
+def book_moves(session: GameSession, book: OpeningBook):
+    """
+    :param session: The game being played
+    :param book: The opening book
+    :return: List of (move, weight) from the book for the current position, heaviest first
+    """
+    return book.moves(position_from_board(session.board_state, session.player[0]))
+
+
+def play_book_move(session: GameSession, book: OpeningBook):
+    """
+    Play a move from the opening book, chosen at random by the moves' weights
+    :param session: The game being played
+    :param book: The opening book
+    :return: True if a book move was played, False if the position is not in the book or the book's move is not legal
+    (e.g. a corrupt book, or a different position with the same key)
+    """
+    move = book.choose_move(position_from_board(session.board_state, session.player[0]))
+    if move is None:
+        return False
+
+    from_index, to_index, promotion = move
+    from_square, to_square = index_to_square(from_index), index_to_square(to_index)
+    if to_square not in session.legal_moves.get(from_square, ()):
+        return False
+    if session.needs_promotion(from_square, to_square) != (promotion is not None):
+        return False
+    message_book_move(session.player, session.board_state[from_square], square_name(from_index).upper(),
+                      square_name(to_index).upper())
+    session.move(from_square, to_square, promotion)
+    return True
+
+
+def play_computer_move(session: GameSession, move_time: float):
+    """
+    Search for the computer's move and play it
+    :param session: The game being played
+    :param move_time: Seconds the search may take
+    """
+    from_square, to_square, promotion, result = session.find_move(move_time)
+    message_computer_move(session.player, session.board_state[from_square],
+                          square_name(square_to_index(from_square)).upper(),
+                          square_name(square_to_index(to_square)).upper(), result.score, result.depth)
+    session.move(from_square, to_square, promotion)
+
+
+def play_human_move(session: GameSession, computer_players: dict):
+    """
+    Ask the player whose turn it is for their move and play it, or take back the last move if they ask to
+    :param session: The game being played
+    :param computer_players: Dict of player -> True if the computer plays them
+    """
+    player_turn = session.player
+    in_check = session.status == CHECK
+    if in_check:
+        print(f"{player_turn} is in Check!\n")
+    from_square, selected_piece, valid_moves = input_select_piece(player_turn, session.board_state,
+                                                                  session.legal_moves, in_check, session.can_undo())
+
+    # Takeback, undo the last move and give the turn back to the player who made it
+    if from_square is None:
+        session.undo()
+
+        # Against the computer take back its reply as well, so it is a human's turn again
+        if computer_players[session.player] and session.can_undo():
+            session.undo()
+        return
+
+    # Piece movement
+    to_square = input_move_to(player_turn, selected_piece, valid_moves, in_check)
+    promotion = get_piece_for_promotion(player_turn) if session.needs_promotion(from_square, to_square) else None
+    session.move(from_square, to_square, promotion)
+
 
 # Main run
 if __name__ == '__main__':
-    player_turn = "White"
-    checkmate = False
-    stalemate = False
-    in_check = False
-
-    board_state = initialise_board()
+    arguments = parse_arguments()
+    computer_players = {"White": arguments.white == "computer", "Black": arguments.black == "computer"}
+    book = None if arguments.book is None else OpeningBook(arguments.book)
+    book_players = {"White": arguments.book_play in ("white", "both"), "Black": arguments.book_play in ("black", "both")}
+
+    # Instrumentation is only switched on when asked for, otherwise the normal functions run untouched
+    instrument_format, instrument_output = from_environment()
+    if arguments.instrument:
+        instrument_format, instrument_output = arguments.instrument, arguments.instrument_output
+    if instrument_format:
+        INSTRUMENTATION.enable()
+
+    session = GameSession()
+    session.add_listener(lambda event: show_event(session, event))
+    if instrument_format:
+        session.add_listener(end_instrumented_turn)
     clear_screen()
-    display_board(board_state)
-
-    while not checkmate and not stalemate:
-        king = find_king(player_turn, board_state)
-        player_cant_move = player_has_no_moves(king, board_state)
-        in_check = is_check(player_turn, board_state)
-        # NO MOVE -> Check -> Checkmate
-        # No Move -> not check -> stalemate
-        # can move -> check -> have to play move that removes check
-
-        if player_cant_move:
-            if in_check: # Check + cant move = checkmate
-                checkmate = True
-
-            else: # no check + cant move = stalemate
-                stalemate = True
-
-        # Piece selection
-        if not stalemate and not checkmate:
-            if in_check:
-                print(f"{player_turn} is in Check!\n")
-            from_square, selected_piece, valid_moves = input_select_piece(player_turn, board_state, in_check)
-
-            # Piece movement
-            to_square = input_move_to(player_turn, selected_piece, valid_moves, in_check)
-
-            board_state = perform_move(board_state, from_square, to_square)
-            display_board(board_state)
-            player_turn = next_player_turn(player_turn)
-            if in_check:
-                in_check = False
-
-    print(f"Checkmate! {next_player_turn(player_turn)} is victorious!\n")
-
-
-
-
-
-
-
+    display_board(session.board_state)
+
+    try:
+        while session.result is None:
+            if book is not None and book_players[session.player] and play_book_move(session, book):
+                continue
+
+            if computer_players[session.player]:
+                play_computer_move(session, arguments.movetime)
+            else:
+                if book is not None:
+                    moves = book_moves(session, book)
+                    if moves:
+                        message_book_moves(session.player, [(square_name(from_index).upper(),
+                                                             square_name(to_index).upper(), weight)
+                                                            for (from_index, to_index, _), weight in moves])
+                play_human_move(session, computer_players)
+
+        if session.result == DRAW:
+            print("Stalemate! The game is a draw\n")
+        else:
+            print(f"Checkmate! {session.result} is victorious!\n")
+    finally:
+        # Write the report and close the book however the game ends, including being stopped part way through
+        if instrument_format:
+            INSTRUMENTATION.disable()
+            write_report(INSTRUMENTATION.report(), instrument_format, instrument_output)
+        if book is not None:
+            book.close()
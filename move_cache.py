@@ -0,0 +1,94 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Fixed size cache for the results of legal move generation, shared by everything that needs a player's legal moves so
+the same position is only ever worked out once. Entries are keyed on a position's Zobrist hash (see zobrist.py), which
+identifies the pieces on the board and the player to move in a single int.
+
+The cache works like a transposition table: it has a fixed number of slots decided by its memory ceiling and each key
+can only go in one slot (key % number of slots). Storing a new key in a slot which holds a different key replaces it,
+which is counted as an eviction. This keeps memory use bounded no matter how many positions are visited.
+
+Each slot holds its key and value together as one tuple, so threads sharing the cache (see game_server.py) always see
+a key with its own value. The counters may miss the odd update when threads race, they are only for reporting.
+"""
+
+# Rough size of one cached entry (a dict of piece squares -> legal move bitboards plus its status), used to turn a
+# memory ceiling into a number of slots
+ESTIMATED_ENTRY_BYTES = 1024
+DEFAULT_MEMORY_CEILING = 32 * 1024 * 1024
+
+
+class MoveCache:
+    """
+    Direct mapped, always replace cache of position hash -> legal move generation result, with counters for hits,
+    misses and evictions.
+    """
+    __slots__ = ("memory_ceiling", "size", "entries", "hits", "misses", "evictions")
+
+    def __init__(self, memory_ceiling: int = DEFAULT_MEMORY_CEILING):
+        """
+        :param memory_ceiling: Approximate maximum number of bytes the cached entries may use
+        """
+        self.resize(memory_ceiling)
+
+    def resize(self, memory_ceiling: int):
+        """
+        Change the memory ceiling of the cache, this empties the cache and resets its counters
+        :param memory_ceiling: Approximate maximum number of bytes the cached entries may use
+        """
+        self.memory_ceiling = memory_ceiling
+        self.size = max(1, memory_ceiling // ESTIMATED_ENTRY_BYTES)
+        self.clear()
+
+    def clear(self):
+        """
+        Empty the cache and reset its counters
+        """
+        self.entries = [None] * self.size  # (key, value) or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: int):
+        """
+        :param key: Position hash to look up
+        :return: The cached value, or None if the position is not cached
+        """
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: int, value):
+        """
+        Store a value, replacing whatever was in the key's slot
+        :param key: Position hash
+        :param value: Value to cache for the position
+        """
+        slot = key % self.size
+        entry = self.entries[slot]
+        if entry is not None and entry[0] != key:
+            self.evictions += 1
+        self.entries[slot] = (key, value)
+
+    def stats(self):
+        """
+        :return: Dict of the cache's counters and how full it is
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self.size - self.entries.count(None),
+                "slots": self.size,
+                "memory_ceiling": self.memory_ceiling}
+
+
+# Cache shared by main.py, input_processor.py and checkmate.py
+MOVE_CACHE = MoveCache()
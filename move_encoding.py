@@ -0,0 +1,139 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Moves packed into a 16 bit int, so lists of moves can be kept in array("H") buffers rather than lists of tuples:
+    bits 0-5    from square index (see bitboard.py)
+    bits 6-11   to square index
+    bits 12-14  promotion piece: 0 for none, then Queen, Rook, Bishop, Knight
+    bit 15      set if the move captures a piece
+A move can't go from a8 to a8, so 0 is never a real move and stands for no move. transposition_table.py stores best
+moves in this form too.
+
+A MoveStack is one buffer split into a block of MAX_MOVES slots per ply. A depth first search (e.g. perft.py)
+generates the moves of the position at each ply into that ply's block with piece_moves.generate_packed_moves, so the
+same memory is reused at every position instead of building a new list each time.
+
+The helpers at the bottom turn packed moves into the (row, col) squares used by board_handler.py and
+input_processor.py.
+"""
+from array import array
+
+from bitboard import square_to_index, index_to_square
+
+PROMOTION_CODES = (None, "Q", "R", "B", "N")
+PROMOTION_SHIFT = 12
+CAPTURE_FLAG = 1 << 15
+NO_MOVE = 0
+
+# More than the most legal moves any position has (218)
+MAX_MOVES = 256
+DEFAULT_MAX_PLY = 64
+
+
+def encode_move(from_index: int, to_index: int, promotion: str = None, capture: bool = False):
+    """
+    :param from_index: Square index the piece moves from
+    :param to_index: Square index the piece moves to
+    :param promotion: Piece type a pawn is promoted to (e.g. "Q"), None if the move is not a promotion
+    :param capture: Whether the move captures a piece
+    :return: The move packed into 16 bits
+    """
+    return (from_index | to_index << 6 | PROMOTION_CODES.index(promotion) << PROMOTION_SHIFT
+            | (CAPTURE_FLAG if capture else 0))
+
+
+def decode_move(move: int):
+    """
+    :param move: Move packed by encode_move
+    :return: (from index, to index, promotion piece type or None), or None for NO_MOVE
+    """
+    if move == NO_MOVE:
+        return None
+    return move & 63, move >> 6 & 63, PROMOTION_CODES[move >> PROMOTION_SHIFT & 7]
+
+
+def is_capture(move: int):
+    """
+    :param move: Move packed by encode_move
+    :return: True if the move captures a piece
+    """
+    return bool(move & CAPTURE_FLAG)
+
+
+def make_packed_move(position, move: int):
+    """
+    Perform a packed move on a position in place, to be taken back with position.unmake_move
+    :param position: The position to move in
+    :param move: Move packed by encode_move
+    """
+    position.make_move(move & 63, move >> 6 & 63, PROMOTION_CODES[move >> PROMOTION_SHIFT & 7])
+
+
+class MoveStack:
+    """
+    One preallocated array("H") of MAX_MOVES slots for each ply, to generate moves into during a search
+    """
+    __slots__ = ("max_ply", "buffer")
+
+    def __init__(self, max_ply: int = DEFAULT_MAX_PLY):
+        """
+        :param max_ply: Number of plies to make room for
+        """
+        self.max_ply = max_ply
+        self.buffer = array("H", bytes(2 * MAX_MOVES * max_ply))
+
+    def generate(self, position, ply: int):
+        """
+        Generate the legal moves of a position into a ply's block, replacing what was there
+        :param position: The position to generate moves for
+        :param ply: Ply to store the moves at, from 0 to max_ply - 1
+        :return: (start, end) slots of the moves in buffer
+        """
+        from piece_moves import generate_packed_moves  # Import here to avoid circular import issue
+        start = ply * MAX_MOVES
+        return start, generate_packed_moves(position, self.buffer, start)
+
+    def moves(self, ply: int, end: int):
+        """
+        :param ply: Ply the moves were generated at
+        :param end: End slot returned by generate
+        :return: The ply's moves as a list of packed moves
+        """
+        return self.buffer[ply * MAX_MOVES:end].tolist()
+
+
+def move_to_squares(move: int):
+    """
+    :param move: Move packed by encode_move
+    :return: (from square, to square, promotion piece type or None) with squares as (row, col)
+    """
+    from_index, to_index, promotion = decode_move(move)
+    return index_to_square(from_index), index_to_square(to_index), promotion
+
+
+def squares_to_move(from_square: (int, int), to_square: (int, int), promotion: str = None, capture: bool = False):
+    """
+    :param from_square: Square the piece moves from as (row, col)
+    :param to_square: Square the piece moves to as (row, col)
+    :param promotion: Piece type a pawn is promoted to, None if the move is not a promotion
+    :param capture: Whether the move captures a piece
+    :return: The move packed into 16 bits
+    """
+    return encode_move(square_to_index(from_square), square_to_index(to_square), promotion, capture)
+
+
+def moves_to_dict(moves):
+    """
+    :param moves: Iterable of packed moves, e.g. a slice of a MoveStack's buffer
+    :return: Dict of square with a piece that can move -> list of squares it can move to, as made by
+    piece_moves.generate_all_legal_moves and used by input_processor.py. Promotions to different pieces are one move
+    """
+    legal_moves = {}
+    for move in moves:
+        from_square = index_to_square(move & 63)
+        to_square = index_to_square(move >> 6 & 63)
+        targets = legal_moves.setdefault(from_square, [])
+        if not targets or targets[-1] != to_square:
+            targets.append(to_square)
+    return legal_moves
@@ -0,0 +1,51 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Converts squares and moves between their square index form (see bitboard.py) and text. Squares are written in
+lowercase algebraic form (e.g. "e2") and moves in coordinate form, the from square followed by the to square and the
+promotion piece if there is one (e.g. "e2e4", "b7b8q"), as used by perft output and chess engine protocols.
+"""
+
+FILES = "abcdefgh"
+
+
+def square_name(index: int):
+    """
+    :param index: Square index
+    :return: Square in algebraic form, e.g. 0 -> "a8", 63 -> "h1"
+    """
+    row, col = divmod(index, 8)
+    return FILES[col] + str(8 - row)
+
+
+def parse_square_name(name: str):
+    """
+    :param name: Square in algebraic form (e.g. "e2"), either case
+    :return: Square index, or None if the text is not a square on the board
+    """
+    if len(name) != 2 or name[0].lower() not in FILES or name[1] not in "12345678":
+        return None
+    return (8 - int(name[1])) * 8 + FILES.index(name[0].lower())
+
+
+def move_name(move: tuple):
+    """
+    :param move: (from index, to index, promotion piece type or None)
+    :return: Move in coordinate form, e.g. "e2e4" or "b7b8q"
+    """
+    from_index, to_index, promotion = move
+    return square_name(from_index) + square_name(to_index) + (promotion.lower() if promotion else "")
+
+
+def parse_move_name(name: str):
+    """
+    :param name: Move in coordinate form, e.g. "e2e4" or "b7b8q"
+    :return: (from index, to index, promotion piece type or None), or None if the text is not a move
+    """
+    from_index = parse_square_name(name[0:2])
+    to_index = parse_square_name(name[2:4])
+    promotion = name[4:].upper() or None
+    if from_index is None or to_index is None or promotion not in (None, "Q", "R", "B", "N"):
+        return None
+    return from_index, to_index, promotion
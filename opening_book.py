@@ -0,0 +1,221 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Opening book: a file of well known moves for positions early in the game, so they can be played straight away without
+searching. The file uses the same layout as a Polyglot book, a sorted list of 16 byte entries (big-endian):
+    key     8 bytes  Zobrist hash of the position (see zobrist.py)
+    move    2 bytes  to file | to rank << 3 | from file << 6 | from rank << 9 | promotion << 12
+    weight  2 bytes  how good the move is thought to be, relative to the other moves for the position
+    learn   4 bytes  unused, always 0
+Ranks and files count from 0 at rank 1 and file a, and promotion is 0 for none then knight, bishop, rook, queen.
+The keys are this program's own Zobrist hashes rather than the Polyglot ones (castling and en passant are not part of
+the rules yet), so books must be built with this module to be used.
+
+The book is opened with mmap and searched with a binary search over the entries, so looking up a position reads a few
+entries straight from the file rather than loading the book into Python objects.
+
+Usage:
+    python opening_book.py build games.pgn --output book.bin --max-plies 20
+    python opening_book.py probe book.bin --fen "<FEN>"
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from bitboard import square_to_index
+from board_handler import initialise_position, perform_move
+from fen import position_from_fen, START_FEN
+from notation import move_name
+from pgn import read_games, resolve_san, SanError
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+DEFAULT_MAX_PLIES = 20
+
+PROMOTION_CODES = (None, "N", "B", "R", "Q")
+
+# Weight given to a move for each result of the game it was played in, from the point of view of the player moving
+RESULT_WEIGHTS = {"win": 2, "draw": 1, "loss": 0}
+
+
+def encode_move(move: tuple):
+    """
+    :param move: (from index, to index, promotion piece type or None)
+    :return: The move packed into 16 bits as in a Polyglot book
+    """
+    from_index, to_index, promotion = move
+    from_row, from_col = divmod(from_index, 8)
+    to_row, to_col = divmod(to_index, 8)
+    return (to_col | (7 - to_row) << 3 | from_col << 6 | (7 - from_row) << 9
+            | PROMOTION_CODES.index(promotion) << 12)
+
+
+def decode_move(packed: int):
+    """
+    :param packed: Move packed by encode_move
+    :return: (from index, to index, promotion piece type or None)
+    """
+    to_index = (7 - (packed >> 3 & 7)) * 8 + (packed & 7)
+    from_index = (7 - (packed >> 9 & 7)) * 8 + (packed >> 6 & 7)
+    return from_index, to_index, PROMOTION_CODES[packed >> 12 & 7]
+
+
+class OpeningBook:
+    """
+    An opening book file opened for lookups. Use in a with statement, or call close when done.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The book file
+        :raises ValueError: If the file is not a whole number of entries
+        """
+        self.file = open(path, "rb")
+        size = self.file.seek(0, 2)
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError(f"{path} is not an opening book, its size is not a multiple of {ENTRY.size} bytes")
+
+        self.size = size // ENTRY.size
+        # An empty file can't be mapped, but then there is nothing to look up anyway
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def first_entry(self, key: int):
+        """
+        Binary search for the first entry with a key
+        :param key: Position hash
+        :return: Number of the first entry with the key, or of the entry the key would go before if there is none
+        """
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moves(self, position):
+        """
+        :param position: The position to look up
+        :return: List of (move, weight) for the position, heaviest first, empty if the position is not in the book.
+        Moves are (from index, to index, promotion piece type or None)
+        """
+        key = position.zobrist
+        moves = []
+        entry = self.first_entry(key)
+        while entry < self.size:
+            entry_key, packed, weight, _ = ENTRY.unpack_from(self.data, entry * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((decode_move(packed), weight))
+            entry += 1
+
+        return sorted(moves, key=lambda move: -move[1])
+
+    def choose_move(self, position, rng=random):
+        """
+        Pick a book move at random, in proportion to the moves' weights
+        :param position: The position to pick a move for
+        :param rng: Source of randomness, e.g. random.Random(seed) for repeatable choices
+        :return: (from index, to index, promotion piece type or None), or None if the position is not in the book
+        """
+        moves = [(move, weight) for move, weight in self.moves(position) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+
+def build_book(lines, output_path: str, max_plies: int = DEFAULT_MAX_PLIES):
+    """
+    Build an opening book from PGN games. Every move in the first max_plies moves of each game is added, weighted by
+    how the game went for the player who made it. Games stop being read at a move that can't be played.
+    :param lines: Iterable of lines of PGN, e.g. an open file
+    :param output_path: File to write the book to
+    :param max_plies: Number of moves from the start of each game to add
+    :return: (number of games read, number of entries written)
+    """
+    weights = {}  # (key, packed move) -> weight
+    games = 0
+    for game in read_games(lines):
+        games += 1
+        white_result = {"1-0": "win", "0-1": "loss", "1/2-1/2": "draw"}.get(game.result)
+        if white_result is None:
+            continue  # Unfinished game, no way to tell if the moves were good
+        black_result = {"win": "loss", "loss": "win", "draw": "draw"}[white_result]
+
+        try:
+            position = position_from_fen(game.tags["FEN"]) if "FEN" in game.tags else initialise_position()
+        except ValueError:
+            continue
+
+        for san in game.moves[:max_plies]:
+            try:
+                from_square, to_square, promotion = resolve_san(san, position)
+            except SanError:
+                break
+
+            move = (square_to_index(from_square), square_to_index(to_square), promotion)
+            entry = (position.zobrist, encode_move(move))
+            result = white_result if position.player == "W" else black_result
+            weights[entry] = weights.get(entry, 0) + RESULT_WEIGHTS[result]
+
+            perform_move(position, from_square, to_square, promotion=promotion)
+            position.pass_turn()
+
+    with open(output_path, "wb") as file:
+        for key, packed in sorted(weights):
+            file.write(ENTRY.pack(key, packed, min(weights[key, packed], MAX_WEIGHT), 0))
+
+    return games, len(weights)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Build or look up an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build a book from PGN games")
+    build.add_argument("pgn", help="PGN file, or - to read from stdin")
+    build.add_argument("--output", default="book.bin", help="Book file to write (default book.bin)")
+    build.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES,
+                       help=f"Number of moves from the start of each game to add (default {DEFAULT_MAX_PLIES})")
+
+    probe = commands.add_parser("probe", help="Show the book moves for a position")
+    probe.add_argument("book", help="Book file")
+    probe.add_argument("--fen", default=START_FEN, help="Position to look up (default is the starting position)")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == "build":
+        lines = sys.stdin if arguments.pgn == "-" else open(arguments.pgn, encoding="utf-8", errors="replace")
+        try:
+            games, entries = build_book(lines, arguments.output, arguments.max_plies)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        print(f"Read {games} games, wrote {entries} entries to {arguments.output}")
+    else:
+        with OpeningBook(arguments.book) as book:
+            moves = book.moves(position_from_fen(arguments.fen))
+        for move, weight in moves:
+            print(f"{move_name(move)} {weight}")
+        if not moves:
+            print("Position is not in the book")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Best move search spread across several processes. Python only runs one thread at a time within a process, so to use
+more than one core the moves available at the root of the search are split between a pool of worker processes. Each
+worker plays its root move and searches the position after it (see search.py), then the results are merged to pick
+the best move and line.
+
+Every root move is searched with a full window so its score is exact, which gives up some of the cut offs a single
+alpha-beta search would get in exchange for the work being independent. Iterative deepening happens over the whole
+pool: each depth waits for all root moves to finish, and the best move of the previous depth is sent out first.
+Workers share one transposition table in shared memory (see transposition_table.py), so a position one worker has
+searched, or that was searched at the previous depth, isn't searched again.
+
+Usage:
+    python parallel_search.py --fen "<FEN>" --workers 4 --movetime 10
+    python parallel_search.py --benchmark --depth 3 --workers 4
+The benchmark searches a fixed set of middlegame positions to a fixed depth with 1, 2, 4 ... workers and reports the
+nodes per second and speed up for each worker count.
+"""
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+from fen import position_from_fen
+from notation import move_name
+from piece_moves import generate_legal_moves
+from search import Search, SearchResult, SearchTimeout, order_moves, MATE_SCORE, MAX_DEPTH
+from checkmate import is_check
+from transposition_table import TranspositionTable, DEFAULT_MEMORY_SIZE
+
+BENCHMARK_FENS = [
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w - - 0 8",
+    "r2q1rk1/1b2bppp/p2ppn2/1p6/3NP3/1BN1B3/PPP2PPP/R2Q1RK1 w - - 0 11",
+    "2rq1rk1/pb1nbppp/1p2pn2/2pp4/2PP4/1PN1PN2/PB2BPPP/2RQ1RK1 w - - 0 11",
+]
+
+# Transposition table of this worker process, set when the process starts by attach_table
+worker_table = None
+
+
+def attach_table(table):
+    """
+    Pool initializer: keep the shared transposition table for the worker's searches
+    :param table: TranspositionTable shared by every worker, or None to search without one
+    """
+    global worker_table
+    worker_table = table
+
+
+def create_pool(workers: int = None, table=None):
+    """
+    :param workers: Number of worker processes, defaults to the number of cores
+    :param table: TranspositionTable for the workers to share, None to search without one
+    :return: A Pool of worker processes ready for parallel_search
+    """
+    return Pool(workers or os.cpu_count(), initializer=attach_table, initargs=(table,))
+
+
+def search_root_move(task: tuple):
+    """
+    Worker process job: play one root move and search the position after it
+    :param task: (position, move, depth, deadline) where deadline is a time.time() value or None
+    :return: (move, score for the player at the root, line starting with the move, nodes searched), score and line
+    are None if the deadline passed before the search finished
+    """
+    position, move, depth, deadline = task
+
+    # Deadlines are shared as wall clock time as perf_counter values can't be compared between processes
+    local_deadline = None if deadline is None else time.perf_counter() + (deadline - time.time())
+    searcher = Search(position, local_deadline, table=worker_table)
+
+    position.make_move(*move)
+    try:
+        score, line = searcher.negamax(depth - 1, 1, -MATE_SCORE - 1, MATE_SCORE + 1)
+    except SearchTimeout:
+        return move, None, None, searcher.nodes
+
+    return move, -score, [move] + line, searcher.nodes
+
+
+def parallel_search(position, workers: int = None, time_limit: float = None, max_depth: int = MAX_DEPTH,
+                    pool=None, report=None, table_size: int = DEFAULT_MEMORY_SIZE):
+    """
+    Find the best move in a position with the root moves split across a pool of worker processes
+    :param position: The position to search
+    :param workers: Number of worker processes, defaults to the number of cores. Ignored if a pool is given
+    :param time_limit: Seconds the search may take, None for no time limit
+    :param max_depth: Deepest depth to search to
+    :param pool: Pool from create_pool to use, so repeated searches don't start new processes (and keep their
+    transposition table) every time
+    :param report: Function called with the SearchResult of every finished depth
+    :param table_size: Bytes of shared memory for the transposition table, when no pool is given
+    :return: SearchResult of the deepest finished depth, nodes counts the positions searched by every worker
+    """
+    start = time.perf_counter()
+    deadline = None if time_limit is None else time.time() + time_limit
+
+    moves = generate_legal_moves(position)
+    if not moves:
+        score = -MATE_SCORE if is_check(position.player, position) else 0
+        return SearchResult(None, score, [], 0, 0, 0.0)
+
+    own_pool = pool is None
+    if own_pool:
+        table = TranspositionTable(table_size)
+        pool = create_pool(workers, table)
+
+    result = SearchResult(order_moves(position, moves)[0], 0, [], 0, 0, 0.0)
+    nodes = 0
+    try:
+        for depth in range(1, max_depth + 1):
+            # Previous depth's best move first so it is finished first, then the rest in the usual search order
+            tasks = [(position, move, depth, deadline) for move in order_moves(position, moves, result.move)]
+
+            best_score = None
+            best_line = None
+            finished = True
+            for move, score, line, move_nodes in pool.imap_unordered(search_root_move, tasks):
+                nodes += move_nodes
+                if score is None:
+                    finished = False
+                elif best_score is None or score > best_score or (score == best_score and move == result.move):
+                    best_score, best_line = score, line
+
+            if not finished:
+                break  # Out of time, keep the last depth where every root move was searched
+
+            result = SearchResult(best_line[0], best_score, best_line, depth, nodes, time.perf_counter() - start)
+            if report is not None:
+                report(result)
+
+            if abs(best_score) >= MATE_SCORE - MAX_DEPTH or (deadline is not None and time.time() >= deadline):
+                break
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+            table.close()
+
+    return result._replace(nodes=nodes, seconds=time.perf_counter() - start)
+
+
+def benchmark(depth: int, max_workers: int):
+    """
+    Search every benchmark position to a fixed depth with 1, 2, 4 ... max_workers workers, printing how the nodes per
+    second scales with the number of workers. Each worker count starts with an empty transposition table.
+    :param depth: Depth to search each position to
+    :param max_workers: Most workers to try
+    :return: List of (workers, nodes, seconds) for each worker count
+    """
+    worker_counts = []
+    workers = 1
+    while workers < max_workers:
+        worker_counts.append(workers)
+        workers *= 2
+    worker_counts.append(max_workers)
+
+    results = []
+    for workers in worker_counts:
+        with TranspositionTable() as table, create_pool(workers, table) as pool:
+            start = time.perf_counter()
+            nodes = 0
+            for fen in BENCHMARK_FENS:
+                nodes += parallel_search(position_from_fen(fen), max_depth=depth, pool=pool).nodes
+            seconds = time.perf_counter() - start
+
+        results.append((workers, nodes, seconds))
+        speed_up = (nodes / seconds) / (results[0][1] / results[0][2])
+        print(f"{workers} workers: {nodes} nodes in {seconds:.2f}s ({nodes / seconds:,.0f} nodes/s, "
+              f"{speed_up:.2f}x speed up)")
+
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Search for the best move using several processes")
+    parser.add_argument("--fen", default="r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                        help="Position to search")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--movetime", type=float, help="Seconds to search for")
+    parser.add_argument("--depth", type=int, help="Depth to search to")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure nodes per second scaling from 1 worker up to --workers")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.benchmark:
+        benchmark(arguments.depth or 3, arguments.workers)
+        return
+
+    def report(result):
+        line = " ".join(move_name(move) for move in result.principal_variation)
+        print(f"depth {result.depth} score {result.score} nodes {result.nodes} "
+              f"nps {result.nodes / max(result.seconds, 1e-9):,.0f} pv {line}")
+
+    time_limit = arguments.movetime if arguments.movetime is not None or arguments.depth else 10.0
+    result = parallel_search(position_from_fen(arguments.fen), arguments.workers, time_limit,
+                             arguments.depth or MAX_DEPTH, report=report)
+    print(f"bestmove {move_name(result.move)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Perft (performance test) for move generation. Perft counts every position reachable in exactly a given number of
+moves, which is compared against known counts to check the move generator is correct and timed to measure how fast it
+is. Divide gives the count after each first move, which narrows down where a wrong count comes from.
+
+Castling and en passant are not part of the rules yet, so the suite only uses positions and depths where neither can
+happen, where the known counts are the same as for full chess rules.
+
+Usage:
+    python perft.py --depth 4                       Perft from the starting position
+    python perft.py --fen "<FEN>" --depth 3 --divide
+    python perft.py --suite --json perft_results.jsonl
+Results are printed and, with --json, appended to a file as one JSON object per line so throughput can be tracked
+across changes.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from board_handler import initialise_position
+from fen import position_from_fen
+from move_encoding import MoveStack, make_packed_move
+from notation import move_name
+from piece_moves import generate_legal_moves
+
+# (name, FEN, {depth: known node count})
+PERFT_SUITE = [
+    ("Starting position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("Middlegame with pins", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    ("Rook and pawn ending", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191}),
+    ("Promotions", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+     {1: 24, 2: 496, 3: 9483, 4: 182838}),
+    ("Stalemate and checkmate", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {4: 23527}),
+    ("Pawn promotes with check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {6: 92683}),
+    ("King and pawn versus king", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     {6: 2217}),
+]
+
+
+def perft(position, depth: int, stack: MoveStack = None, ply: int = 0):
+    """
+    Count the positions reachable from a position in exactly depth moves. Moves are made and unmade on the position in
+    place, so it is left as it was. The moves at each ply are generated as 16 bit moves into a MoveStack (see
+    move_encoding.py) rather than new lists.
+    :param position: The position to count from
+    :param depth: Number of moves (plies) to look ahead
+    :param stack: MoveStack with room for depth more plies after ply, made if not given
+    :param ply: Ply of the stack to generate this position's moves at
+    :return: Number of positions at that depth
+    """
+    if depth == 0:
+        return 1
+    if stack is None:
+        stack = MoveStack(depth)
+
+    start, end = stack.generate(position, ply)
+    if depth == 1:
+        return end - start  # No need to make the last moves just to count them
+
+    nodes = 0
+    buffer = stack.buffer
+    for slot in range(start, end):
+        make_packed_move(position, buffer[slot])
+        nodes += perft(position, depth - 1, stack, ply + 1)
+        position.unmake_move()
+
+    return nodes
+
+
+def divide(position, depth: int):
+    """
+    Perft split up by the first move
+    :param position: The position to count from
+    :param depth: Number of moves (plies) to look ahead, including the first move
+    :return: Dict of first move in coordinate form (e.g. "e2e4") -> number of positions at that depth after it
+    """
+    counts = {}
+    for move in generate_legal_moves(position):
+        position.make_move(*move)
+        counts[move_name(move)] = perft(position, depth - 1)
+        position.unmake_move()
+
+    return counts
+
+
+def timed_perft(name: str, fen: str, depth: int, expected: int = None, show_divide=False):
+    """
+    Run and time perft for a position, printing the result
+    :param name: Name of the position for the report
+    :param fen: The position in FEN, or None for the starting position
+    :param depth: Number of moves (plies) to look ahead
+    :param expected: Known node count to check against, if there is one
+    :param show_divide: Print the count after each first move
+    :return: Dict with the result, ready to be written as JSON
+    """
+    position = initialise_position() if fen is None else position_from_fen(fen)
+
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(position, depth)
+    seconds = time.perf_counter() - start
+    nodes_per_second = nodes / seconds if seconds else 0.0
+
+    if counts:
+        for move, count in sorted(counts.items()):
+            print(f"{move}: {count}")
+        print(f"Moves: {len(counts)}")
+
+    passed = expected is None or nodes == expected
+    check = "" if expected is None else (" OK" if passed else f" FAILED (expected {expected})")
+    print(f"{name} depth {depth}: {nodes} nodes in {seconds:.3f}s ({nodes_per_second:,.0f} nodes/s){check}")
+
+    return {"name": name,
+            "fen": fen,
+            "depth": depth,
+            "nodes": nodes,
+            "expected": expected,
+            "passed": passed,
+            "seconds": round(seconds, 6),
+            "nodes_per_second": round(nodes_per_second, 1)}
+
+
+def write_results(path: str, results: list):
+    """
+    Append results to a JSON lines file, with when and where they were run
+    :param path: File to append to
+    :param results: Result dicts from timed_perft
+    """
+    run_info = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine()}
+    with open(path, "a") as file:
+        for result in results:
+            file.write(json.dumps({**run_info, **result}) + "\n")
+
+
+def run_suite(max_depth: int = None):
+    """
+    Run perft on every position in the suite at every depth with a known count
+    :param max_depth: Skip depths deeper than this
+    :return: List of result dicts
+    """
+    results = []
+    for name, fen, known_counts in PERFT_SUITE:
+        for depth, expected in sorted(known_counts.items()):
+            if max_depth is None or depth <= max_depth:
+                results.append(timed_perft(name, fen, depth, expected))
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Count and time move generation (perft)")
+    parser.add_argument("--depth", type=int, default=3, help="Number of moves to look ahead (default 3)")
+    parser.add_argument("--fen", help="Position to start from (default is the starting position)")
+    parser.add_argument("--divide", action="store_true", help="Show the count after each first move")
+    parser.add_argument("--suite", action="store_true",
+                        help="Check every position in the suite against its known counts")
+    parser.add_argument("--max-depth", type=int, help="With --suite, skip depths deeper than this")
+    parser.add_argument("--json", help="Append results to this file as JSON lines")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.suite:
+        results = run_suite(arguments.max_depth)
+    else:
+        results = [timed_perft(arguments.fen or "Starting position", arguments.fen, arguments.depth,
+                               show_divide=arguments.divide)]
+
+    if arguments.json:
+        write_results(arguments.json, results)
+
+    # Non-zero exit code if any count is wrong so this can be used as a regression check
+    return 0 if all(result["passed"] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
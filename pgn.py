@@ -0,0 +1,347 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Reads games in Portable Game Notation (PGN) and replays them through the rules, to check the rules against real games
+and to pull positions out of them. A PGN game is a set of tag pairs followed by the moves in Standard Algebraic
+Notation (SAN), e.g.
+    [White "Morphy, Paul"]
+    [Black "Duke Karl / Count Isouard"]
+    [Result "1-0"]
+
+    1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move} 4. dxe5 Bxf3 ...
+
+read_games is a generator that reads one game at a time from any iterable of lines (e.g. an open file), so only the
+game being replayed is ever held in memory however large the file is. Comments, variations and annotation glyphs
+are skipped.
+
+Each SAN move is matched to a piece by asking determine_valid_moves (see piece_moves.py) which of the player's
+pieces of that type can move to the square, then played with perform_move (see board_handler.py). A move is reported
+with its game, ply and position when no piece can make it (illegal) or more than one can (ambiguous). Castling and en
+passant are not part of the rules yet so games using them are reported as unsupported at that move.
+
+san_move and write_game go the other way, writing moves in SAN and games as PGN.
+
+Usage:
+    python pgn.py games.pgn
+    python pgn.py games.pgn --positions positions.fen     Also write the FEN of every position reached
+Prints each problem found and a summary with the number of games replayed per second.
+"""
+import argparse
+import re
+import sys
+import time
+from collections import namedtuple
+
+from bitboard import iterate_indexes, index_to_square, square_to_index
+from board_handler import initialise_position, perform_move
+from checkmate import is_check
+from fen import position_from_fen, position_to_fen
+from notation import FILES, square_name, parse_square_name
+from piece_moves import determine_valid_moves, generate_legal_moves
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+# A game as read from PGN, moves are the SAN moves in the order played and line_number is the line the game starts on
+PgnGame = namedtuple("PgnGame", ["tags", "moves", "result", "line_number"])
+
+# A move that couldn't be replayed
+MoveProblem = namedtuple("MoveProblem", ["game_number", "ply", "san", "reason", "fen"])
+
+
+class SanError(ValueError):
+    """
+    Raised when a SAN move can't be played in a position, with the reason as its message
+    """
+
+
+def tokenise(line: str, state: tuple):
+    """
+    Split a line of movetext into tokens, dropping comments, variations and annotation glyphs
+    :param line: Line of movetext
+    :param state: (inside a {} comment, how many variations deep) at the start of the line, as comments and
+    variations can carry on over several lines. (False, 0) for the first line
+    :return: (list of tokens, state at the end of the line)
+    """
+    in_comment, variation_depth = state
+    tokens = []
+    token = ""
+    for char in line:
+        if in_comment:
+            in_comment = char != "}"
+            continue
+        if char == "{":
+            in_comment = True
+        elif char == "(":
+            variation_depth += 1
+        elif char == ")" and variation_depth:
+            variation_depth -= 1
+        elif char == ";":
+            break  # Comment to the end of the line
+        elif not char.isspace():
+            if not variation_depth:
+                token += char
+            continue
+
+        if token:
+            tokens.append(token)
+        token = ""
+
+    if token:
+        tokens.append(token)
+
+    # Move numbers can be written against the move (e.g. "1.e4"), glyphs ($1) and move numbers are dropped
+    cleaned = []
+    for token in tokens:
+        token = MOVE_NUMBER_PATTERN.sub("", token)
+        if token and not token.startswith("$"):
+            cleaned.append(token)
+
+    return cleaned, (in_comment, variation_depth)
+
+
+def read_games(lines):
+    """
+    Read PGN games one at a time
+    :param lines: Iterable of lines of PGN, e.g. an open file
+    :return: Generator of PgnGame, one for each game in the order they appear
+    """
+    tags = {}
+    moves = []
+    state = (False, 0)
+    start_line = None
+    in_movetext = False
+
+    for line_number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if state == (False, 0) and stripped.startswith("["):
+            if in_movetext:
+                # A new tag section without a result at the end of the last game, finish that game anyway
+                yield PgnGame(tags, moves, "*", start_line)
+                tags, moves, in_movetext, start_line = {}, [], False, None
+            match = TAG_PATTERN.match(stripped)
+            if match:
+                tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            start_line = start_line or line_number
+            continue
+        if stripped.startswith("%"):
+            continue  # Escaped line
+
+        tokens, state = tokenise(line, state)
+        for token in tokens:
+            start_line = start_line or line_number
+            in_movetext = True
+            if token in RESULTS:
+                yield PgnGame(tags, moves, token, start_line)
+                tags, moves, in_movetext, start_line = {}, [], False, None
+            else:
+                moves.append(token)
+
+    if in_movetext or tags:
+        yield PgnGame(tags, moves, "*", start_line)
+
+
+def resolve_san(san: str, position):
+    """
+    Work out which move a SAN move is in a position
+    :param san: The move in SAN, e.g. "Nbd7", "exd5", "e8=Q+"
+    :param position: The position the move is played in, position.player is the player making the move
+    :return: (from square, to square, promotion piece type or None)
+    :raises SanError: If the move isn't SAN, isn't legal, could be made by more than one piece or isn't supported
+    """
+    if san.rstrip("+#!?") in ("O-O", "O-O-O", "0-0", "0-0-0"):
+        raise SanError("Castling is not supported")
+
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        raise SanError("Not a SAN move")
+    piece_type, from_file, from_rank, capture, to_name, promotion = match.groups()
+    if piece_type is None:
+        piece_type = "P"
+        from_file = from_file or (None if capture else to_name[0])  # Pawns only change file when capturing
+    to_index = parse_square_name(to_name)
+    to_square = index_to_square(to_index)
+
+    if piece_type == "P" and capture and position.mailbox[to_index] is None:
+        raise SanError("En passant is not supported")
+    if piece_type == "P" and (to_index < 8 or to_index >= 56) and promotion is None:
+        raise SanError("Pawn reaches the last row without a promotion piece")
+    if promotion is not None and (piece_type != "P" or 8 <= to_index < 56):
+        raise SanError("Only a pawn reaching the last row can promote")
+
+    candidates = []
+    for index in iterate_indexes(position.bitboards[position.player + piece_type]):
+        square = index_to_square(index)
+        if from_file is not None and FILES.index(from_file) != square[1]:
+            continue
+        if from_rank is not None and 8 - int(from_rank) != square[0]:
+            continue
+        if to_square in determine_valid_moves(square, position):
+            candidates.append(square)
+
+    if not candidates:
+        raise SanError("Illegal move")
+    if len(candidates) > 1:
+        raise SanError(f"Ambiguous move, {len(candidates)} pieces can make it")
+
+    return candidates[0], to_square, promotion
+
+
+def san_move(position, from_square: (int, int), to_square: (int, int), promotion: str = None):
+    """
+    Write a legal move in SAN, the reverse of resolve_san
+    :param position: The position the move is played in, position.player is the player making the move
+    :param from_square: Square of the piece to move
+    :param to_square: Square the piece moves to
+    :param promotion: Piece type a pawn promotes to, None if the move is not a promotion
+    :return: The move in SAN, e.g. "Nbd7", "exd5", "e8=Q+"
+    """
+    from_index = square_to_index(from_square)
+    to_index = square_to_index(to_square)
+    piece_type = position.mailbox[from_index][1]
+    capture = "x" if position.mailbox[to_index] is not None else ""
+
+    if piece_type == "P":
+        san = (square_name(from_index)[0] + capture if capture else "") + square_name(to_index)
+        san += f"={promotion}" if promotion else ""
+    else:
+        # Name the file, rank or both of the piece moving when another piece of the same type can move there too
+        others = [index_to_square(index) for index in iterate_indexes(position.bitboards[position.mailbox[from_index]])
+                  if index != from_index and to_square in determine_valid_moves(index_to_square(index), position)]
+        from_name = square_name(from_index)
+        if not others:
+            disambiguation = ""
+        elif all(square[1] != from_square[1] for square in others):
+            disambiguation = from_name[0]
+        elif all(square[0] != from_square[0] for square in others):
+            disambiguation = from_name[1]
+        else:
+            disambiguation = from_name
+        san = piece_type + disambiguation + capture + square_name(to_index)
+
+    position.make_move(from_index, to_index, promotion)
+    if is_check(position.player, position):
+        san += "#" if not generate_legal_moves(position) else "+"
+    position.unmake_move()
+
+    return san
+
+
+def write_game(tags: dict, sans: list, result: str, start_fen: str = None):
+    """
+    Write a game as PGN
+    :param tags: Tag pairs for the game, e.g. {"White": "random", "Black": "greedy"}. Result is always set from result
+    :param sans: The moves in SAN
+    :param result: "1-0", "0-1", "1/2-1/2" or "*"
+    :param start_fen: FEN of the starting position, None for the usual starting position
+    :return: The game as PGN text, ending with a blank line
+    """
+    tags = {**tags, "Result": result}
+    if start_fen is not None:
+        tags.update({"SetUp": "1", "FEN": start_fen})
+    lines = [f'[{name} "{value}"]' for name, value in tags.items()]
+    lines.append("")
+
+    # Move numbers count from the FEN's move number, with "n..." if black moves first
+    fields = start_fen.split() if start_fen else []
+    move_number = int(fields[5]) if len(fields) > 5 else 1
+    black_first = len(fields) > 1 and fields[1] == "b"
+
+    tokens = []
+    for ply, san in enumerate(sans):
+        white_move = (ply % 2 == 0) != black_first
+        if white_move:
+            tokens.append(f"{move_number}.")
+        elif ply == 0:
+            tokens.append(f"{move_number}...")
+        tokens.append(san)
+        if not white_move:
+            move_number += 1
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if len(line) + len(token) + 1 > 80:
+            lines.append(line)
+            line = ""
+        line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return "\n".join(lines) + "\n\n"
+
+
+def replay_game(game: PgnGame, game_number: int, on_position=None):
+    """
+    Play through a game's moves from its starting position, stopping at the first move that can't be played
+    :param game: The game to replay
+    :param game_number: Number of the game in its file, for reporting
+    :param on_position: Function called with the Position after every move, e.g. to collect positions
+    :return: (number of moves played, MoveProblem or None if every move was played)
+    """
+    try:
+        position = position_from_fen(game.tags["FEN"]) if "FEN" in game.tags else initialise_position()
+    except ValueError as error:
+        return 0, MoveProblem(game_number, 0, "", f"Starting position is not valid: {error}", game.tags.get("FEN"))
+
+    for ply, san in enumerate(game.moves, 1):
+        try:
+            from_square, to_square, promotion = resolve_san(san, position)
+        except SanError as error:
+            return ply - 1, MoveProblem(game_number, ply, san, str(error), position_to_fen(position))
+
+        perform_move(position, from_square, to_square, promotion=promotion)
+        position.pass_turn()
+        if on_position is not None:
+            on_position(position)
+
+    return len(game.moves), None
+
+
+def describe_game(game: PgnGame):
+    """
+    :param game: A game
+    :return: Short description of the game for reports, e.g. "Morphy, Paul vs Duke Karl (line 12)"
+    """
+    return f"{game.tags.get('White', '?')} vs {game.tags.get('Black', '?')} (line {game.line_number})"
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Replay the games in a PGN file to check every move")
+    parser.add_argument("path", help="PGN file, or - to read from stdin")
+    parser.add_argument("--positions", help="Write the FEN of every position reached to this file")
+    arguments = parser.parse_args(arguments)
+
+    lines = sys.stdin if arguments.path == "-" else open(arguments.path, encoding="utf-8", errors="replace")
+    positions = None if arguments.positions is None else open(arguments.positions, "w")
+    on_position = None if positions is None else (lambda position: positions.write(position_to_fen(position) + "\n"))
+
+    games = plies = problems = 0
+    start = time.perf_counter()
+    try:
+        for game_number, game in enumerate(read_games(lines), 1):
+            played, problem = replay_game(game, game_number, on_position)
+            games += 1
+            plies += played
+            if problem is not None:
+                problems += 1
+                print(f"Game {problem.game_number} {describe_game(game)} ply {problem.ply} {problem.san}: "
+                      f"{problem.reason} [{problem.fen}]")
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if positions is not None:
+            positions.close()
+    seconds = time.perf_counter() - start
+
+    print(f"Replayed {games} games ({plies} moves) in {seconds:.3f}s ({games / max(seconds, 1e-9):,.1f} games/s), "
+          f"{problems} with problems")
+
+    return 0 if problems == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
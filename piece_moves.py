@@ -3,91 +3,265 @@ Author: William Chio
 Created: 26/05/24
 
 Handles the generation of moves that each chess piece can perform
+
+Every generator accepts either a board state dict or a bitboard Position (see bitboard.py). Moves are worked out on
+bitboards and only turned back into (row, col) squares at the end.
 """
-from util import get_direction, is_valid_square, is_opponent_piece, has_piece, player_from_square
+from attack_tables import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks
+from bitboard import (FULL_BOARD, ROW_2, ROW_5, OPPONENT, to_position, square_to_index, squares_from_bitboard,
+                      iterate_indexes, attackers_to)
+from move_encoding import PROMOTION_CODES, PROMOTION_SHIFT, CAPTURE_FLAG
+
+PROMOTION_ROWS = 0xFF | (0xFF << 56)  # Rows 0 and 7, pawns reaching these are promoted
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+PACKED_PROMOTIONS = tuple(PROMOTION_CODES.index(piece) << PROMOTION_SHIFT for piece in PROMOTION_PIECES)
 
 
-def determine_valid_moves(square: (int, int), board_state: dict):
-    from checkmate import move_causes_check # Import here to avoid circular import issue
+def determine_valid_moves(square: (int, int), board_state):
+    from checkmate import legality_masks # Import here to avoid circular import issue
     """
     Determines the valid moves a selected piece can make.
-    
+
     NOTE: This also deems moves which cause check as invalid. THEREFORE, in the scenario where the player is already
     in check and this function is called, the resultant moves allowed will only be those that undo the check.
-    
+
     :param square: Square with the player-selected piece
     :param board_state: The state of the board
     :return: A list of valid moves the selected piece can make. Will return an empty list if there is no valid moves
     """
-    piece = board_state[square]
-    piece_type = piece[1]  # Grab the piece type to determine movement rules
-    player = player_from_square(square, board_state)
+    position = to_position(board_state)
+    index = square_to_index(square)
+    player = position.mailbox[index][0]
 
-    # generate list of valid moves based on piece
-    if piece_type == "P":
-        possible_moves = generate_pawn_moves(square, board_state)
-    elif piece_type == "K":
-        possible_moves = generate_king_moves(square, board_state)
-    elif piece_type == "B":
-        possible_moves = generate_bishop_moves(square, board_state)
-    elif piece_type == "R":
-        possible_moves = generate_rook_moves(square, board_state)
-    elif piece_type == "Q":
-        possible_moves = generate_queen_moves(square, board_state)
-    elif piece_type == "N":
-        possible_moves = generate_knight_moves(square, board_state)
+    return squares_from_bitboard(legal_targets(position, index, legality_masks(player, position)))
 
-    # do final filtering to ensure none of these moves cause check
-    final_move_list = []
-    for move in possible_moves:
-        if not move_causes_check(player, board_state, square, move):
-            final_move_list.append(move)
 
-    return final_move_list
+def generate_all_legal_moves(player: str, board_state):
+    from checkmate import cached_legal_moves # Import here to avoid circular import issue
+    """
+    Generate every legal move a player can make in one pass, to be worked out once per turn and then used for
+    validating the player's piece selection and move, and for deciding check, checkmate and stalemate
+    (see checkmate.game_status).
+    :param player: Player to generate moves for
+    :param board_state: The state of the board
+    :return: Dict of square with a piece that can move -> list of squares it can move to. Pieces with no valid moves
+    are left out, so an empty dict means the player has no moves
+    """
+    legal_moves, status = cached_legal_moves(player, board_state)
+    return {divmod(index, 8): squares_from_bitboard(targets) for index, targets in legal_moves.items()}
 
 
-def generate_pawn_moves(square: (int, int), board_state: dict):
+def generate_legal_moves(position):
+    from checkmate import legality_masks # Import here to avoid circular import issue
     """
-    Create a list of moves that are valid for a pawn piece at a given square with a given board state
-    Pawn movement consists of three parts:
-    1. Forward one square if nothing obstructing square (move1)
-    2. Forward two squares if nothing obstructing and pawn has not been moved yet (move2)
-    3. Diagonal forward left/right if opposing piece can be captured on those squares (move3)
-    :param square: Square where the pawn is located
-    :param board_state: State of the board
-    :return: List of moves that a pawn can make from the square given a board state
+    Generate every legal move for the player whose turn it is in a position. A pawn moving onto the last row gives one
+    move for each piece it could be promoted to.
+    :param position: The position to generate moves for
+    :return: List of moves as (from index, to index, promotion piece type or None)
+    """
+    player = position.player
+    masks = legality_masks(player, position)
+    pawns = position.bitboards[player + "P"]
+
+    moves = []
+    for index in iterate_indexes(position.occupancy[player]):
+        targets = legal_targets(position, index, masks)
+        if targets & PROMOTION_ROWS and pawns & (1 << index):
+            for move in iterate_indexes(targets):
+                for promotion in PROMOTION_PIECES:
+                    moves.append((index, move, promotion))
+        else:
+            for move in iterate_indexes(targets):
+                moves.append((index, move, None))
+
+    return moves
+
+
+def generate_packed_moves(position, buffer, start: int):
+    from checkmate import legality_masks # Import here to avoid circular import issue
+    """
+    Generate every legal move for the player whose turn it is as 16 bit moves (see move_encoding.py), written into a
+    buffer rather than a new list. The moves are the same, in the same order, as generate_legal_moves gives.
+    :param position: The position to generate moves for
+    :param buffer: array("H") to write the moves into, e.g. a MoveStack's buffer
+    :param start: Slot of the buffer to write the first move at
+    :return: Slot after the last move written, so the moves are buffer[start:end]
     """
-    valid_moves = []
-    player = board_state[square][0]  # Grab first char of piece to get player colour
-    direction = get_direction(player)
+    player = position.player
+    masks = legality_masks(player, position)
+    pawns = position.bitboards[player + "P"]
+    opponent_pieces = position.occupancy[OPPONENT[player]]
+
+    end = start
+    pieces = position.occupancy[player]
+    while pieces:
+        lowest_bit = pieces & -pieces
+        pieces ^= lowest_bit
+        index = lowest_bit.bit_length() - 1
+
+        targets = legal_targets(position, index, masks)
+        promotes = targets & PROMOTION_ROWS and pawns & lowest_bit
+        while targets:
+            target_bit = targets & -targets
+            targets ^= target_bit
+            move = index | (target_bit.bit_length() - 1) << 6
+            if target_bit & opponent_pieces:
+                move |= CAPTURE_FLAG
+            if promotes:
+                for code in PACKED_PROMOTIONS:
+                    buffer[end] = move | code
+                    end += 1
+            else:
+                buffer[end] = move
+                end += 1
 
-    row, col = square
+    return end
 
-    # Forward one square if not obstructed (move1)
-    move1 = (row + direction, col)
-    if is_valid_square(move1) and move1 not in board_state.keys():
-        valid_moves.append(move1)
 
-    # Forward two squares if nothing obstructing and pawn has not been moved yet (move2)
-    if (row == 1 and direction == 1) or (row == 6 and direction == -1):  # Determine pawn has not moved
-        move2 = (row + direction * 2, col)
+def legal_targets(position, index: int, masks: tuple):
+    """
+    Bitboard of the squares the piece on a square can legally move to (i.e. without leaving its own King in check).
+    Rather than trying each move and running is_check, moves are filtered by the check mask and pins from
+    checkmate.legality_masks, so only King moves need to test whether their destination is attacked.
+    :param position: Position with a piece on the square
+    :param index: Square index of the piece
+    :param masks: Result of checkmate.legality_masks for the piece's player
+    :return: Bitboard of squares the piece can move to
+    """
+    king_index, check_mask, pins = masks
+    possible_moves = move_targets(position, index)
+
+    if index != king_index:
+        return possible_moves & check_mask & pins.get(index, FULL_BOARD)
 
-        if move1 in valid_moves and move2 not in board_state.keys():  # Check both squares in front of pawn are empty
-            valid_moves.append(move2)
+    # King cannot move onto an attacked square. The King is removed from the occupancy so it cannot hide from a
+    # sliding piece by stepping backwards along the line it is being attacked on
+    opponent = OPPONENT[position.mailbox[index][0]]
+    occupied = (position.occupancy["W"] | position.occupancy["B"]) ^ (1 << index)
+    final_moves = 0
+    for move in iterate_indexes(possible_moves):
+        if not attackers_to(position, move, opponent, occupied):
+            final_moves |= 1 << move
+
+    return final_moves
+
+
+def move_targets(position, index: int):
+    """
+    Bitboard of the squares the piece on a square can move to, ignoring whether the move would cause check
+    :param position: Position with a piece on the square
+    :param index: Square index of the piece
+    :return: Bitboard of squares the piece can move to
+    """
+    return TARGET_GENERATORS[position.mailbox[index][1]](position, index)
+
+
+def pawn_targets(position, index: int):
+    """
+    Bitboard version of generate_pawn_moves
+    :param position: Position with a pawn on the square
+    :param index: Square index of the pawn
+    :return: Bitboard of squares the pawn can move to
+    """
+    bit = 1 << index
+    player = position.mailbox[index][0]
+    empty = FULL_BOARD ^ (position.occupancy["W"] | position.occupancy["B"])
+
+    # Forward one square if not obstructed (move1), then forward a second square if the first move landed on the row
+    # in front of the pawn's starting row (i.e. pawn has not been moved yet) and it is also not obstructed (move2)
+    if player == "W":
+        move1 = (bit >> 8) & empty
+        move2 = ((move1 & ROW_5) >> 8) & empty
+    else:
+        move1 = (bit << 8) & empty
+        move2 = ((move1 & ROW_2) << 8) & empty
 
     # Diagonal move left/right if there is opposing piece on those squares (move3)
-    move3 = [(row + direction, col + 1), (row + direction, col - 1)]
-    for move in move3:
-        if is_valid_square(move) and move in board_state.keys():  # Check there is a piece on the valid square
-            piece_on_square = board_state[move]
+    move3 = PAWN_ATTACKS[player][index] & position.occupancy[OPPONENT[player]]
+
+    return move1 | move2 | move3
+
+
+def king_targets(position, index: int):
+    """
+    Bitboard version of generate_king_moves
+    :param position: Position with a King on the square
+    :param index: Square index of the King
+    :return: Bitboard of squares the King can move to
+    """
+    return KING_ATTACKS[index] & ~position.occupancy[position.mailbox[index][0]]
+
+
+def knight_targets(position, index: int):
+    """
+    Bitboard version of generate_knight_moves
+    :param position: Position with a Knight on the square
+    :param index: Square index of the Knight
+    :return: Bitboard of squares the Knight can move to
+    """
+    return KNIGHT_ATTACKS[index] & ~position.occupancy[position.mailbox[index][0]]
+
+
+def bishop_targets(position, index: int):
+    """
+    Bitboard version of generate_bishop_moves
+    :param position: Position with a Bishop on the square
+    :param index: Square index of the Bishop
+    :return: Bitboard of squares the Bishop can move to
+    """
+    occupancy = position.occupancy
+    attacks = bishop_attacks(index, occupancy["W"] | occupancy["B"])
+    return attacks & ~occupancy[position.mailbox[index][0]]
+
+
+def rook_targets(position, index: int):
+    """
+    Bitboard version of generate_rook_moves
+    :param position: Position with a Rook on the square
+    :param index: Square index of the Rook
+    :return: Bitboard of squares the Rook can move to
+    """
+    occupancy = position.occupancy
+    attacks = rook_attacks(index, occupancy["W"] | occupancy["B"])
+    return attacks & ~occupancy[position.mailbox[index][0]]
 
-            if is_opponent_piece(player, piece_on_square):  # Check piece on square belongs to the opponent
-                valid_moves.append(move)
 
-    return valid_moves
+def queen_targets(position, index: int):
+    """
+    Bitboard version of generate_queen_moves
+    :param position: Position with a Queen on the square
+    :param index: Square index of the Queen
+    :return: Bitboard of squares the Queen can move to
+    """
+    occupancy = position.occupancy
+    occupied = occupancy["W"] | occupancy["B"]
+    attacks = rook_attacks(index, occupied) | bishop_attacks(index, occupied)
+    return attacks & ~occupancy[position.mailbox[index][0]]
+
+
+TARGET_GENERATORS = {"P": pawn_targets,
+                     "K": king_targets,
+                     "B": bishop_targets,
+                     "R": rook_targets,
+                     "Q": queen_targets,
+                     "N": knight_targets}
+
+
+def generate_pawn_moves(square: (int, int), board_state):
+    """
+    Create a list of moves that are valid for a pawn piece at a given square with a given board state
+    Pawn movement consists of three parts:
+    1. Forward one square if nothing obstructing square (move1)
+    2. Forward two squares if nothing obstructing and pawn has not been moved yet (move2)
+    3. Diagonal forward left/right if opposing piece can be captured on those squares (move3)
+    :param square: Square where the pawn is located
+    :param board_state: State of the board
+    :return: List of moves that a pawn can make from the square given a board state
+    """
+    return squares_from_bitboard(pawn_targets(to_position(board_state), square_to_index(square)))
 
 
-def generate_king_moves(square: (int, int), board_state: dict):
+def generate_king_moves(square: (int, int), board_state):
     """
     Create a list of moves that are valid for a King at a given square given a certain board state.
     King movement simply consists of one tile in all directions, being able to capture on each of these squares
@@ -95,27 +269,10 @@ def generate_king_moves(square: (int, int), board_state: dict):
     :param board_state: State of the board
     :return: List of moves that a King can make from the square given a board state
     """
-    row, col = square
-    moves = []
-    player = board_state[square][0]
-
-    # Generate all 8 possible moves
-    for i in range(-1, 2):
-        for j in range(-1, 2):
-            move = (row + i, col + j)
-            valid = True
-            if not is_valid_square(move):  # Check square is valid
-                valid = False
-            # Move not valid if square has a piece of same colour as player
-            elif has_piece(move, board_state) and not is_opponent_piece(player, board_state[move]):
-                valid = False
-
-            if valid:
-                moves.append(move)
-    return moves
+    return squares_from_bitboard(king_targets(to_position(board_state), square_to_index(square)))
 
 
-def generate_bishop_moves(square: (int, int), board_state: dict):
+def generate_bishop_moves(square: (int, int), board_state):
     """
     Create a list of moves that are valid for a Bishop at a given square given a certain board state.
     Bishop movement consist of infinite tiles in all four diagonal directions (up-left, up-right, down-left, down-right)
@@ -129,38 +286,10 @@ def generate_bishop_moves(square: (int, int), board_state: dict):
     :param board_state: State of the board
     :return: List of moves that a Bishop can make from the square given a board state
     """
-    row, col = square
-    moves = []
-    player = board_state[square][0]
-
-    # 4 possible directions, up-left, up-right, down-left and down-right. Premise is to keep adding moves in a
-    # direction until a square is met that is off the board or has a piece on it ^^^
-    directions = [1, -1]
-    for i in directions:
-        for j in directions:
-
-            for step in range(1, 9):  # Add moves in direction till a piece is met
-                move = (row + i * step, col + j * step)
-                if is_valid_square(move):  # Check square is on the board
-                    if has_piece(move, board_state):
-
-                        # Found enemy piece so add this square to moves and stop loop
-                        if is_opponent_piece(player, board_state[move]):
-                            moves.append(move)
-                            break
-
-                        # Found friendly piece so don't add this square and stop loop
-                        else:
-                            break
-                    else:
-                        moves.append(move)  # Empty square so add and continue loop
-                else:
-                    break  # Reach end of board so stop loop
-
-    return moves
+    return squares_from_bitboard(bishop_targets(to_position(board_state), square_to_index(square)))
 
 
-def generate_rook_moves(square: (int, int), board_state: dict):
+def generate_rook_moves(square: (int, int), board_state):
     """
     Create a list of moves that are valid for a Rook at a given square given a certain board state.
     Rook movement consist of infinite tiles in all four straight directions (up, left, right, down) until the end of
@@ -174,36 +303,10 @@ def generate_rook_moves(square: (int, int), board_state: dict):
     :param board_state: State of the board
     :return: List of moves that a Rook can make from the square given a board state
     """
-    row, col = square
-    moves = []
-    player = board_state[square][0]
-
-    transforms = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-    for transform in transforms:
-        row_change = transform[0]
-        col_change = transform[1]
-        for step in range(1, 9):  # Add moves in direction till a piece is met
-            move = (row + row_change * step, col + col_change * step)
-            if is_valid_square(move):  # Check square is on the board
-                if has_piece(move, board_state):
-
-                    # Found enemy piece so add this square to moves and stop loop
-                    if is_opponent_piece(player, board_state[move]):
-                        moves.append(move)
-                        break
-
-                    # Found friendly piece so don't add this square and stop loop
-                    else:
-                        break
-                else:
-                    moves.append(move)  # Empty square so add and continue loop
-            else:
-                break  # Reach end of board so stop loop
+    return squares_from_bitboard(rook_targets(to_position(board_state), square_to_index(square)))
 
-    return moves
 
-
-def generate_queen_moves(square: (int, int), board_state: dict):
+def generate_queen_moves(square: (int, int), board_state):
     """
     Create a list of moves that are valid for a Queen at a given square given a certain board state.
     Queen movement consist of infinite tiles in all four straight directions (up, left, right, down) and all four
@@ -219,12 +322,10 @@ def generate_queen_moves(square: (int, int), board_state: dict):
     """
 
     # The queen is simply a combination of Rook and Bishop, so we will generate moves as such
-    moves = generate_rook_moves(square, board_state) + generate_bishop_moves(square, board_state)
-
-    return moves
+    return squares_from_bitboard(queen_targets(to_position(board_state), square_to_index(square)))
 
 
-def generate_knight_moves(square: (int, int), board_state: dict):
+def generate_knight_moves(square: (int, int), board_state):
     """
     Create a list of moves that are valid for a Knight at a given square given a certain board state.
     Knight movement consist of 2 squares in one straight direction (up, down, left, right) followed by 1 square in the
@@ -233,30 +334,4 @@ def generate_knight_moves(square: (int, int), board_state: dict):
     :param board_state: State of the board
     :return: List of moves that a Knight can make from the square given a board state
     """
-
-    row, col = square
-    moves = []
-    player = board_state[square][0]
-
-    # Apply 8 transforms to square to get all possible knight moves
-    transforms = [(1, 2),
-                  (1, -2),
-                  (-1, 2),
-                  (-1, -2),
-                  (2, 1),
-                  (2, -1),
-                  (-2, 1),
-                  (-2, -1)]
-
-    for transform in transforms:
-        row_change = transform[0]
-        col_change = transform[1]
-        move = (row + row_change, col + col_change)
-
-        if is_valid_square(move):
-            # Add move to list of moves if square is empty or has enemy piece to capture
-            if not has_piece(move, board_state) or (has_piece(move, board_state) and
-                                                    is_opponent_piece(player, board_state[move])):
-                moves.append(move)
-
-    return moves
+    return squares_from_bitboard(knight_targets(to_position(board_state), square_to_index(square)))
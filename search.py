@@ -0,0 +1,287 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Searches for the best move in a position so the computer can play. The search is negamax alpha-beta: each player is
+assumed to pick the move that is best for them, scores are always from the point of view of the player to move (so a
+child's score is negated) and branches which cannot change the result are cut off.
+
+- Iterative deepening: depth 1 is searched, then depth 2 and so on until the time runs out. Each finished depth gives
+  a best move, so there is always a move to play, and the previous depth's best line is searched first which makes
+  cut offs happen sooner.
+- Quiescence search: at the end of the main search captures keep being played out until the position is quiet, so a
+  position isn't scored in the middle of an exchange.
+- Hard deadline: the search checks the clock as it goes and abandons the unfinished depth when time is up. A
+  threading.Event can also be given to stop the search early from another thread (see uci.py).
+- Transposition table (optional): the result of each position searched is stored by its hash, so a position reached
+  again by a different order of moves can reuse it (see transposition_table.py).
+
+Positions are scored by evaluate (see evaluation.py). Scores are in centipawns, with mate scored as MATE_SCORE less
+the number of moves until mate.
+"""
+import time
+from collections import namedtuple
+
+from checkmate import is_check
+from evaluation import evaluate
+from piece_moves import generate_legal_moves
+from transposition_table import EXACT, LOWER, UPPER
+
+# Rough piece values for ordering captures, positions themselves are scored by evaluation.py
+PIECE_VALUES = {"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+MATE_SCORE = 100000
+MAX_DEPTH = 64
+NODES_BETWEEN_CLOCK_CHECKS = 1024
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "principal_variation", "depth", "nodes", "seconds"])
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the deadline passes, the node limit is reached or the search is stopped, to abandon
+    the current depth
+    """
+
+
+def score_to_table(score: int, ply: int):
+    """
+    Mate scores count moves from the root of the search, but the table is shared between searches from different
+    roots, so they are stored counting moves from the position itself
+    :param score: Score from the search
+    :param ply: Number of moves made since the root of the search
+    :return: Score to store in the transposition table
+    """
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_DEPTH:
+        return score - ply
+    return score
+
+
+def score_from_table(score: int, ply: int):
+    """
+    :param score: Score stored in the transposition table
+    :param ply: Number of moves made since the root of the search
+    :return: The score as the search counts it (see score_to_table)
+    """
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_DEPTH:
+        return score + ply
+    return score
+
+
+def order_moves(position, moves: list, first_move=None):
+    """
+    Order moves so the ones most likely to be best are searched first: the move given (the best move from the
+    previous search), then captures of the most valuable piece by the least valuable piece, then promotions, then
+    everything else
+    :param position: The position the moves are played from
+    :param moves: Moves as (from index, to index, promotion)
+    :param first_move: Move to put first, if it is in the list
+    :return: The sorted list of moves
+    """
+    mailbox = position.mailbox
+
+    def move_priority(move):
+        if move == first_move:
+            return -1000000
+        captured = mailbox[move[1]]
+        priority = 0
+        if captured is not None:
+            priority -= 10 * PIECE_VALUES[captured[1]] - PIECE_VALUES[mailbox[move[0]][1]] + 10000
+        if move[2] is not None:
+            priority -= PIECE_VALUES[move[2]]
+        return priority
+
+    return sorted(moves, key=move_priority)
+
+
+class Search:
+    """
+    State of one search: the position being searched, the limits it has to keep to, the transposition table (if any)
+    and the count of positions visited
+    """
+
+    def __init__(self, position, deadline: float = None, node_limit: int = None, table=None, stop_event=None):
+        """
+        :param position: The position to search, moves are made and unmade on it in place
+        :param deadline: time.perf_counter() value the search must stop by, None for no time limit
+        :param node_limit: Maximum number of positions to visit, None for no limit
+        :param table: TranspositionTable to look up and store results in, None to not use one
+        :param stop_event: threading.Event which stops the search as soon as it is set, None if not needed
+        """
+        self.position = position
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.table = table
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.next_clock_check = NODES_BETWEEN_CLOCK_CHECKS
+
+    def visit_node(self):
+        """
+        Count a visited position and stop the search if it has run out of time or nodes
+        :raises SearchTimeout: If the deadline has passed, the node limit is reached or the search has been stopped
+        """
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout
+        # Checked at every position rather than with the clock so stopping takes effect straight away
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout
+        if self.nodes >= self.next_clock_check:
+            self.next_clock_check = self.nodes + NODES_BETWEEN_CLOCK_CHECKS
+            if self.should_stop():
+                raise SearchTimeout
+
+    def should_stop(self):
+        """
+        :return: True if the search has run out of time or been stopped
+        """
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def negamax(self, depth: int, ply: int, alpha: int, beta: int, first_move=None):
+        """
+        Alpha-beta search of the position to a fixed depth
+        :param depth: Number of moves left to search before quiescence search takes over
+        :param ply: Number of moves made since the root of the search
+        :param alpha: Score the player to move is already guaranteed
+        :param beta: Score the opponent is already guaranteed, anything at or above this will not be allowed by them
+        :param first_move: Move to search first (from the previous depth's best line)
+        :return: (score, best line of moves from this position)
+        """
+        self.visit_node()
+        if depth <= 0:
+            return self.quiescence(ply, alpha, beta), []
+
+        position = self.position
+        table = self.table
+        original_alpha = alpha
+        if table is not None:
+            entry = table.probe(position.zobrist)
+            if entry is not None:
+                stored_depth, bound, score, stored_move = entry
+                # The root always searches so it has a full line and a move that is definitely legal
+                if ply > 0 and stored_depth >= depth:
+                    score = score_from_table(score, ply)
+                    if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                        return score, ([stored_move] if stored_move is not None else [])
+                if first_move is None:
+                    first_move = stored_move
+
+        moves = generate_legal_moves(position)
+        if not moves:
+            # Checkmate (sooner is worse for the player mated) or stalemate
+            return (-MATE_SCORE + ply if is_check(position.player, position) else 0), []
+
+        best_line = []
+        for move in order_moves(position, moves, first_move):
+            position.make_move(*move)
+            try:
+                score, line = self.negamax(depth - 1, ply + 1, -beta, -alpha)
+            finally:
+                position.unmake_move()
+            score = -score
+
+            if score > alpha:
+                alpha = score
+                best_line = [move] + line
+                if alpha >= beta:
+                    break  # Opponent will never allow this position
+
+        if table is not None:
+            if alpha >= beta:
+                bound = LOWER
+            elif alpha > original_alpha:
+                bound = EXACT
+            else:
+                bound = UPPER
+            table.store(position.zobrist, depth, bound, score_to_table(alpha, ply), best_line[0] if best_line else None)
+
+        return alpha, best_line
+
+    def quiescence(self, ply: int, alpha: int, beta: int):
+        """
+        Keep playing out captures (and promotions) until the position is quiet then score it. The player to move can
+        choose not to capture, so the score is at least the score of the position as it stands. If the player is in
+        check every move is searched instead as they must get out of check.
+        :param ply: Number of moves made since the root of the search
+        :param alpha: Score the player to move is already guaranteed
+        :param beta: Score the opponent is already guaranteed
+        :return: Score of the position
+        """
+        self.visit_node()
+        position = self.position
+
+        if is_check(position.player, position):
+            moves = generate_legal_moves(position)
+            if not moves:
+                return -MATE_SCORE + ply
+        else:
+            stand_pat = evaluate(position)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            mailbox = position.mailbox
+            moves = [move for move in generate_legal_moves(position)
+                     if mailbox[move[1]] is not None or move[2] == "Q"]
+
+        for move in order_moves(position, moves):
+            position.make_move(*move)
+            try:
+                score = -self.quiescence(ply + 1, -beta, -alpha)
+            finally:
+                position.unmake_move()
+
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+        return alpha
+
+
+def search(position, time_limit: float = None, max_depth: int = MAX_DEPTH, node_limit: int = None, report=None,
+           table=None, stop_event=None):
+    """
+    Find the best move in a position with iterative deepening. The search stops when it has finished max_depth, or
+    at the deadline / node limit or when stop_event is set, in which case the result of the last finished depth is
+    used.
+    :param position: The position to search, it is left as it was
+    :param time_limit: Seconds the search may take, None for no time limit
+    :param max_depth: Deepest depth to search to
+    :param node_limit: Maximum number of positions to visit, None for no limit
+    :param report: Function called with the SearchResult of every finished depth, e.g. to print progress
+    :param table: TranspositionTable to use, None to search without one
+    :param stop_event: threading.Event to stop the search early from another thread, None if not needed
+    :return: SearchResult of the deepest finished depth. move is None if the player to move has no legal moves
+    """
+    start = time.perf_counter()
+    deadline = None if time_limit is None else start + time_limit
+    searcher = Search(position, deadline, node_limit, table, stop_event)
+
+    moves = generate_legal_moves(position)
+    if not moves:
+        score = -MATE_SCORE if is_check(position.player, position) else 0
+        return SearchResult(None, score, [], 0, 0, 0.0)
+
+    # Until depth 1 has been finished fall back on the most promising looking move
+    result = SearchResult(order_moves(position, moves)[0], 0, [], 0, 0, 0.0)
+    for depth in range(1, max_depth + 1):
+        try:
+            score, line = searcher.negamax(depth, 0, -MATE_SCORE - 1, MATE_SCORE + 1, result.move)
+        except SearchTimeout:
+            break  # Every move made has already been unmade on the way out of the search
+
+        result = SearchResult(line[0], score, line, depth, searcher.nodes, time.perf_counter() - start)
+        if report is not None:
+            report(result)
+
+        # Stop early once a forced mate has been found or the time for another depth is unlikely to be there
+        if abs(score) >= MATE_SCORE - MAX_DEPTH or searcher.should_stop():
+            break
+
+    return result._replace(nodes=searcher.nodes, seconds=time.perf_counter() - start)
@@ -0,0 +1,511 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Endgame tablebases: for endings with very few pieces every position is solved once and saved, so the result (win,
+draw or loss) and the number of moves to mate can be looked up instead of searched for. Tables are made for a King and
+one or two pieces against a lone King:
+    KQK   King and Queen          KRK   King and Rook
+    KPK   King and pawn           KBNK  King, Bishop and Knight
+
+Tables are built by retrograde analysis, working backwards from the checkmates:
+1. Every legal placement of the pieces is visited, with either player to move. Positions where the lone King is
+   checkmated are lost in 0 moves, and the number of legal moves the lone King has is counted for every other position
+   where it is to move.
+2. A position where the stronger side can make a move into a lost position is won, one move further from mate.
+3. Each time a position is found to be won, the positions the lone King could have moved there from have one fewer
+   move that doesn't lose. When a position has none left, it is lost.
+Going through positions in order of distance from mate makes every distance the shortest mate with best play from both
+sides. Anything never reached is a draw. Moves are generated by the rules in piece_moves.py and checkmate.py, and by
+the attack tables (see attack_tables.py) when stepping moves backwards. A pawn promoting is looked up in the KQK or KRK
+table, so those are built first.
+
+Positions are stored in their smallest form under the symmetries of the board. Without pawns the board can be
+mirrored and rotated 8 ways, so the stronger side's King only ever needs to be on one of the 10 squares of the
+a1-d1-d4 triangle. Pawns only move one way up the board so with a pawn the board can only be mirrored left to right,
+which puts the King on files a-d. Each position then has a fixed index (see TableLayout) and its value, 0 for a draw
+(or a position that can't happen) or 1 + the number of moves (plies) to mate, is packed into as few bits as the
+longest mate needs, one after the other in a file. A file is opened with mmap and any position is looked up by
+reading the bits at its index.
+
+Usage:
+    python tablebase.py generate KQK KRK KPK KBNK --directory tablebases
+    python tablebase.py probe "8/8/8/4k3/8/8/8/KQ6 w - - 0 1" --directory tablebases
+KBNK has 5 million positions so takes several minutes to build.
+"""
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import time
+
+from attack_tables import KING_ATTACKS, KNIGHT_ATTACKS, rook_attacks, bishop_attacks
+from bitboard import Position, OPPONENT, attackers_to, to_position
+from checkmate import is_check
+from fen import position_from_fen
+from piece_moves import generate_legal_moves
+
+# Stronger side's pieces other than the King for each table
+MATERIALS = {"KQK": "Q", "KRK": "R", "KPK": "P", "KBNK": "BN"}
+
+# Tables a pawn promoting to each piece leads to, promoting to a Bishop or Knight leaves a draw
+PROMOTION_TABLES = {"Q": "KQK", "R": "KRK"}
+
+HEADER = struct.Struct("<4s8sBxxxQ")
+MAGIC = b"CHTB"
+
+# Results of a probe, for the player to move
+WIN = "Win"
+DRAW = "Draw"
+LOSS = "Loss"
+
+# Player to move in a table index, the stronger side is always white
+STRONG = 0
+WEAK = 1
+
+
+def transform_square(index: int, swap: bool, flip_rows: bool, flip_cols: bool):
+    """
+    :return: Where a square index ends up when the board is reflected across the a1-h8 diagonal (swap) and then
+    mirrored top to bottom and/or left to right
+    """
+    row, col = divmod(index, 8)
+    if swap:
+        row, col = 7 - col, 7 - row
+    if flip_rows:
+        row = 7 - row
+    if flip_cols:
+        col = 7 - col
+    return row * 8 + col
+
+
+# The 8 symmetries of the board, each as a list of where every square index goes, starting with leaving it alone
+SYMMETRIES = [[transform_square(index, swap, flip_rows, flip_cols) for index in range(64)]
+              for swap in (False, True) for flip_rows in (False, True) for flip_cols in (False, True)]
+DIAGONAL_REFLECTION = SYMMETRIES[4]
+
+# a1-h8 diagonal, the squares in the triangle which can't be moved off it
+A1_H8_DIAGONAL = {row * 8 + 7 - row for row in range(8)}
+
+# a1-d1-d4 triangle (rank - 1 <= file - a <= 3)
+TRIANGLE = [index for index in range(64) if 7 - index // 8 <= index % 8 <= 3]
+QUEENSIDE = [index for index in range(64) if index % 8 <= 3]
+
+
+class TableLayout:
+    """
+    How the positions of one table are numbered. A position is the player to move (STRONG or WEAK) and the squares of
+    the stronger King, the lone King and then the stronger side's other pieces in the order of MATERIALS. Its index is
+        ((player to move * number of King squares + stronger King square number) * 64 + lone King square) * 64 ...
+    followed by the square of each other piece, after the position has been moved by a symmetry so the stronger King
+    is on one of king_squares. If that King is on the a1-h8 diagonal the position can still be reflected across it
+    without moving the King, so the reflection with the lower squares is used, meaning every position has exactly
+    one index.
+    """
+
+    def __init__(self, material: str):
+        """
+        :param material: Name of the table, e.g. "KQK"
+        """
+        self.material = material
+        self.pieces = MATERIALS[material]
+        self.pawns = "P" in self.pieces
+        self.king_squares = QUEENSIDE if self.pawns else TRIANGLE
+        symmetries = SYMMETRIES[:2] if self.pawns else SYMMETRIES  # Only the left to right mirror with pawns
+
+        self.king_numbers = {index: number for number, index in enumerate(self.king_squares)}
+        self.king_symmetries = [next(symmetry for symmetry in symmetries if symmetry[index] in self.king_numbers)
+                                for index in range(64)]
+        self.positions = len(self.king_squares) * 64 ** (1 + len(self.pieces))
+        self.size = 2 * self.positions
+
+    def canonical(self, squares: list):
+        """
+        :param squares: Squares of the stronger King, lone King and other pieces
+        :return: The squares after moving the position into its smallest form
+        """
+        symmetry = self.king_symmetries[squares[0]]
+        squares = [symmetry[index] for index in squares]
+        if not self.pawns and squares[0] in A1_H8_DIAGONAL:
+            reflected = [DIAGONAL_REFLECTION[index] for index in squares]
+            if reflected < squares:
+                return reflected
+        return squares
+
+    def symmetry_count(self, squares: list):
+        """
+        :param squares: Squares of a position in its smallest form
+        :return: How many symmetries leave the position exactly as it is (1 or 2)
+        """
+        if self.pawns or squares[0] not in A1_H8_DIAGONAL:
+            return 1
+        return 2 if [DIAGONAL_REFLECTION[index] for index in squares] == squares else 1
+
+    def index(self, player: int, squares: list):
+        """
+        :param player: STRONG or WEAK to move
+        :param squares: Squares of the stronger King, lone King and other pieces, in any orientation
+        :return: The position's index in the table
+        """
+        squares = self.canonical(squares)
+        index = player * len(self.king_squares) + self.king_numbers[squares[0]]
+        for square in squares[1:]:
+            index = index * 64 + square
+        return index
+
+    def position(self, index: int):
+        """
+        :param index: Index in the table
+        :return: (player to move, list of squares of the stronger King, lone King and other pieces)
+        """
+        squares = []
+        for _ in range(1 + len(self.pieces)):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        player, king_number = divmod(index, len(self.king_squares))
+        squares.append(self.king_squares[king_number])
+        squares.reverse()
+        return player, squares
+
+    def build_position(self, player: int, squares: list):
+        """
+        :return: Position for a player to move and squares, with the stronger side as white
+        """
+        position = Position("W" if player == STRONG else "B")
+        position.add_piece(squares[0], "WK")
+        position.add_piece(squares[1], "BK")
+        for piece_type, square in zip(self.pieces, squares[2:]):
+            position.add_piece(square, "W" + piece_type)
+        return position
+
+
+def strong_unmoves(pieces: str, squares: list):
+    """
+    Step the stronger side's last move backwards: every position the stronger side could have moved from to reach
+    these squares, without capturing
+    :param pieces: The stronger side's pieces other than the King
+    :param squares: Squares of the stronger King, lone King and other pieces
+    :return: Generator of the squares before the move
+    """
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    empty = ~occupied
+
+    for number, piece_type in enumerate("K" + pieces):
+        number = 0 if number == 0 else number + 1
+        square = squares[number]
+        if piece_type == "P":
+            # White pawns move up the board (towards index 0), one square or two from their starting row
+            origins = []
+            if square + 8 < 56 and empty >> (square + 8) & 1:
+                origins.append(square + 8)
+                if square // 8 == 4 and empty >> (square + 16) & 1:
+                    origins.append(square + 16)
+        else:
+            if piece_type == "K":
+                targets = KING_ATTACKS[square]
+            elif piece_type == "N":
+                targets = KNIGHT_ATTACKS[square]
+            elif piece_type == "B":
+                targets = bishop_attacks(square, occupied)
+            elif piece_type == "R":
+                targets = rook_attacks(square, occupied)
+            else:
+                targets = rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+            targets &= empty
+            origins = []
+            while targets:
+                bit = targets & -targets
+                origins.append(bit.bit_length() - 1)
+                targets ^= bit
+
+        for origin in origins:
+            before = squares.copy()
+            before[number] = origin
+            yield before
+
+
+def weak_unmoves(squares: list):
+    """
+    Step the lone King's last move backwards, without capturing
+    :param squares: Squares of the stronger King, lone King and other pieces
+    :return: Generator of the squares before the move
+    """
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    targets = KING_ATTACKS[squares[1]] & ~occupied
+    while targets:
+        bit = targets & -targets
+        before = squares.copy()
+        before[1] = bit.bit_length() - 1
+        yield before
+        targets ^= bit
+
+
+def generate(material: str, tables: dict = None, report=None):
+    """
+    Solve every position of a table by retrograde analysis
+    :param material: Name of the table, e.g. "KQK"
+    :param tables: Dict of table name -> values of already solved tables, needed by KPK for promotions
+    :param report: Function called with progress messages
+    :return: bytearray of each position's value by index, 0 for a draw or a position that can't happen and 1 + the
+    number of moves (plies) to mate otherwise
+    :raises ValueError: If a table needed for promotions is missing
+    """
+    tables = tables or {}
+    layout = TableLayout(material)
+    if layout.pawns and any(table not in tables for table in PROMOTION_TABLES.values()):
+        raise ValueError(f"{material} needs {', '.join(PROMOTION_TABLES.values())} to be generated first")
+    promotion_layouts = {piece: TableLayout(table) for piece, table in PROMOTION_TABLES.items()}
+
+    legal = bytearray(layout.size)
+    # Twice the number of lone King moves not yet known to lose, twice so symmetric positions can take off halves
+    moves_left = bytearray(layout.size)
+    buckets = [[]]  # buckets[plies] holds positions found to be that many moves from mate
+
+    def add(plies, index):
+        while len(buckets) <= plies:
+            buckets.append([])
+        buckets[plies].append(index)
+
+    # 1. Find every legal position, the checkmates and how many moves each lone King has
+    for king_square in layout.king_squares:
+        for others in itertools.product(range(64), repeat=1 + len(layout.pieces)):
+            squares = [king_square, *others]
+            if len(set(squares)) != len(squares) or KING_ATTACKS[king_square] >> others[0] & 1:
+                continue
+            if layout.pawns and not 8 <= squares[2] < 56:
+                continue
+            if layout.canonical(squares) != squares:
+                continue  # The reflection of a position across the diagonal, which has its own index
+
+            position = layout.build_position(WEAK, squares)
+            index = layout.index(WEAK, squares)
+            legal[index] = 1
+            moves = len(generate_legal_moves(position))
+            moves_left[index] = 2 * moves
+            if moves == 0 and is_check("B", position):
+                add(0, index)
+
+            # With the stronger side to move, the lone King can't be in check
+            if attackers_to(position, squares[1], "W"):
+                continue
+            index = layout.index(STRONG, squares)
+            legal[index] = 1
+
+            if layout.pawns and squares[2] < 16:
+                position.player = "W"
+                for from_index, to_index, promotion in generate_legal_moves(position):
+                    if promotion in PROMOTION_TABLES:
+                        after = [squares[0], squares[1], to_index]
+                        value = tables[PROMOTION_TABLES[promotion]][promotion_layouts[promotion].index(WEAK, after)]
+                        if value:
+                            add(value, index)  # Lost for the lone King in value - 1 plies, so won in value
+
+    if report is not None:
+        report(f"{material}: {sum(legal)} legal positions, {len(buckets[0])} checkmates")
+
+    # 2. and 3. Work backwards from the checkmates one move at a time
+    values = bytearray(layout.size)
+    plies = 0
+    while plies < len(buckets):
+        for index in buckets[plies]:
+            if values[index]:
+                continue  # Already reached in fewer moves
+            values[index] = plies + 1
+            player, squares = layout.position(index)
+
+            if player == WEAK:
+                # Lost for the lone King, so won for the stronger side wherever it could have moved here from
+                for before in strong_unmoves(layout.pieces, squares):
+                    before_index = layout.index(STRONG, before)
+                    if legal[before_index] and not values[before_index]:
+                        add(plies + 1, before_index)
+            else:
+                # Won for the stronger side, so one more losing move wherever the lone King could have moved from
+                symmetry_count = layout.symmetry_count(squares)
+                for before in weak_unmoves(squares):
+                    before = layout.canonical(before)
+                    before_index = layout.index(WEAK, before)
+                    if legal[before_index] and not values[before_index] and moves_left[before_index]:
+                        moves_left[before_index] -= 2 * layout.symmetry_count(before) // symmetry_count
+                        if moves_left[before_index] == 0:
+                            add(plies + 1, before_index)
+        buckets[plies] = None  # Done with, free the memory
+        plies += 1
+
+    if report is not None:
+        report(f"{material}: longest mate {plies - 1} plies, {sum(1 for value in values if value)} decisive positions")
+    return values
+
+
+def write_table(path: str, material: str, values: bytearray):
+    """
+    Pack a table's values into a file, each taking as many bits as the largest value needs
+    :param path: File to write
+    :param material: Name of the table
+    :param values: Values from generate
+    """
+    bits = max(1, max(values).bit_length())
+    packed = bytearray((len(values) * bits + 7) // 8 + 1)  # One spare byte so reads can always take 2 bytes
+    offset = 0
+    for value in values:
+        if value:
+            byte, shift = divmod(offset, 8)
+            shifted = value << shift
+            packed[byte] |= shifted & 0xFF
+            packed[byte + 1] |= shifted >> 8
+        offset += bits
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, material.encode(), bits, len(values)))
+        file.write(packed)
+
+
+class TableFile:
+    """
+    A table file opened with mmap for lookups
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The table file
+        :raises ValueError: If the file is not a table
+        """
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, material, self.bits, self.size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or self.bits > 8:
+            self.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        self.material = material.rstrip(b"\0").decode()
+        self.layout = TableLayout(self.material)
+        self.mask = (1 << self.bits) - 1
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def value(self, index: int):
+        """
+        :param index: Index of a position in the table
+        :return: The position's value (see generate)
+        """
+        byte, shift = divmod(index * self.bits, 8)
+        byte += HEADER.size
+        return ((self.data[byte] | self.data[byte + 1] << 8) >> shift) & self.mask
+
+
+class Tablebase:
+    """
+    The tables in a directory, opened as they are first needed
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory holding table files named like KQK.tb
+        """
+        self.directory = directory
+        self.files = {}
+
+    def close(self):
+        for table in self.files.values():
+            table.close()
+        self.files = {}
+
+    def table(self, material: str):
+        """
+        :param material: Name of a table, e.g. "KQK"
+        :return: The opened TableFile, or None if the directory doesn't have the table
+        """
+        if material not in self.files:
+            path = os.path.join(self.directory, material + ".tb")
+            if not os.path.exists(path):
+                return None
+            self.files[material] = TableFile(path)
+        return self.files[material]
+
+    def probe(self, board_state, player: str = "W"):
+        """
+        Look up a position
+        :param board_state: The state of the board as a dict or Position
+        :param player: The player whose turn it is, only used for a dict (a Position has its own)
+        :return: (WIN, DRAW or LOSS for the player to move, number of moves (plies) to mate or None for a draw), or None
+        if there is no table for the pieces on the board
+        """
+        position = to_position(board_state, player[0])
+        pieces = {"W": [], "B": []}
+        for index, piece in enumerate(position.mailbox):
+            if piece is not None and piece[1] != "K":
+                pieces[piece[0]].append((piece[1], index))
+
+        # Tables have the stronger side as white, with black stronger the board is turned upside down
+        strong = "W" if pieces["W"] else "B"
+        if pieces[OPPONENT[strong]] or position.kings["W"] is None or position.kings["B"] is None:
+            return None
+        material = "K" + "".join(sorted((piece_type for piece_type, _ in pieces[strong]),
+                                        key=lambda piece_type: "QRBNP".index(piece_type))) + "K"
+        table = self.table(material) if material in MATERIALS else None
+        if table is None:
+            return None
+
+        def orient(index):
+            return index if strong == "W" else (7 - index // 8) * 8 + index % 8
+
+        squares = [orient(position.kings[strong]), orient(position.kings[OPPONENT[strong]])]
+        for piece_type in table.layout.pieces:
+            squares.append(orient(next(index for piece, index in pieces[strong] if piece == piece_type)))
+
+        player_to_move = STRONG if position.player == strong else WEAK
+        value = table.value(table.layout.index(player_to_move, squares))
+        if value == 0:
+            return DRAW, None
+        return (WIN if player_to_move == STRONG else LOSS), value - 1
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Build or look up endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("generate", help="Build tables")
+    build.add_argument("materials", nargs="+", choices=list(MATERIALS), help="Tables to build")
+    build.add_argument("--directory", default="tablebases", help="Directory to write tables to")
+
+    probe = commands.add_parser("probe", help="Look up a position")
+    probe.add_argument("fen", help="Position in FEN")
+    probe.add_argument("--directory", default="tablebases", help="Directory to read tables from")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == "probe":
+        tablebase = Tablebase(arguments.directory)
+        result = tablebase.probe(position_from_fen(arguments.fen))
+        tablebase.close()
+        if result is None:
+            print("No table for this position")
+        else:
+            outcome, plies = result
+            print(outcome if plies is None else f"{outcome}, {plies} moves (plies) to mate")
+        return
+
+    os.makedirs(arguments.directory, exist_ok=True)
+    tables = {}
+    # Promotions need the Queen and Rook tables, build them first if they are needed
+    materials = list(arguments.materials)
+    if "KPK" in materials:
+        materials = [material for material in PROMOTION_TABLES.values() if material not in materials] + materials
+        materials.sort(key=lambda material: material == "KPK")
+
+    for material in materials:
+        start = time.perf_counter()
+        tables[material] = generate(material, tables, report=print)
+        path = os.path.join(arguments.directory, material + ".tb")
+        write_table(path, material, tables[material])
+        print(f"{material}: written to {path} ({os.path.getsize(path):,} bytes) in "
+              f"{time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Checks the running evaluation totals and Zobrist hash a Position keeps up to date in make_move and unmake_move
+against recompute_scores and hash_position, which work them out from scratch
+"""
+import random
+
+import pytest
+
+from board_handler import initialise_position
+from evaluation import recompute_scores
+from fen import position_from_fen
+from piece_moves import generate_legal_moves
+from zobrist import hash_position
+
+GAMES = 50
+MAX_PLIES = 120
+
+# Positions with pawns about to promote, so promotions and their undoing are covered too
+START_FENS = ["n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1", "8/P1k5/K7/8/8/8/8/8 w - - 0 1"]
+
+
+def assert_totals_match(position, context: str):
+    assert (position.middlegame, position.endgame, position.phase) == recompute_scores(position), context
+    assert position.zobrist == hash_position(position), context
+
+
+def play_random_game(position, rng: random.Random):
+    """
+    Play random moves, checking the totals after each, then unmake them all, checking after each unmake
+    """
+    plies = 0
+    for plies in range(1, MAX_PLIES + 1):
+        moves = generate_legal_moves(position)
+        if not moves:
+            break
+        position.make_move(*rng.choice(moves))
+        assert_totals_match(position, f"after move {plies}")
+
+    while position.history:
+        position.unmake_move()
+        plies -= 1
+        assert_totals_match(position, f"after unmaking back to move {plies}")
+
+
+@pytest.mark.parametrize("seed", range(GAMES))
+def test_random_game_from_start(seed):
+    play_random_game(initialise_position(), random.Random(seed))
+
+
+@pytest.mark.parametrize("fen", START_FENS)
+def test_random_games_with_promotions(fen):
+    rng = random.Random(fen)
+    for _ in range(5):
+        position = position_from_fen(fen)
+        assert_totals_match(position, "before any moves")
+        play_random_game(position, rng)
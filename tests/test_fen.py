@@ -0,0 +1,82 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Checks FEN is read and written back unchanged, and that fields and positions which aren't valid are rejected
+"""
+import pytest
+
+from bitboard import InvalidPositionError
+from board_handler import initialise_position
+from fen import START_FEN, parse_fen, position_to_fen, board_from_fen, board_to_fen, validate_fen, validate_position
+
+ROUND_TRIP_FENS = [
+    START_FEN,
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w Kq - 12 34",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 3 80",
+    "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+]
+
+INVALID_FIELD_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR",                                # No player to move
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",                   # Player to move not w or b
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",                            # 7 rows
+    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",                   # Row of 9 squares
+    "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",                   # Not a piece
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 extra",             # 7 fields
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KX - 0 1",                     # Castling letter
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KKq - 0 1",                    # Castling letter repeated
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e4 0 1",                  # En passant not on row 3 or 6
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - -1 1",                  # Negative halfmove clock
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - x 1",                   # Halfmove clock not a number
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 0",                   # Move number below 1
+]
+
+INVALID_POSITION_FENS = [
+    ("rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1", "B has 0 Kings"),
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKKNR w - - 0 1", "W has 2 Kings"),
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/PNBQKBNR w - - 0 1", "Pawn on the first or last row"),
+    ("4k3/8/8/8/8/8/8/4K2r w - - 0 1", None),  # The player to move may be in check
+    ("4k3/8/8/8/8/8/8/4K2r b - - 0 1", "W is in check but it is not their turn"),
+]
+
+
+@pytest.mark.parametrize("fen", ROUND_TRIP_FENS)
+def test_round_trip(fen):
+    record = parse_fen(fen)
+    assert position_to_fen(*record) == fen
+    assert validate_fen(fen) is None
+
+
+def test_start_position():
+    record = parse_fen(START_FEN)
+    assert record.position.mailbox == initialise_position().mailbox
+    assert record.position.player == "W"
+    assert record[1:] == ("KQkq", "-", 0, 1)
+
+
+def test_fields_default_when_left_out():
+    record = parse_fen("4k3/8/8/8/8/8/8/4K3 b")
+    assert record[1:] == ("-", "-", 0, 1)
+    assert position_to_fen(record.position) == "4k3/8/8/8/8/8/8/4K3 b - - 0 1"
+
+
+def test_board_round_trip():
+    board_state, player = board_from_fen(ROUND_TRIP_FENS[2])
+    assert board_to_fen(board_state, player, "Kq", "-", 12, 34) == ROUND_TRIP_FENS[2]
+
+
+@pytest.mark.parametrize("fen", INVALID_FIELD_FENS)
+def test_invalid_fields_rejected(fen):
+    with pytest.raises(ValueError):
+        parse_fen(fen)
+    assert validate_fen(fen) is not None
+
+
+@pytest.mark.parametrize("fen, reason", INVALID_POSITION_FENS)
+def test_invalid_positions_rejected(fen, reason):
+    assert validate_fen(fen) == reason
+    if reason is not None:
+        with pytest.raises(InvalidPositionError):
+            validate_position(parse_fen(fen).position)
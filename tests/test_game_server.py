@@ -0,0 +1,100 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Plays games through the game server's line protocol, both by calling answer directly and over a real TCP connection
+"""
+import asyncio
+
+import pytest
+
+from fen import START_FEN
+from game_server import GameServer, MAX_LINE_LENGTH
+
+
+def run_commands(lines: list):
+    """
+    :param lines: Commands to send one after another to a new server
+    :return: The response to each command
+    """
+    async def send_all():
+        server = GameServer(1)
+        try:
+            return [(await server.answer(line))[1] for line in lines]
+        finally:
+            server.executor.shutdown()
+
+    return asyncio.run(send_all())
+
+
+def test_new_move_undo_board():
+    assert run_commands(["NEW", "MOVE 1 e2e4", "BOARD 1", "MOVE 1 e7e5", "BOARD 1", "UNDO 1", "BOARD 1",
+                         "STATUS 1"]) == [
+        "OK 1",
+        "OK turn=Black status=- result=-",
+        "OK rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b - - 0 1",
+        "OK turn=White status=- result=-",
+        "OK rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w - - 0 2",
+        "OK turn=Black status=- result=-",
+        "OK rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b - - 0 1",
+        "OK turn=Black status=- result=-",
+    ]
+
+
+def test_new_from_fen_keeps_move_number():
+    fen = "4k3/8/8/8/8/8/4P3/4K3 b - - 0 12"
+    assert run_commands([f"NEW {fen}", "BOARD 1", "MOVE 1 e8d8", "BOARD 1", "MOVE 1 e2e4", "BOARD 1", "UNDO 1",
+                         "UNDO 1", "BOARD 1"]) == [
+        "OK 1",
+        f"OK {fen}",
+        "OK turn=White status=- result=-",
+        "OK 3k4/8/8/8/8/8/4P3/4K3 w - - 0 13",
+        "OK turn=Black status=- result=-",
+        "OK 3k4/8/8/8/4P3/8/8/4K3 b - - 0 13",
+        "OK turn=White status=- result=-",
+        "OK turn=Black status=- result=-",
+        f"OK {fen}",
+    ]
+
+
+def test_checkmate():
+    responses = run_commands(["NEW", "MOVE 1 f2f3", "MOVE 1 e7e5", "MOVE 1 g2g4", "MOVE 1 d8h4", "MOVE 1 a2a3"])
+    assert responses[-2] == "OK turn=White status=Checkmate result=Black"
+    assert responses[-1] == "ERROR The game is over"
+
+
+@pytest.mark.parametrize("line, error", [
+    ("NEW 4k3/8/8/8/8/8/8/8 w - - 0 1", "ERROR Invalid FEN: W has 0 Kings"),
+    (f"NEW {START_FEN}", "ERROR Castling and en passant are not supported, give - for both in the FEN"),
+    ("NEW 4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2",
+     "ERROR Castling and en passant are not supported, give - for both in the FEN"),
+    ("MOVE 9 e2e4", "ERROR There is no game 9"),
+    ("MOVE 1 e2", "ERROR A move in coordinate form is needed, e.g. e2e4 or e7e8q"),
+    ("MOVE 1 e2e5", "ERROR White cannot move from e2 to e5"),
+    ("UNDO 1", "ERROR There is no move to take back"),
+    ("BOARD x", "ERROR x is not a game id"),
+])
+def test_errors(line, error):
+    assert run_commands(["NEW", line])[1] == error
+
+
+def test_over_tcp():
+    async def play():
+        server = GameServer(1)
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0, limit=MAX_LINE_LENGTH)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"NEW\nMOVE 1 g1f3\nBOARD 1\nQUIT\n")
+            await writer.drain()
+            lines = [(await reader.readline()).decode().strip() for _ in range(4)]
+            writer.close()
+            await writer.wait_closed()
+            return lines
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.executor.shutdown()
+
+    assert asyncio.run(play()) == ["OK 1", "OK turn=Black status=- result=-",
+                                   "OK rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b - - 0 1", "OK"]
@@ -0,0 +1,95 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Checks the legal moves piece_moves gives, filtered with the check and pin masks from checkmate.legality_masks, against
+the slow way of finding them: playing every move a piece could make and keeping those that don't leave its own King in
+check
+"""
+import random
+
+import pytest
+
+from bitboard import OPPONENT, iterate_indexes, position_from_board
+from board_handler import initialise_position
+from checkmate import is_check
+from move_encoding import MoveStack, decode_move
+from piece_moves import generate_all_legal_moves, generate_legal_moves, move_targets
+
+GAMES = 20
+MAX_PLIES = 120
+PLACEMENT_BATCHES = 20
+PLACEMENTS_PER_BATCH = 200
+MAX_EXTRA_PIECES = 10
+
+PIECE_TYPES = "QRBNP"
+
+
+def brute_force_moves(position):
+    """
+    :param position: The position to find moves in
+    :return: Set of (from index, to index) of every move by the player to move which doesn't leave their King in check
+    """
+    player = position.player
+    moves = set()
+    for index in iterate_indexes(position.occupancy[player]):
+        for target in iterate_indexes(move_targets(position, index)):
+            # Which piece a pawn is promoted to doesn't change whether the move is legal
+            promotion = "Q" if position.mailbox[index][1] == "P" and target // 8 in (0, 7) else None
+            position.make_move(index, target, promotion)
+            if not is_check(player, position):
+                moves.add((index, target))
+            position.unmake_move()
+    return moves
+
+
+def assert_moves_match(position, context: str):
+    expected = brute_force_moves(position)
+    moves = generate_legal_moves(position)
+    assert {(from_index, to_index) for from_index, to_index, _ in moves} == expected, context
+
+    stack = MoveStack(1)
+    start, end = stack.generate(position, 0)
+    assert [decode_move(move) for move in stack.moves(0, end)] == moves, context
+
+    board_moves = generate_all_legal_moves(position.player, position)
+    assert {(from_row * 8 + from_col, to_row * 8 + to_col) for (from_row, from_col), targets in board_moves.items()
+            for to_row, to_col in targets} == expected, context
+
+
+def random_placement(rng: random.Random):
+    """
+    :return: Position with both Kings and some other pieces on random squares, with the player not to move not in check
+    """
+    while True:
+        squares = rng.sample(range(64), 2 + rng.randint(0, MAX_EXTRA_PIECES))
+        board_state = {divmod(squares[0], 8): "WK", divmod(squares[1], 8): "BK"}
+        for index in squares[2:]:
+            piece_type = rng.choice(PIECE_TYPES)
+            if piece_type == "P" and index // 8 in (0, 7):
+                continue
+            board_state[divmod(index, 8)] = rng.choice("WB") + piece_type
+
+        position = position_from_board(board_state, rng.choice("WB"))
+        if not is_check(OPPONENT[position.player], position):
+            return position
+
+
+@pytest.mark.parametrize("seed", range(GAMES))
+def test_random_game(seed):
+    rng = random.Random(seed)
+    position = initialise_position()
+    for plies in range(MAX_PLIES):
+        assert_moves_match(position, f"after move {plies}")
+        moves = generate_legal_moves(position)
+        if not moves:
+            break
+        position.make_move(*rng.choice(moves))
+
+
+@pytest.mark.parametrize("batch", range(PLACEMENT_BATCHES))
+def test_random_placements(batch):
+    rng = random.Random(batch)
+    for placement in range(PLACEMENTS_PER_BATCH):
+        position = random_placement(rng)
+        assert_moves_match(position, f"placement {placement}: {sorted(enumerate(position.mailbox))}")
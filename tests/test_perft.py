@@ -0,0 +1,15 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Checks move generation against the known perft counts of the suite in perft.py
+"""
+from perft import run_suite
+
+
+def test_suite_up_to_depth_3():
+    results = run_suite(max_depth=3)
+    assert results, "The suite has no entries of depth 3 or less"
+    failures = [f"{result['name']} depth {result['depth']}: {result['nodes']} nodes, expected {result['expected']}"
+                for result in results if not result["passed"]]
+    assert not failures, "\n".join(failures)
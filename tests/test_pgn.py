@@ -0,0 +1,95 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Checks PGN games are read and their SAN moves resolved to the right squares, and that san_move writes each move back
+the same way
+"""
+import pytest
+
+from board_handler import initialise_position
+from fen import position_from_fen, position_to_fen
+from pgn import read_games, resolve_san, san_move, write_game, SanError
+
+GAME = """[Event "Scholar's mate"]
+[White "White"]
+[Black "Black"]
+[Result "1-0"]
+
+1. e4 e5 {The usual reply} 2. Bc4 Nc6 (2... Nf6 3. d3) 3. Qh5 $2 Nf6?? ; Doesn't stop the threat
+4.Qxf7# 1-0
+
+[Event "Unfinished"]
+
+1. d4 d5
+"""
+
+GAME_FEN = "r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 4"
+
+# (FEN, SAN, expected from square, to square and promotion as (row, col) squares)
+SAN_MOVES = [
+    ("4k3/8/8/8/8/8/8/1N2KN2 w - - 0 1", "Nbd2", ((7, 1), (6, 3), None)),
+    ("4k3/8/8/8/8/8/8/1N2KN2 w - - 0 1", "Nfd2", ((7, 5), (6, 3), None)),
+    ("4k3/R7/8/8/8/8/8/R3K3 w - - 0 1", "R1a4", ((7, 0), (4, 0), None)),
+    ("4k3/R7/8/8/8/8/8/R3K3 w - - 0 1", "R7a4", ((1, 0), (4, 0), None)),
+    ("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b8=Q+", ((1, 1), (0, 1), "Q")),
+    ("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b8=N", ((1, 1), (0, 1), "N")),
+    ("r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "bxa8=R+", ((1, 1), (0, 0), "R")),
+    ("4k3/8/8/8/8/8/6p1/4K3 b - - 0 1", "g1=Q+", ((6, 6), (7, 6), "Q")),
+]
+
+# (FEN, SAN, start of the SanError message)
+BAD_SAN_MOVES = [
+    ("4k3/8/8/8/8/8/8/1N2KN2 w - - 0 1", "Nd2", "Ambiguous move"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "O-O", "Castling is not supported"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "O-O-O+", "Castling is not supported"),
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2", "exd6", "En passant is not supported"),
+    ("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b8", "Pawn reaches the last row without a promotion piece"),
+    ("4k3/8/8/8/8/8/1P6/4K3 w - - 0 1", "b3=Q", "Only a pawn reaching the last row can promote"),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", "Qd4", "Illegal move"),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", "Kz9", "Not a SAN move"),
+]
+
+
+def test_read_games():
+    games = list(read_games(GAME.splitlines(keepends=True)))
+    assert len(games) == 2
+    assert games[0].tags["Event"] == "Scholar's mate"
+    assert games[0].moves == ["e4", "e5", "Bc4", "Nc6", "Qh5", "Nf6??", "Qxf7#"]
+    assert games[0].result == "1-0"
+    assert games[0].line_number == 1
+    assert games[1].moves == ["d4", "d5"]
+    assert games[1].result == "*"
+
+
+def test_replay_known_game():
+    game = next(read_games(GAME.splitlines(keepends=True)))
+    position = initialise_position()
+    for san in game.moves:
+        from_square, to_square, promotion = resolve_san(san, position)
+        assert san_move(position, from_square, to_square, promotion) == san.rstrip("?!")
+        position.make_move(from_square[0] * 8 + from_square[1], to_square[0] * 8 + to_square[1], promotion)
+
+    assert position_to_fen(position, "KQkq", "-", 0, 4) == GAME_FEN
+
+
+@pytest.mark.parametrize("fen, san, move", SAN_MOVES)
+def test_resolve_san(fen, san, move):
+    position = position_from_fen(fen)
+    assert resolve_san(san, position) == move
+    assert san_move(position, *move) == san
+
+
+@pytest.mark.parametrize("fen, san, reason", BAD_SAN_MOVES)
+def test_bad_san_rejected(fen, san, reason):
+    with pytest.raises(SanError, match=f"^{reason}"):
+        resolve_san(san, position_from_fen(fen))
+
+
+def test_write_game_reads_back():
+    sans = ["e4", "e5", "Bc4", "Nc6", "Qh5", "Nf6", "Qxf7#"]
+    text = write_game({"White": "White", "Black": "Black"}, sans, "1-0")
+    game = next(read_games(text.splitlines(keepends=True)))
+    assert game.moves == sans
+    assert game.result == "1-0"
+    assert game.tags["Result"] == "1-0"
@@ -0,0 +1,252 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Plays many games between two move choosers across a pool of worker processes, to stress the rules and to compare how
+well different ways of choosing moves play. Each game is a GameSession (see game_session.py) with no input(), every
+move of which is picked by a chooser: a function called with the session and a random.Random which returns the move
+as (from square, to square, promotion piece type or None). The built in choosers are
+    random   any legal move
+    greedy   the capture of the most valuable piece, otherwise any legal move
+    search   the best move found by a 2 move deep search (see search.py)
+and any other function can be used by giving it as module:function.
+
+Games start from a set of opening positions, each played twice so both choosers get each side. The rules have no draw
+by repetition or 50 move rule yet, so a game still going after --max-plies moves is counted as a draw. A chooser that
+raises an error or gives an illegal move loses the game, with the termination "Illegal move".
+
+Results are written as each game finishes (one JSON object per line, and the game as PGN) so nothing is lost if the run
+is stopped. The summary gives the wins, draws and losses of the first chooser, the Elo difference they suggest with a
+95% confidence interval, games per second and how busy each worker process was.
+
+Usage:
+    python tournament.py random greedy --games 200 --workers 4 --results results.jsonl --pgn games.pgn
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from bitboard import position_from_board
+from fen import board_from_fen
+from game_session import GameSession, DRAW
+from piece_moves import PROMOTION_PIECES
+from pgn import san_move, write_game
+
+OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w - - 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w - - 0 2",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w - - 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/2P5/8/PP1PPPPP/RNBQKBNR w - - 1 2",
+]
+DEFAULT_MAX_PLIES = 400
+
+# Values for choosing the most valuable capture
+CAPTURE_VALUES = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 0}
+
+
+def random_chooser(session: GameSession, rng: random.Random):
+    """
+    :return: Any legal move, promoting to any piece
+    """
+    from_square = rng.choice(sorted(session.legal_moves))
+    to_square = rng.choice(session.legal_moves[from_square])
+    promotion = rng.choice(PROMOTION_PIECES) if session.needs_promotion(from_square, to_square) else None
+    return from_square, to_square, promotion
+
+
+def greedy_chooser(session: GameSession, rng: random.Random):
+    """
+    :return: The capture of the most valuable piece (with the least valuable piece if there is a choice), otherwise any
+    legal move. Pawns always promote to a Queen.
+    """
+    board_state = session.board_state
+    best_move = None
+    best_value = None
+    for from_square in sorted(session.legal_moves):
+        for to_square in session.legal_moves[from_square]:
+            if to_square in board_state:
+                value = CAPTURE_VALUES[board_state[to_square][1]] * 10 - CAPTURE_VALUES[board_state[from_square][1]]
+                if best_value is None or value > best_value:
+                    best_move, best_value = (from_square, to_square), value
+
+    if best_move is None:
+        from_square = rng.choice(sorted(session.legal_moves))
+        best_move = from_square, rng.choice(session.legal_moves[from_square])
+    return best_move + ("Q" if session.needs_promotion(*best_move) else None,)
+
+
+def search_chooser(session: GameSession, rng: random.Random):
+    """
+    :return: The best move found by a 2 move deep search
+    """
+    from_square, to_square, promotion, _ = session.find_move(max_depth=2)
+    return from_square, to_square, promotion
+
+
+CHOOSERS = {"random": random_chooser, "greedy": greedy_chooser, "search": search_chooser}
+
+
+def load_chooser(name: str):
+    """
+    :param name: Name of a built in chooser or module:function
+    :return: The chooser function
+    :raises ValueError: If there is no such chooser
+    """
+    if name in CHOOSERS:
+        return CHOOSERS[name]
+    module_name, _, function_name = name.partition(":")
+    try:
+        return getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError, ValueError):
+        raise ValueError(f"No chooser called {name}, use {', '.join(CHOOSERS)} or module:function")
+
+
+def play_game(game: tuple):
+    """
+    Worker process job: play one game
+    :param game: (game number, opening FEN, white chooser name, black chooser name, random seed, max plies)
+    :return: Dict of the game's result, ready to be written as JSON, with its PGN under "pgn"
+    """
+    game_number, opening, white, black, seed, max_plies = game
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    choosers = {"White": load_chooser(white), "Black": load_chooser(black)}
+
+    board_state, player = board_from_fen(opening)
+    session = GameSession(board_state, "White" if player == "W" else "Black")
+    sans = []
+    loser = None
+    while session.result is None and len(sans) < max_plies:
+        # A chooser that fails or picks an illegal move (e.g. a module:function one) loses the game rather than
+        # stopping the whole run
+        try:
+            from_square, to_square, promotion = choosers[session.player](session, rng)
+            san = san_move(position_from_board(session.board_state, session.player[0]), from_square, to_square,
+                           promotion)
+            session.move(from_square, to_square, promotion)
+        except Exception:  # Includes IllegalMoveError
+            loser = session.player
+            break
+        sans.append(san)
+
+    if loser is not None:
+        result, termination = ("0-1" if loser == "White" else "1-0"), "Illegal move"
+    elif session.result is None:
+        result, termination = "1/2-1/2", "Move limit"
+    elif session.result == DRAW:
+        result, termination = "1/2-1/2", "Stalemate"
+    else:
+        result, termination = ("1-0" if session.result == "White" else "0-1"), "Checkmate"
+
+    tags = {"Event": "Tournament", "Round": str(game_number), "White": white, "Black": black,
+            "Termination": termination}
+    return {"game": game_number,
+            "white": white,
+            "black": black,
+            "opening": opening,
+            "result": result,
+            "termination": termination,
+            "plies": len(sans),
+            "seconds": round(time.perf_counter() - start, 6),
+            "worker": os.getpid(),
+            "pgn": write_game(tags, sans, result, opening)}
+
+
+def elo_difference(wins: int, draws: int, losses: int):
+    """
+    Estimate the Elo rating difference implied by a set of results, with a 95% confidence interval from the spread of
+    the game scores
+    :param wins: Games won
+    :param draws: Games drawn
+    :param losses: Games lost
+    :return: (Elo difference, lower bound, upper bound). Infinite when every game was won or lost
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def to_elo(expected_score):
+        if expected_score <= 0:
+            return -math.inf
+        if expected_score >= 1:
+            return math.inf
+        return -400 * math.log10(1 / expected_score - 1)
+
+    return to_elo(score), to_elo(score - margin), to_elo(score + margin)
+
+
+def schedule(first: str, second: str, games: int, openings: list, seed: int, max_plies: int):
+    """
+    :return: Generator of play_game jobs, going through the openings with the choosers swapping sides every game
+    """
+    for game_number in range(1, games + 1):
+        opening = openings[(game_number - 1) // 2 % len(openings)]
+        white, black = (first, second) if game_number % 2 else (second, first)
+        yield game_number, opening, white, black, seed + game_number, max_plies
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Play games between two move choosers")
+    parser.add_argument("first", help="First chooser: random, greedy, search or module:function")
+    parser.add_argument("second", help="Second chooser")
+    parser.add_argument("--games", type=int, default=100, help="Number of games to play (default 100)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--openings", help="File of opening positions in FEN, one per line")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES,
+                        help=f"Moves before a game is called a draw (default {DEFAULT_MAX_PLIES})")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random choices")
+    parser.add_argument("--results", default="tournament_results.jsonl", help="File to append results to")
+    parser.add_argument("--pgn", default="tournament_games.pgn", help="File to append the games to")
+    arguments = parser.parse_args(arguments)
+
+    # Check the choosers exist before starting any processes
+    load_chooser(arguments.first)
+    load_chooser(arguments.second)
+    openings = OPENINGS
+    if arguments.openings:
+        with open(arguments.openings) as file:
+            openings = [line.strip() for line in file if line.strip()]
+
+    jobs = schedule(arguments.first, arguments.second, arguments.games, openings, arguments.seed,
+                    arguments.max_plies)
+    scores = {"win": 0, "draw": 0, "loss": 0}
+    busy_seconds = {}
+    start = time.perf_counter()
+    with Pool(arguments.workers) as pool, open(arguments.results, "a") as results, open(arguments.pgn, "a") as pgn:
+        for game in pool.imap_unordered(play_game, jobs):
+            pgn.write(game.pop("pgn"))
+            results.write(json.dumps(game) + "\n")
+            pgn.flush()
+            results.flush()
+
+            busy_seconds[game["worker"]] = busy_seconds.get(game["worker"], 0.0) + game["seconds"]
+            # Odd numbered games give the first chooser White (see schedule), which still holds when both choosers
+            # are the same
+            first_is_white = game["game"] % 2 == 1
+            first_won = game["result"] == ("1-0" if first_is_white else "0-1")
+            scores["draw" if game["result"] == "1/2-1/2" else "win" if first_won else "loss"] += 1
+    seconds = time.perf_counter() - start
+
+    wins, draws, losses = scores["win"], scores["draw"], scores["loss"]
+    elo, lower, upper = elo_difference(wins, draws, losses)
+    games = wins + draws + losses
+    print(f"{arguments.first} vs {arguments.second}: +{wins} ={draws} -{losses} "
+          f"({(wins + draws / 2) / max(games, 1):.1%})")
+    print(f"Elo difference: {elo:+.0f} (95% confidence {lower:+.0f} to {upper:+.0f})")
+    print(f"{games} games in {seconds:.2f}s ({games / max(seconds, 1e-9):.2f} games/s)")
+    for worker, busy in sorted(busy_seconds.items()):
+        print(f"Worker {worker}: busy {busy:.2f}s ({busy / max(seconds, 1e-9):.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Transposition table for the search, kept in a block of shared memory so every worker process of a parallel search
+(see parallel_search.py) reads and writes the same table. The same position is often reached by different orders of
+moves, and a position one worker has already searched doesn't need searching again by another.
+
+Each entry is packed into a fixed 16 byte slot rather than stored as Python objects, so a table of a few hundred
+megabytes holds millions of entries:
+    key     8 bytes  the position's Zobrist hash (see zobrist.py)
+    score   4 bytes  signed centipawns
+    move    2 bytes  best move packed as in move_encoding.py, 0 for none
+    depth   1 byte   signed depth the position was searched to
+    bound   1 byte   EXACT, LOWER or UPPER, 0 for an empty slot
+
+Like MoveCache (see move_cache.py) each key can only go in one slot (key % number of slots). Writing a slot is several
+bytes so it can't be done atomically; slots are guarded by a fixed set of locks instead, slot i using lock
+i % number of locks, so processes only wait for each other when they touch slots sharing a lock.
+"""
+import struct
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+
+from move_encoding import encode_move, decode_move, NO_MOVE
+
+ENTRY = struct.Struct("<QiHbB")
+DEFAULT_MEMORY_SIZE = 64 * 1024 * 1024
+DEFAULT_LOCK_STRIPES = 256
+
+# Bounds: the score is exact, or the search was cut off so the real score is at least / at most the score stored
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+
+def pack_move(move: tuple):
+    """
+    :param move: (from index, to index, promotion piece type or None), or None for no move
+    :return: The move packed into 16 bits (see move_encoding.py)
+    """
+    if move is None:
+        return NO_MOVE
+    return encode_move(*move)
+
+
+class TranspositionTable:
+    """
+    Fixed size table of position hash -> (depth, bound, score, best move) in shared memory. The process that creates
+    the table owns the shared memory and should unlink it when done (or use the table in a with statement); other
+    processes get the table by it being passed to them when they start, e.g. as a Pool initializer argument.
+    """
+
+    def __init__(self, memory_size: int = DEFAULT_MEMORY_SIZE, lock_stripes: int = DEFAULT_LOCK_STRIPES):
+        """
+        Create a new, empty table
+        :param memory_size: Number of bytes of shared memory to use, rounded down to a whole number of slots
+        :param lock_stripes: Number of locks to spread the slots across
+        """
+        self.size = max(1, memory_size // ENTRY.size)
+        self.memory = SharedMemory(create=True, size=self.size * ENTRY.size)
+        self.locks = [Lock() for _ in range(lock_stripes)]
+        self.owner = True
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def __getstate__(self):
+        # Only the name of the shared memory is passed on, the other process attaches to the same block. Locks can
+        # only be passed on when a process is started.
+        return {"name": self.memory.name, "size": self.size, "locks": self.locks}
+
+    def __setstate__(self, state: dict):
+        self.size = state["size"]
+        self.memory = SharedMemory(name=state["name"])
+        self.locks = state["locks"]
+        self.owner = False
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def clear(self):
+        """
+        Empty every slot of the table
+        """
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            self.memory.buf[:] = bytes(len(self.memory.buf))
+        finally:
+            for lock in self.locks:
+                lock.release()
+
+    def probe(self, key: int):
+        """
+        Look up a position
+        :param key: The position's Zobrist hash
+        :return: (depth, bound, score, best move) if the position is in the table, otherwise None
+        """
+        slot = key % self.size
+        with self.locks[slot % len(self.locks)]:
+            stored_key, score, move, depth, bound = ENTRY.unpack_from(self.memory.buf, slot * ENTRY.size)
+
+        if bound == 0 or stored_key != key:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return depth, bound, score, decode_move(move)
+
+    def store(self, key: int, depth: int, bound: int, score: int, move: tuple = None):
+        """
+        Store the result of searching a position. A different position in the slot is always replaced, but a deeper
+        result for the same position is kept over a shallower one.
+        :param key: The position's Zobrist hash
+        :param depth: Depth the position was searched to
+        :param bound: EXACT, LOWER or UPPER
+        :param score: Score of the position from the point of view of the player to move
+        :param move: Best move found, None if there isn't one
+        """
+        slot = key % self.size
+        offset = slot * ENTRY.size
+        with self.locks[slot % len(self.locks)]:
+            stored_key, _, _, stored_depth, stored_bound = ENTRY.unpack_from(self.memory.buf, offset)
+            if stored_bound == 0 or stored_key != key or depth >= stored_depth:
+                ENTRY.pack_into(self.memory.buf, offset, key, score, pack_move(move), depth, bound)
+
+    def stats(self):
+        """
+        :return: Dict of this process's hit and miss counters and how full the whole table is
+        """
+        lookups = self.hits + self.misses
+        bounds = bytes(self.memory.buf[ENTRY.size - 1::ENTRY.size])
+        entries = self.size - bounds.count(0)
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "slots": self.size,
+                "memory_size": self.size * ENTRY.size}
+
+    def close(self):
+        """
+        Stop using the table in this process. The process that created the table also frees the shared memory.
+        """
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,311 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+UCI (Universal Chess Interface) front end, so the computer player can be used from chess GUIs and match runners
+instead of main.py. Commands are read from stdin and answers written to stdout, one per line:
+    uci                                  -> id name / id author / option / uciok
+    isready                              -> readyok
+    ucinewgame                           Forget the previous game (clears the transposition table)
+    position startpos [moves e2e4 ...]   Set up the position, from the start or a FEN, then play the moves
+    position fen <fen> [moves ...]
+    go [wtime btime winc binc movestogo movetime depth nodes infinite]
+    stop                                 Stop searching and give the best move found so far
+    setoption name Hash value <MB>       Size of the transposition table
+    quit
+Moves are played through a GameSession (see game_session.py), so each is checked against the rules and promotions
+come from the move itself (e.g. e7e8q) rather than a prompt. A move that can't be played is reported with an
+"info string" and the moves after it are ignored. Castling and en passant are not part of the rules yet.
+
+The search (see search.py) runs on a background thread while this thread keeps reading commands, so isready is
+answered and stop takes effect straight away: stop sets a threading.Event which the search checks at every position.
+While it searches, "info" lines give the depth, score, nodes, time and best line of each finished depth.
+
+Usage:
+    python uci.py
+"""
+import argparse
+import sys
+import threading
+
+from bitboard import index_to_square, position_from_board
+from fen import board_from_fen, START_FEN
+from game_session import GameSession, IllegalMoveError
+from notation import move_name, parse_move_name
+from search import search, MATE_SCORE, MAX_DEPTH
+from transposition_table import TranspositionTable
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "William Chio"
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+
+# Time management: with no moves to go given, assume the game lasts this many more moves, and always leave a margin for
+# the time it takes to send the move
+DEFAULT_MOVES_TO_GO = 30
+MOVE_OVERHEAD = 0.05
+
+
+def format_score(score: int):
+    """
+    :param score: Search score in centipawns for the player to move
+    :return: The score as UCI gives it, "cp <centipawns>" or "mate <moves>" (negative when being mated)
+    """
+    if score >= MATE_SCORE - MAX_DEPTH:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_SCORE + MAX_DEPTH:
+        return f"mate {-((MATE_SCORE + score) // 2)}"
+    return f"cp {score}"
+
+
+def parse_go(words: list):
+    """
+    :param words: Words of a go command after "go"
+    :return: Dict of the limits given, e.g. {"wtime": 60000, "depth": 6, "infinite": True}. Times are in milliseconds
+    """
+    limits = {}
+    words = iter(words)
+    for word in words:
+        if word in ("infinite", "ponder"):
+            limits[word] = True
+        elif word in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes", "mate"):
+            try:
+                limits[word] = int(next(words))
+            except (StopIteration, ValueError):
+                pass
+        elif word == "searchmoves":
+            break  # Restricting the moves searched is not supported
+    return limits
+
+
+def time_for_move(limits: dict, player: str):
+    """
+    :param limits: Limits from parse_go
+    :param player: "W" or "B", the player to move
+    :return: Seconds to search for, None for no time limit
+    """
+    if "movetime" in limits:
+        return max(0.0, limits["movetime"] / 1000 - MOVE_OVERHEAD)
+
+    time_left = limits.get("wtime" if player == "W" else "btime")
+    if time_left is None:
+        return None
+    increment = limits.get("winc" if player == "W" else "binc", 0)
+    moves_to_go = limits.get("movestogo") or DEFAULT_MOVES_TO_GO
+    seconds = (time_left / moves_to_go + increment * 0.8) / 1000
+    return max(0.0, min(seconds, time_left / 1000 - MOVE_OVERHEAD))
+
+
+class UciEngine:
+    """
+    The state of a UCI session: the game set up by the last position command and the search running in the background
+    """
+
+    def __init__(self, output=sys.stdout):
+        """
+        :param output: Where to write answers
+        """
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.session = GameSession()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.table = None
+        self.search_thread = None
+        self.stop_event = threading.Event()
+
+    def send(self, line: str):
+        """
+        Write a line to the GUI, from either thread
+        """
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def close(self):
+        self.stop_search()
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+
+    def stop_search(self):
+        """
+        Stop the background search if there is one and wait for it to send its best move
+        """
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def handle(self, line: str):
+        """
+        Carry out one command
+        :param line: The command as sent by the GUI
+        :return: False if the command was quit, otherwise True
+        """
+        words = line.split()
+        if not words:
+            return True
+        command, arguments = words[0], words[1:]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop_search()
+            if self.table is not None:
+                self.table.clear()
+            self.session = GameSession()
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "position":
+            self.stop_search()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop_search()
+            self.go(parse_go(arguments))
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            self.close()
+            return False
+        elif command not in ("debug", "ponderhit", "register"):
+            self.send(f"info string Unknown command {command}")
+        return True
+
+    def set_option(self, arguments: list):
+        """
+        :param arguments: Words of a setoption command after "setoption", i.e. name <name> value <value>
+        """
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        if name.removeprefix("name ").strip().lower() != "hash":
+            self.send(f"info string Unknown option {name.removeprefix('name ').strip()}")
+            return
+        try:
+            self.hash_mb = max(1, min(MAX_HASH_MB, int(value)))
+        except ValueError:
+            self.send(f"info string Hash must be a number of MB, not {value}")
+            return
+
+        self.stop_search()
+        if self.table is not None:
+            self.table.close()
+            self.table = None  # Made again at the new size by the next search
+
+    def set_position(self, arguments: list):
+        """
+        Set up the game from a position command
+        :param arguments: Words of the command after "position"
+        """
+        if "moves" in arguments:
+            moves = arguments[arguments.index("moves") + 1:]
+            arguments = arguments[:arguments.index("moves")]
+        else:
+            moves = []
+
+        if arguments[:1] == ["startpos"]:
+            fen = START_FEN
+        elif arguments[:1] == ["fen"]:
+            fen = " ".join(arguments[1:])
+        else:
+            self.send("info string position needs startpos or fen")
+            return
+
+        try:
+            board_state, player = board_from_fen(fen)
+            session = GameSession(board_state, "White" if player == "W" else "Black")
+        except ValueError as error:  # Includes InvalidPositionError from a position with a King missing
+            self.send(f"info string Invalid FEN: {error}")
+            return
+
+        for name in moves:
+            move = parse_move_name(name)
+            try:
+                if move is None:
+                    raise IllegalMoveError(f"{name} is not a move in coordinate form")
+                from_index, to_index, promotion = move
+                session.move(index_to_square(from_index), index_to_square(to_index), promotion)
+            except IllegalMoveError as error:
+                self.send(f"info string Illegal move {name}: {error}, ignoring it and the moves after it")
+                break
+        self.session = session
+
+    def report(self, result):
+        """
+        Send an info line for a finished depth of the search
+        :param result: SearchResult of the depth
+        """
+        nodes_per_second = int(result.nodes / result.seconds) if result.seconds > 0 else 0
+        line = " ".join(move_name(move) for move in result.principal_variation)
+        self.send(f"info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} "
+                  f"nps {nodes_per_second} time {int(result.seconds * 1000)} pv {line}")
+
+    def go(self, limits: dict):
+        """
+        Start searching the current position in the background
+        :param limits: Limits from parse_go
+        """
+        if self.table is None:
+            self.table = TranspositionTable(self.hash_mb * 1024 * 1024)
+
+        player = self.session.player[0]
+        position = position_from_board(self.session.board_state, player)
+        infinite = limits.get("infinite", False) or limits.get("ponder", False)
+        time_limit = None if infinite else time_for_move(limits, player)
+        max_depth = limits.get("depth", MAX_DEPTH)
+        if "mate" in limits:
+            max_depth = min(max_depth, 2 * limits["mate"])
+        node_limit = limits.get("nodes")
+        # A plain "go" searches until stopped
+        if time_limit is None and not any(limit in limits for limit in ("depth", "nodes", "mate")):
+            infinite = True
+
+        self.stop_event = threading.Event()
+        self.search_thread = threading.Thread(target=self.run_search,
+                                              args=(position, time_limit, max_depth, node_limit, infinite),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def run_search(self, position, time_limit: float, max_depth: int, node_limit: int, infinite: bool):
+        """
+        Background thread: search and send the best move. In infinite mode the best move is held back until stop. If
+        the search fails the GUI is told why and still gets a bestmove, so it isn't left waiting
+        """
+        try:
+            result = search(position, time_limit, max_depth, node_limit, report=self.report, table=self.table,
+                            stop_event=self.stop_event)
+        except Exception as error:
+            result = None
+            self.send(f"info string Search failed: {error}")
+        if infinite:
+            self.stop_event.wait()
+
+        if result is None or result.move is None:
+            self.send("bestmove 0000")
+        else:
+            best = move_name(result.move)
+            ponder = result.principal_variation[1:2]
+            self.send(f"bestmove {best}" + (f" ponder {move_name(ponder[0])}" if ponder else ""))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Play chess over the Universal Chess Interface on stdin/stdout")
+    parser.parse_args(arguments)
+
+    engine = UciEngine()
+    try:
+        for line in sys.stdin:
+            if not engine.handle(line):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
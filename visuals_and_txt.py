@@ -103,6 +103,45 @@ def message_piece_move_to(player: str, piece: str, raw_square: str):
     print(f"{player} has moved {piece} to {raw_square}\n")
 
 
+def message_computer_move(player: str, piece: str, raw_from_square: str, raw_to_square: str, score: int, depth: int):
+    """
+    Print out text stating the move the computer chose for a player
+    :param player: The player whose turn it is
+    :param piece: The piece moved in board_state form (e.g. BR)
+    :param raw_from_square: The square the piece moved from (e.g. G1)
+    :param raw_to_square: The square the piece moved to (e.g. F3)
+    :param score: The computer's score for the move in centipawns, from the player's point of view
+    :param depth: How many moves ahead the computer searched
+    """
+    piece = piece_translations[piece[1]]
+    print(f"{player} (computer) has moved {piece} from {raw_from_square} to {raw_to_square} "
+          f"(score {score / 100:+.2f}, searched {depth} moves ahead)\n")
+
+
+def message_book_move(player: str, piece: str, raw_from_square: str, raw_to_square: str):
+    """
+    Print out text stating the move played for a player from the opening book
+    :param player: The player whose turn it is
+    :param piece: The piece moved in board_state form (e.g. BR)
+    :param raw_from_square: The square the piece moved from (e.g. G1)
+    :param raw_to_square: The square the piece moved to (e.g. F3)
+    """
+    piece = piece_translations[piece[1]]
+    print(f"{player} (book) has moved {piece} from {raw_from_square} to {raw_to_square}\n")
+
+
+def message_book_moves(player: str, book_moves: list):
+    """
+    Print out the opening book's moves for the player to choose from
+    :param player: The player whose turn it is
+    :param book_moves: List of (raw from square, raw to square, weight), heaviest first
+    """
+    total = sum(weight for _, _, weight in book_moves) or 1
+    moves = ", ".join(f"{raw_from_square}-{raw_to_square} ({weight / total:.0%})"
+                      for raw_from_square, raw_to_square, weight in book_moves)
+    print(f"{player}: Book moves are {moves}\n")
+
+
 def clear_screen():
     """
     Clears the screen of text/visual
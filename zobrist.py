@@ -0,0 +1,55 @@
+"""
+Author: William Chio
+Created: 18/10/26
+
+Zobrist hashing of positions. Every (piece, square) pair is given a random 64-bit key and a position's hash is all of
+the keys for the pieces on it XORed together, along with a key for black being the player to move. Since XOR undoes
+itself, moving a piece only needs the keys for the squares it left and arrived on to be XORed in rather than the whole
+board being hashed again (see Position.add_piece / remove_piece).
+
+The keys come from a fixed seed so the same position always has the same hash, in every process and every run. This
+matters for anything which saves hashes or shares them between processes.
+"""
+import random
+
+ZOBRIST_SEED = 20240522
+
+_generator = random.Random(ZOBRIST_SEED)
+
+# PIECE_KEYS[piece][index] is the key for that piece (e.g. "WP") being on that square index
+PIECE_KEYS = {piece: [_generator.getrandbits(64) for _ in range(64)]
+              for piece in ("WP", "WN", "WB", "WR", "WQ", "WK", "BP", "BN", "BB", "BR", "BQ", "BK")}
+
+# XORed in when it is black's turn
+SIDE_KEY = _generator.getrandbits(64)
+
+# Reserved for castling rights (one key per combination of the 4 rights) and en passant files once they are supported
+CASTLING_KEYS = [_generator.getrandbits(64) for _ in range(16)]
+EN_PASSANT_KEYS = [_generator.getrandbits(64) for _ in range(8)]
+
+
+def hash_board(board_state: dict, player: str = "W"):
+    """
+    Calculate the hash of a board state from scratch
+    :param board_state: The state of the board
+    :param player: The player whose turn it is
+    :return: The position's 64-bit Zobrist hash
+    """
+    zobrist = SIDE_KEY if player[0] == "B" else 0
+    for square, piece in board_state.items():
+        zobrist ^= PIECE_KEYS[piece][square[0] * 8 + square[1]]
+    return zobrist
+
+
+def hash_position(position):
+    """
+    Calculate the hash of a Position from scratch, ignoring the hash it is carrying. Used to check the incrementally
+    updated hash has not drifted.
+    :param position: The position to hash
+    :return: The position's 64-bit Zobrist hash
+    """
+    zobrist = SIDE_KEY if position.player == "B" else 0
+    for index, piece in enumerate(position.mailbox):
+        if piece is not None:
+            zobrist ^= PIECE_KEYS[piece][index]
+    return zobrist